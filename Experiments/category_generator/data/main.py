@@ -1,21 +1,23 @@
 import polars as pl
 import boto3
 import json
+import os
 import re
+import sys
 from botocore.exceptions import ClientError
 from boto3.dynamodb.types import TypeSerializer
-import time
 
-'''
-    NOTE:
-    the script might error if detects to many requests
-'''
+# The Bedrock throttling wrapper shared with the Level-1 classification lambda
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "cdk", "lambda", "llm_l1_classification", "src"))
+from throttling import ThrottledClient  # noqa: E402
 
 
 diseases_and_attributes = []
 
-# create a Bedrock Runtime client in us-west-2
-client = boto3.client("bedrock-runtime", region_name="us-west-2")
+# create a Bedrock Runtime client in us-west-2; calls are rate limited and retried with backoff when
+# throttled (BEDROCK_RATE_PER_SECOND, BEDROCK_MAX_ATTEMPTS), so a long run no longer dies on rate limits
+client = ThrottledClient.from_env("bedrock-runtime", "BEDROCK", region_name="us-west-2", operations=("invoke_model",),
+                                  rate=0.5, max_concurrency=1, max_attempts=8)
 model_id = "anthropic.claude-3-haiku-20240307-v1:0"
 
 # create DynamoDB client
@@ -31,13 +33,7 @@ df_csv = pl.scan_csv(CSV_DATA).filter((pl.col("Observation Title").is_not_null()
 obs_and_snomed = df_csv.select("Observation Title", "SNOMED (Code)", "Observation Code").collect()
 
 disease_dict = {}
-for index, obs in enumerate(obs_and_snomed.rows(named=True)):
-    # use this when re_downloading and if rate limits break the flow
-    # if index < 266: 
-    #     continue
-    # if index % 4 == 0:
-    #     time.sleep(3)
-
+for obs in obs_and_snomed.rows(named=True):
     # clean the data
     obs["SNOMED (Code)"] = re.sub(r"\d+", "", obs["SNOMED (Code)"]) # remove numbers
     obs["SNOMED (Code)"] = (re.sub(r"(\s{2,}|\n|n/a)", " ", obs["SNOMED (Code)"])).strip() # replace new lines, multple spaces, n/a with a single space and then remove leading/trailing spaces
@@ -89,6 +85,7 @@ for index, obs in enumerate(obs_and_snomed.rows(named=True)):
         response = client.invoke_model(modelId=model_id, body=request)
     except (ClientError, Exception) as e:
         print(f"Error: Unable to invoke '{model_id}. Reason: {e}'")
+        client.log_metrics("bedrock_throttling")
         exit(1)
     # extract text from the request
     model_response = json.loads(response["body"].read())
@@ -121,3 +118,5 @@ for index, obs in enumerate(obs_and_snomed.rows(named=True)):
             )
         except Exception as e:
             print(f"Error storing item for csdi_code: {obs["Observation Code"]}. Error {str(e)}")
+
+client.log_metrics("bedrock_throttling")
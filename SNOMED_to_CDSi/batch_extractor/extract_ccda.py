@@ -0,0 +1,146 @@
+# Offline batch extractor: local CCDA files -> Parquet of coded entries
+#
+# Runs the same parser and selection rules as the lambdas (ccda_parser.py in the
+# SNOMED_to_CDSi lambda package) over a directory tree or a file list, on a pool
+# of worker processes. Each row is one coded problem, procedure or medication:
+#
+#   doc_id, section, code, code_system, description, start, stop,
+#   direct_match  (used by xml_to_snomed_set for direct CDSi mapping)
+#   current       (kept by get_patient_meds: no stop date)
+#
+# Output is a directory of Parquet parts, readable with pl.scan_parquet("<output>/*.parquet").
+# .xml.gz and .xml.zst files are decompressed as they are parsed.
+#
+#   python3 extract_ccda.py ~/synthea/output/ccda --output ccda_entries
+#   python3 extract_ccda.py --file-list files.txt --output ccda_entries --workers 16
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+import polars as pl
+
+LAMBDA_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cdk", "lambda", "SNOMED_to_CDSi", "src")
+sys.path.insert(0, LAMBDA_SRC)
+
+from ccda_parser import SECTION_KINDS, current_timestamp, direct_mapping_entries, parse_ccda  # noqa: E402
+from s3_streams import open_body, strip_compression_suffix  # noqa: E402
+
+CCDA_SUFFIXES = (".xml", ".xml.gz", ".xml.gzip", ".xml.zst", ".xml.zstd")
+SCHEMA = {
+    "doc_id": pl.Utf8,
+    "section": pl.Utf8,
+    "code": pl.Utf8,
+    "code_system": pl.Utf8,
+    "description": pl.Utf8,
+    "start": pl.Utf8,
+    "stop": pl.Utf8,
+    "direct_match": pl.Boolean,
+    "current": pl.Boolean,
+}
+
+def iter_ccda_files(paths: List[str]) -> Iterator[str]:
+    """Yields CCDA files from files and (recursively) directories, in a stable order."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(CCDA_SUFFIXES):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def doc_id(path: str) -> str:
+    name = strip_compression_suffix(os.path.basename(path))
+    return name[:-4] if name.lower().endswith(".xml") else name
+
+def extract_file(args: Tuple[str, str]) -> Tuple[str, List[Tuple], str]:
+    """Worker: parses one file and returns (path, rows, error message)."""
+    path, now = args
+    try:
+        with open_body({"Body": open(path, "rb")}, path) as stream:
+            document = parse_ccda(stream, SECTION_KINDS)
+    except Exception as e:
+        return path, [], str(e)
+
+    direct = {id(entry) for entry in direct_mapping_entries(document, now)}
+    identifier = doc_id(path)
+    rows = []
+    for kind in SECTION_KINDS:
+        for entry in getattr(document, kind):
+            rows.append((identifier, entry.section, entry.code, entry.code_system, entry.display_name,
+                         entry.start, entry.stop, id(entry) in direct, entry.is_current))
+    return path, rows, ""
+
+def write_part(output: str, part: int, rows: List[Tuple]) -> str:
+    frame = pl.DataFrame(rows, schema=SCHEMA, orient="row").with_columns(
+        pl.col("start").str.strptime(pl.Datetime, "%Y%m%d%H%M%S", strict=False),
+        pl.col("stop").str.strptime(pl.Datetime, "%Y%m%d%H%M%S", strict=False),
+    )
+    path = os.path.join(output, f"part-{part:05d}.parquet")
+    frame.write_parquet(path, compression="zstd")
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract coded CCDA entries to Parquet")
+    parser.add_argument("paths", nargs="*", help="CCDA files or directories to walk")
+    parser.add_argument("--file-list", help="Text file with one CCDA path per line")
+    parser.add_argument("--output", required=True, help="Directory for the Parquet parts")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--docs-per-part", type=int, default=50000)
+    parser.add_argument("--chunksize", type=int, default=32, help="Files handed to a worker at a time")
+    args = parser.parse_args()
+
+    paths = list(args.paths)
+    if args.file_list:
+        with open(args.file_list) as f:
+            paths.extend(line.strip() for line in f if line.strip())
+    if not paths:
+        parser.error("Give at least one path or --file-list")
+    os.makedirs(args.output, exist_ok=True)
+
+    # Every worker judges "active" against the same instant
+    now = current_timestamp()
+    files = ((path, now) for path in iter_ccda_files(paths))
+
+    rows: List[Tuple] = []
+    docs_in_part = part = documents = entries = 0
+    failures: Dict[str, str] = {}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for path, doc_rows, error in pool.map(extract_file, files, chunksize=args.chunksize):
+            documents += 1
+            if error:
+                failures[path] = error
+                continue
+            rows.extend(doc_rows)
+            entries += len(doc_rows)
+            docs_in_part += 1
+
+            if docs_in_part >= args.docs_per_part:
+                write_part(args.output, part, rows)
+                rows, docs_in_part, part = [], 0, part + 1
+
+            if documents % 1000 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{documents} documents, {documents / elapsed:.0f} docs/sec")
+
+    if rows or part == 0:
+        write_part(args.output, part, rows)
+        part += 1
+
+    elapsed = time.perf_counter() - start
+    print(f"Extracted {entries} entries from {documents - len(failures)} documents into {part} part(s) "
+          f"in {elapsed:.1f}s: {documents / elapsed if elapsed else 0:.0f} docs/sec with {args.workers} workers")
+    if failures:
+        print(f"{len(failures)} documents failed:")
+        for path, error in list(failures.items())[:20]:
+            print(f"  {path}: {error}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# Build step: SNOMED RF2 is-a relationships -> ancestor closure of CDSi-mapped concepts
+#
+# For every SNOMED concept, precomputes which of its ancestors appear in the
+# CDSi Coded Observations sheet, so the direct-mapping lambda can match child
+# concepts (e.g. a specific subtype of diabetes) without walking the hierarchy.
+#
+#   python3 build_hierarchy.py sct2_Relationship_Snapshot_INT_<date>.txt "ScheduleSupportingData- Coded Observations-508.csv"
+
+import argparse
+import os
+import sys
+
+LAMBDA_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cdk", "lambda", "SNOMED_to_CDSi", "src")
+sys.path.insert(0, LAMBDA_SRC)
+
+from coded_observations import iter_snomed_mappings  # noqa: E402
+from snomed_hierarchy import (  # noqa: E402
+    SnomedHierarchyIndex,
+    mapped_ancestor_closure,
+    read_is_a_relationships,
+    write_hierarchy,
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the SNOMED is-a closure for CDSi-mapped concepts")
+    parser.add_argument("relationship_file", help="RF2 sct2_Relationship_Snapshot (or Full) file")
+    parser.add_argument("csv_file", help="CDSi Coded Observations CSV")
+    parser.add_argument("--output", default=os.path.join(LAMBDA_SRC, "snomed_hierarchy.idx"))
+    args = parser.parse_args()
+
+    mapped = {mapping["snomed_code"] for mapping in iter_snomed_mappings(args.csv_file)}
+    parents = read_is_a_relationships(args.relationship_file)
+    closure = mapped_ancestor_closure(parents, mapped)
+
+    concept_count = write_hierarchy(args.output, closure)
+    index = SnomedHierarchyIndex(args.output)
+    print(f"Read {sum(len(p) for p in parents.values())} active is-a edges for {len(parents)} concepts")
+    print(f"Wrote {args.output}: {concept_count} concepts with CDSi-mapped ancestors "
+          f"({len(mapped)} mapped codes), version {index.version}, {os.path.getsize(args.output)} bytes")
+
+if __name__ == "__main__":
+    main()
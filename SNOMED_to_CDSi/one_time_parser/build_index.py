@@ -0,0 +1,73 @@
+# Build step: CDSi "Coded Observations" CSV -> compiled SNOMED-to-CDSi index
+#
+# Writes the memory-mappable index read by the lambdas when SNOMED_CDSI_BACKEND=index,
+# and the mapped-code filter that lets both backends skip unmapped codes.
+# With --verify-table, also checks that the index and the DynamoDB table produce
+# identical cdsi_dict output for every mapped SNOMED code.
+#
+#   python3 build_index.py "ScheduleSupportingData- Coded Observations-508.csv"
+#   python3 build_index.py "ScheduleSupportingData- Coded Observations-508.csv" --verify-table snomed-to-cdsi
+
+import argparse
+import json
+import os
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cdk", "lambda")
+sys.path.insert(0, os.path.join(LAMBDA_DIR, "SNOMED_to_CDSi", "src"))
+
+from coded_observations import iter_snomed_mappings  # noqa: E402
+from snomed_index import SnomedCdsiIndex, write_index  # noqa: E402
+from snomed_key_filter import write_key_filter  # noqa: E402
+
+INDEX_FILE = "snomed_cdsi.idx"
+KEY_FILTER_FILE = "snomed_keys.bin"
+LAMBDA_PACKAGES = [
+    os.path.join(LAMBDA_DIR, "SNOMED_to_CDSi", "src"),
+    os.path.join(LAMBDA_DIR, "comprehend_code_inference", "src"),
+]
+DEFAULT_OUTPUTS = [os.path.join(package, INDEX_FILE) for package in LAMBDA_PACKAGES]
+
+def verify_against_table(index_path, table_name):
+    """Compares snomed_set_with_cdsi_codes output from both backends."""
+    os.environ["SNOMED_CDSI_INDEX_PATH"] = index_path
+    import snomed_to_cdsi_logic as logic
+
+    # Every mapped code, plus a few that must come back empty from both
+    snomed_codes = set(SnomedCdsiIndex(index_path).keys()) | {1, 2, 3}
+    logic.get_mapping_table = lambda: table_name
+
+    results = {}
+    for backend in ("index", "dynamodb"):
+        logic.LOOKUP_BACKEND = backend
+        results[backend] = json.dumps(logic.snomed_set_with_cdsi_codes(snomed_codes), sort_keys=True)
+
+    if results["index"] != results["dynamodb"]:
+        print("MISMATCH: index and DynamoDB backends return different cdsi_dict output")
+        sys.exit(1)
+    print(f"OK: identical cdsi_dict output for {len(snomed_codes)} SNOMED codes")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the SNOMED-to-CDSi lookup index")
+    parser.add_argument("csv_file", help="CDSi Coded Observations CSV")
+    parser.add_argument("--output", action="append", help="Index path (repeatable). Defaults to both lambda packages.")
+    parser.add_argument("--verify-table", help="DynamoDB table to check parity against after building")
+    args = parser.parse_args()
+
+    mappings = list(iter_snomed_mappings(args.csv_file))
+    outputs = args.output or DEFAULT_OUTPUTS
+    for path in outputs:
+        key_count = write_index(path, mappings)
+        index = SnomedCdsiIndex(path)
+        print(f"Wrote {path}: {key_count} SNOMED codes, {len(mappings)} rows, version {index.version}, {os.path.getsize(path)} bytes")
+
+        # The key filter sits next to each index and is used by both backends
+        filter_path = os.path.join(os.path.dirname(os.path.abspath(path)), KEY_FILTER_FILE)
+        write_key_filter(filter_path, (mapping["snomed_code"] for mapping in mappings))
+        print(f"Wrote {filter_path}: {key_count} mapped SNOMED codes")
+
+    if args.verify_table:
+        verify_against_table(outputs[0], args.verify_table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+# Shared reader for the CDSi "Coded Observations" CSV
+# Used by both the DynamoDB loader (main.py) and the binary index builder (build_index.py)
+
+import polars as pl
+import re
+
+# Regex to capture description and SNOMED code
+SNOMED_PATTERN = re.compile(r'([^\(]+)\s\((\d+)\)')  # Capture description before the parentheses
+
+def iter_snomed_mappings(csv_file):
+    """Yields one SNOMED -> CDSi row per observation that carries a SNOMED code."""
+    df = (pl.scan_csv(csv_file)).filter((pl.col("Observation Title").is_not_null()) & (pl.col("SNOMED (Code)")).is_not_null())
+    df = df.collect()
+
+    for obs in df.rows(named=True):
+        snomed_match = SNOMED_PATTERN.search(obs["SNOMED (Code)"])  # Search for the pattern
+        if snomed_match:
+            try:
+                cdsi_code = int(obs["Observation Code"])
+            except (TypeError, ValueError):
+                print(f"Skipping non-numeric Observation Code {obs['Observation Code']!r}")
+                continue
+
+            yield {
+                "snomed_code": int(snomed_match.group(2)),  # Extract the SNOMED code
+                "cdsi_code": cdsi_code,
+                "snomed_description": snomed_match.group(1).strip(),  # Extract the description
+                "observation_title": obs["Observation Title"],
+            }
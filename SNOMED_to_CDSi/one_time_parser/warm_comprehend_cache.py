@@ -0,0 +1,94 @@
+# Warm-up: preload the Comprehend Medical result cache from a corpus
+#
+# Collects the problem lines the condition lambda would send for every CCDA in
+# the corpus (the free-text problems from the same split_problems step), plus every line of any
+# .txt file given, and runs InferSNOMEDCT once for each line the cache hasn't
+# seen. Writes to the DynamoDB cache table deployed by the SNOMED_to_CDSi stack,
+# or to a local SQLite file.
+#
+#   python3 warm_comprehend_cache.py ~/synthea/output/ccda --table comprehend-snomedct-cache
+#   python3 warm_comprehend_cache.py problems.txt --sqlite comprehend_cache.sqlite3 --dry-run
+
+import argparse
+import os
+import sys
+from collections import Counter
+
+LAMBDA_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cdk", "lambda", "comprehend_code_inference", "src")
+sys.path.insert(0, LAMBDA_SRC)
+
+import boto3  # noqa: E402
+from comprehend_cache import (  # noqa: E402
+    ComprehendResultCache,
+    DynamoDBResultStore,
+    SQLiteResultStore,
+    infer_snomedct_cached,
+    line_key,
+    normalize_line,
+)
+from ccda_parser import parse_ccda  # noqa: E402
+from extract_med import split_problems  # noqa: E402
+from s3_streams import open_body  # noqa: E402
+from throttling import ThrottledClient  # noqa: E402
+
+CCDA_SUFFIXES = (".xml", ".xml.gz", ".xml.zst")
+
+def iter_corpus_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(CCDA_SUFFIXES + (".txt",)):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def iter_problem_lines(paths):
+    for path in iter_corpus_files(paths):
+        if path.lower().endswith(".txt"):
+            with open(path, encoding="utf-8") as f:
+                yield from (line for line in f if line.strip())
+            continue
+        try:
+            with open_body({"Body": open(path, "rb")}, path) as stream:
+                yield from split_problems(parse_ccda(stream, ("problems",)))[1]
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Preload the Comprehend Medical result cache")
+    parser.add_argument("paths", nargs="+", help="CCDA files, .txt files of problem lines, or directories")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--table", help="DynamoDB cache table")
+    target.add_argument("--sqlite", help="Local SQLite cache file")
+    parser.add_argument("--batch-lines", type=int, default=2000, help="Unique lines per InferSNOMEDCT round")
+    parser.add_argument("--dry-run", action="store_true", help="Only count lines and cache misses")
+    args = parser.parse_args()
+
+    counts = Counter(normalize_line(line) for line in iter_problem_lines(args.paths))
+    counts.pop("", None)
+    lines = [line for line, _ in counts.most_common()]
+    print(f"{sum(counts.values())} problem lines, {len(lines)} distinct")
+
+    store = DynamoDBResultStore(boto3.client("dynamodb"), args.table) if args.table else SQLiteResultStore(args.sqlite)
+    cache = ComprehendResultCache(store, max_entries=args.batch_lines)
+    cached = store.get_many(list(dict.fromkeys(line_key(line) for line in lines)))
+    missing = [line for line in lines if line_key(line) not in cached]
+    print(f"{len(lines) - len(missing)} already cached, {len(missing)} to infer")
+    if args.dry_run or not missing:
+        return
+
+    # Long runs hit the InferSNOMEDCT quota: calls are rate limited, backed off and retried (COMPREHEND_* settings)
+    client = ThrottledClient.from_env("comprehendmedical", "COMPREHEND", operations=("infer_snomedct",))
+    for i in range(0, len(missing), args.batch_lines):
+        infer_snomedct_cached(client, missing[i:i + args.batch_lines], cache)
+        # The cache only logs failed writes; a warm-up that can't write should not keep paying for inference
+        if cache.stats["store_errors"]:
+            client.log_metrics("comprehend_throttling")
+            sys.exit(f"Could not write to the cache after {i}/{len(missing)} lines, see the comprehend_cache_error line above")
+        print(f"Inferred {min(i + args.batch_lines, len(missing))}/{len(missing)} lines")
+    client.log_metrics("comprehend_throttling")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: whole-document ElementTree parsing with regex over the narrative
+tables vs. the streaming coded-entry parser, on synthetic CCDAs from 1 to 50 MB.
+
+Reports wall time and peak Python heap (tracemalloc) for the direct-mapping
+extraction (`xml_to_snomed_set`). Documents are fed as binary streams, the way
+the lambdas receive S3 bodies.
+
+    python3 benchmarks/ccda_parsing_benchmark.py --sizes-mb 1 10 50
+"""
+import argparse
+import io
+import os
+import re
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "SNOMED_to_CDSi", "src"))
+
+from synthetic_ccda import make_ccda  # noqa: E402
+from hl7_lambda_function import xml_to_snomed_set  # noqa: E402
+
+def baseline_xml_to_snomed_set(body):
+    """The previous implementation: read everything, fromstring, strip every tag, findall."""
+    root = ET.fromstring(body.read().decode("utf-8"))
+    for elem in root.iter():
+        if "}" in elem.tag:
+            elem.tag = elem.tag.split("}", 1)[1]
+    codes = set()
+    date_pattern = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z")
+    for template_id, check_end_date in (("2.16.840.1.113883.10.20.22.2.5.1", True),
+                                         ("2.16.840.1.113883.10.20.22.2.7.1", False)):
+        for section in root.findall(".//section"):
+            tid = section.find("./templateId")
+            if tid is not None and tid.attrib.get("root") == template_id:
+                for tr in section.findall(".//tr"):
+                    text = "".join(tr.itertext()).strip()
+                    dates = date_pattern.findall(text)
+                    if check_end_date and len(dates) > 1 and datetime.strptime(dates[1], "%Y-%m-%dT%H:%M:%SZ") <= datetime.now():
+                        continue
+                    match = re.search(r"\d+$", text)
+                    if match:
+                        codes.add(match.group(0))
+                break
+    return codes
+
+class CountingStream(io.BytesIO):
+    """Tracks how many bytes the parser actually pulled from the body."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+def measure(extract, document):
+    stream = CountingStream(document)
+    tracemalloc.start()
+    start = time.perf_counter()
+    codes = extract(stream)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return codes, elapsed_ms, peak / 2**20, stream.bytes_read / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 5, 10, 25, 50])
+    args = parser.parse_args()
+
+    print(f"{'doc MB':>7} | {'baseline ms':>11} {'peak MB':>8} | {'stream ms':>9} {'peak MB':>8} {'read MB':>8}")
+    for size_mb in args.sizes_mb:
+        document = make_ccda(int(size_mb * 2**20), seed=int(size_mb))
+        base_codes, base_ms, base_peak, _ = measure(baseline_xml_to_snomed_set, document)
+        codes, ms, peak, read_mb = measure(xml_to_snomed_set, document)
+        assert codes == base_codes, "coded-entry parser disagrees with the table baseline"
+        print(f"{len(document) / 2**20:>7.1f} | {base_ms:>11.1f} {base_peak:>8.1f} | {ms:>9.1f} {peak:>8.2f} {read_mb:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Offline evaluation: how much of the CDSi reference BM25 retrieval removes
+from the Bedrock prompt, and how many of the right rows it keeps.
+
+Runs the LLM lambda's own CONDITIONS extraction and filtering on the
+example EHRs in Experiments/Medical_BERT_Comparisons, then compares the
+reference block built from the full table with the retrieved one for each
+top-k. Tokens are estimated as characters / 4.
+
+Recall is measured against the rows a correct answer needs. By default
+these are the rows whose SNOMED column has a description equal to a
+condition's name (ignoring case and the semantic tag); `--gold` takes a
+JSON file of {"<condition name>": ["<Observation Code>", ...]} instead,
+for matches that need clinical judgment.
+
+    python3 benchmarks/cdsi_retrieval_evaluation.py --cdsi-csv CDSi.csv --top-k 3 5 10
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+
+EXPERIMENTS = os.path.join(os.path.dirname(__file__), "..", "Experiments", "Medical_BERT_Comparisons")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "llm_l1_classification", "src"))
+
+# Configuration the lambda looks up on first use; nothing here touches AWS
+for name in ("BUCKET_NAME", "MODEL_ID", "STATIC_CDSi_KEY"):
+    os.environ.setdefault("SSM_" + name, "/config/" + name)
+    os.environ.setdefault("CONFIG_" + name, "offline")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+from lambda_function import CdsiReference, extract_conditions_section, filter_disorder_conditions  # noqa: E402
+from cdsi_retrieval import CdsiRetriever  # noqa: E402
+
+SEMANTIC_TAG = re.compile(r"\s*\([^()]*\)\s*$")
+SNOMED_ENTRY = re.compile(r"(.+?)\s*\((\d+)\)\s*$")
+
+def condition_name(line):
+    return SEMANTIC_TAG.sub("", line.split(":", 1)[-1]).strip().casefold()
+
+def estimate_tokens(text):
+    return len(text) // 4
+
+def load_conditions():
+    """{EHR name: filtered condition lines}, exactly as the lambda would send them."""
+    with open(os.path.join(EXPERIMENTS, "example_ehr.txt"), encoding="utf-8") as f:
+        ehr = filter_disorder_conditions(extract_conditions_section(f.read()))
+    with open(os.path.join(EXPERIMENTS, "conditions.txt"), encoding="utf-8") as f:
+        # A bare CONDITIONS section without the header
+        listed = filter_disorder_conditions(f.read())
+    return {name: [line for line in text.split("\n") if line.strip()]
+            for name, text in (("example_ehr.txt", ehr), ("conditions.txt", listed))}
+
+def default_gold(headers, rows):
+    """{condition name: {row indexes}} from the descriptions in the SNOMED column."""
+    snomed_column = next(i for i, header in enumerate(headers) if header.startswith("SNOMED"))
+    gold = {}
+    for i, row in enumerate(rows):
+        for entry in row[snomed_column].split(";"):
+            match = SNOMED_ENTRY.match(entry.strip())
+            if not match:
+                continue
+            description = match.group(1)
+            gold.setdefault(SEMANTIC_TAG.sub("", description).strip().casefold(), set()).add(i)
+    return gold
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cdsi-csv", required=True, help="The CDSi.csv uploaded to STATIC_CDSi_KEY")
+    parser.add_argument("--gold", help="JSON {condition name: [Observation Code, ...]}")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[3, 5, 10])
+    args = parser.parse_args()
+
+    with open(args.cdsi_csv, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        headers = next(reader)
+        rows = list(reader)
+    reference = CdsiReference(headers, rows, etag="", version_id="offline")
+    retriever = CdsiRetriever(headers, rows)
+
+    if args.gold:
+        code_column = headers.index("Observation Code")
+        with open(args.gold, encoding="utf-8") as f:
+            codes = {name.casefold(): set(values) for name, values in json.load(f).items()}
+        gold = {name: {i for i, row in enumerate(rows) if row[code_column] in wanted} for name, wanted in codes.items()}
+    else:
+        gold = default_gold(headers, rows)
+
+    full_tokens = estimate_tokens(reference.prompt_text)
+    print(f"CDSi table: {len(rows)} rows, ~{full_tokens} tokens")
+    print(f"{'EHR':<16} {'lines':>5} {'top-k':>5} {'rows':>5} {'tokens':>7} {'reduction':>9} {'recall':>9}")
+    for ehr, lines in load_conditions().items():
+        needed = set().union(*(gold.get(condition_name(line), set()) for line in lines))
+        for k in args.top_k:
+            selected = retriever.select(lines, k=k)
+            tokens = estimate_tokens(reference.render([rows[i] for i in selected])) if selected else full_tokens
+            found = len(needed & set(selected)) if selected else len(needed)
+            recall = f"{found}/{len(needed)}" if needed else "n/a"
+            print(f"{ehr:<16} {len(lines):>5} {k:>5} {len(selected):>5} {tokens:>7} "
+                  f"{1 - tokens / full_tokens:>9.0%} {recall:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Profile: what each lambda handler does at import, i.e. during the cold start.
+
+Imports every handler module in a fresh interpreter under `-X importtime`,
+with the SSM parameters overridden through CONFIG_* and no AWS credentials,
+and reports:
+  - init ms:      wall time of `import <handler module>`
+  - clients:      botocore clients created during the import
+  - API calls:    AWS requests made during the import (should be none)
+  - top imports:  the slowest top-level imports by cumulative time
+`--max-init-ms` makes the run fail when a handler's import takes longer,
+or when any handler creates a client or calls AWS at import.
+
+    python3 benchmarks/cold_start_profile.py --top 5 --max-init-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+LAMBDA_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cdk", "lambda")
+
+# Handler module -> lambda source directory, as in cdk/stacks
+HANDLERS = {
+    "hl7_lambda_function": "SNOMED_to_CDSi",
+    "snomed_to_cdsi_lambda": "SNOMED_to_CDSi",
+    "condition_comprehend_lambda": "comprehend_code_inference",
+    "lambda_function": "llm_l1_classification",
+}
+
+# Run in the child: count client creation and API calls made while the handler module is imported
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import botocore.client, botocore.session
+counts = {"clients": [], "api_calls": []}
+create_client, make_api_call = botocore.session.Session.create_client, botocore.client.BaseClient._make_api_call
+def counted_create_client(self, service_name, *args, **kwargs):
+    counts["clients"].append(service_name)
+    return create_client(self, service_name, *args, **kwargs)
+def counted_api_call(self, operation_name, api_params):
+    counts["api_calls"].append(self.meta.service_model.service_name + "." + operation_name)
+    return make_api_call(self, operation_name, api_params)
+botocore.session.Session.create_client = counted_create_client
+botocore.client.BaseClient._make_api_call = counted_api_call
+sys.path.insert(0, sys.argv[1])
+__import__(sys.argv[2])
+counts["init_ms"] = (time.perf_counter() - start) * 1000
+print(json.dumps(counts))
+"""
+
+def child_environment():
+    env = {name: value for name, value in os.environ.items()
+           if not name.startswith(("AWS_ACCESS_KEY", "AWS_SECRET", "AWS_SESSION", "AWS_PROFILE"))}
+    env.update({
+        "AWS_DEFAULT_REGION": "us-west-2",
+        # No credentials: an import-time AWS call fails fast instead of reaching an account or IMDS
+        "AWS_EC2_METADATA_DISABLED": "true",
+        "AWS_SHARED_CREDENTIALS_FILE": os.devnull,
+        "AWS_CONFIG_FILE": os.devnull,
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    # The LLM lambda names its parameters through SSM_*; every parameter is overridden through CONFIG_*
+    for name in ("BUCKET_NAME", "MODEL_ID", "STATIC_CDSi_KEY"):
+        env["SSM_" + name] = "/config/" + name
+        env["CONFIG_" + name] = "offline"
+    return env
+
+def parse_importtime(stderr):
+    """(cumulative us, module) for every top-level `-X importtime` line; nested imports are indented."""
+    imports = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit() and not module[1:].startswith(" "):
+                imports.append((int(cumulative), module.strip()))
+    return imports
+
+def profile(module, source_dir):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, source_dir, module],
+                            capture_output=True, text=True, env=child_environment())
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr.splitlines()[-1]}")
+    counts = json.loads(result.stdout.strip().splitlines()[-1])
+    counts["imports"] = parse_importtime(result.stderr)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to list per handler")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per handler; the median is reported")
+    parser.add_argument("--max-init-ms", type=float, help="Fail when a handler's import takes longer than this")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'handler':<28} {'init ms':>8} {'clients':>8} {'API calls':>10}")
+    for module, directory in HANDLERS.items():
+        runs = sorted((profile(module, os.path.join(LAMBDA_ROOT, directory, "src")) for _ in range(args.repeat)),
+                      key=lambda run: run["init_ms"])
+        run = runs[len(runs) // 2]
+        print(f"{module:<28} {run['init_ms']:>8.1f} {len(run['clients']):>8} {len(run['api_calls']):>10}")
+        for cumulative, name in sorted(run["imports"], reverse=True)[:args.top]:
+            print(f"    {cumulative / 1000:>8.1f} ms  {name}")
+
+        if run["clients"] or run["api_calls"]:
+            failures.append(f"{module} creates {run['clients']} and calls {run['api_calls']} at import")
+        if args.max_init_ms is not None and run["init_ms"] > args.max_init_ms:
+            failures.append(f"{module} takes {run['init_ms']:.0f} ms to import (limit {args.max_init_ms:.0f} ms)")
+
+    if args.max_init_ms is not None and failures:
+        sys.exit("\n".join(failures))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark: per-document synchronous InferSNOMEDCT vs. one asynchronous
+SNOMED CT inference job for a whole panel.
+
+Uses the local file-based job client (`LocalSnomedctJobClient`) around the
+Comprehend Medical stand-in from comprehend_chunking_benchmark.py. Checks
+that every patient's entities, joined back from the job output, match the
+synchronous path, and reports the synchronous requests that the job
+replaces. Some patients get problem lists over the request limit, which
+the job spreads across several input files.
+
+    python3 benchmarks/comprehend_batch_job_benchmark.py --patients 500
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "comprehend_code_inference", "src"))
+
+from comprehend_chunking_benchmark import LocalComprehendMedical, problem_list  # noqa: E402
+from comprehend_chunks import infer_snomedct_chunked  # noqa: E402
+from comprehend_jobs import LocalSnomedctJobClient, run_job  # noqa: E402
+
+def codes(entities):
+    return sorted({concept["Code"] for entity in entities for concept in entity["SNOMEDCTConcepts"]})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    patients = {f"patient-{i}": problem_list(rng.choice([5, 10, 20, 400]), seed=i) for i in range(args.patients)}
+
+    sync_client = LocalComprehendMedical(args.latency_ms / 1000)
+    start = time.perf_counter()
+    sync_results = {patient_id: infer_snomedct_chunked(sync_client, lines) for patient_id, lines in patients.items()}
+    sync_seconds = time.perf_counter() - start
+
+    job_engine = LocalComprehendMedical(0, 0)  # the job itself is not what is timed here
+    with tempfile.TemporaryDirectory() as directory:
+        job_client = LocalSnomedctJobClient(directory, lambda text: job_engine.infer_snomedct(Text=text), polls_until_complete=2)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            job_results = run_job(job_client, patients, map_to_cdsi=lambda _, entities: codes(entities), poll_seconds=0)
+        job_seconds = time.perf_counter() - start
+
+    for patient_id, expected in sync_results.items():
+        result = job_results[patient_id]
+        assert result["snomed_results"] == expected["Entities"], patient_id
+        assert result["cdsi_results"] == codes(expected["Entities"])
+
+    print(f"{args.patients} patients, {sum(len(lines) for lines in patients.values())} problem lines")
+    print(f"synchronous: {sync_client.calls} InferSNOMEDCT requests, {sync_seconds:.1f}s at {args.latency_ms:.0f} ms each")
+    print(f"batch job:   1 job over {job_engine.calls} input files, joined back in {job_seconds:.1f}s "
+          f"(local stand-in; a real job queues and runs asynchronously)")
+    print("entities and CDSi inputs identical for every patient")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: InferSNOMEDCT with and without the per-line result cache.
+
+Simulates a stream of patients whose problem lists draw from a shared,
+skewed vocabulary (a few conditions appear in nearly every record), against
+the local Comprehend Medical stand-in from comprehend_chunking_benchmark.py.
+Reports requests, characters sent (what Comprehend bills for), wall time and
+the cache hit rate, and checks that cached results match uncached ones.
+
+    python3 benchmarks/comprehend_cache_benchmark.py --patients 200 --sqlite /tmp/comprehend_cache.sqlite3
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "comprehend_code_inference", "src"))
+
+from comprehend_chunking_benchmark import CONDITIONS, LocalComprehendMedical  # noqa: E402
+from comprehend_cache import ComprehendResultCache, SQLiteResultStore, infer_snomedct_cached  # noqa: E402
+from comprehend_chunks import infer_snomedct_chunked  # noqa: E402
+
+class MeteredComprehendMedical(LocalComprehendMedical):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.characters = 0
+
+    def infer_snomedct(self, Text):
+        self.characters += len(Text)
+        return super().infer_snomedct(Text)
+
+def patient_problems(rng, vocabulary):
+    # Zipf-like: the first conditions in the vocabulary dominate
+    count = rng.randint(3, 12)
+    return [vocabulary[min(int(rng.paretovariate(1.2)) - 1, len(vocabulary) - 1)] for _ in range(count)]
+
+def strip_ids(entities):
+    return [{k: v for k, v in entity.items() if k not in ("Id", "Attributes")} for entity in entities]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--sqlite", help="Also run with a SQLite persistent tier at this path")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = [f"{name} ({kind})" for name in CONDITIONS for kind in ("disorder", "finding")]
+    vocabulary += [f"Rare condition {i} with {name}" for i, name in enumerate(CONDITIONS)]
+    patients = [patient_problems(rng, vocabulary) for _ in range(args.patients)]
+
+    runs = [("uncached", None), ("memory LRU", lambda: ComprehendResultCache())]
+    if args.sqlite:
+        if os.path.exists(args.sqlite):
+            os.remove(args.sqlite)
+        runs.append(("sqlite, cold", lambda: ComprehendResultCache(SQLiteResultStore(args.sqlite))))
+        # A new container: empty memory tier, warm persistent tier
+        runs.append(("sqlite, warm", lambda: ComprehendResultCache(SQLiteResultStore(args.sqlite))))
+
+    print(f"{args.patients} patients, {sum(len(p) for p in patients)} problem lines")
+    print(f"{'run':>14} | {'requests':>8} {'chars sent':>10} {'seconds':>8} {'hit rate':>8}")
+    baseline = None
+    for label, make_cache in runs:
+        client = MeteredComprehendMedical(args.latency_ms / 1000)
+        cache = make_cache() if make_cache else None
+        outputs = []
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for problems in patients:
+                if cache is None:
+                    outputs.append(infer_snomedct_chunked(client, problems))
+                else:
+                    outputs.append(infer_snomedct_cached(client, problems, cache))
+        elapsed = time.perf_counter() - start
+
+        if baseline is None:
+            baseline = outputs
+        else:
+            # Same entities at the same offsets; relationships across lines are dropped by design
+            for expected, actual in zip(baseline, outputs):
+                assert expected["Text"] == actual["Text"]
+                assert strip_ids(expected["Entities"]) == strip_ids(actual["Entities"])
+        hit_rate = f"{cache.hit_rate():.1%}" if cache else "-"
+        print(f"{label:>14} | {client.calls:>8} {client.characters:>10} {elapsed:>8.2f} {hit_rate:>8}")
+
+if __name__ == "__main__":
+    main()
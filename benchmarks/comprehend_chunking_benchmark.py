@@ -0,0 +1,125 @@
+"""
+Benchmark: chunked, concurrent InferSNOMEDCT over long problem lists.
+
+Runs `infer_snomedct_chunked` against a local Comprehend Medical stand-in that
+enforces the 10,000 character request limit, answers with entities for the
+known condition names it finds, and sleeps a fixed per-request latency plus a
+per-character cost. Checks that every remapped BeginOffset/EndOffset slices the
+entity text out of the original problem list, that Ids are unique, and that
+the concurrent run matches a serial one. The old single call is shown for
+reference; it fails once the list passes the limit.
+
+    python3 benchmarks/comprehend_chunking_benchmark.py --problems 100 1000 5000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "comprehend_code_inference", "src"))
+
+from comprehend_chunks import MAX_TEXT_CHARACTERS, infer_snomedct_chunked  # noqa: E402
+
+CONDITIONS = {
+    "Prediabetes": "714628002",
+    "Essential hypertension": "59621000",
+    "Diabetes mellitus type 2": "44054006",
+    "Asthma": "195967001",
+    "Body mass index 30+ - obesity": "162864005",
+    "Chronic kidney disease stage 3": "433144002",
+    "Viral sinusitis": "444814009",
+    "Anemia": "271737000",
+}
+CONDITION_PATTERN = re.compile("|".join(re.escape(name) for name in sorted(CONDITIONS, key=len, reverse=True)))
+
+class TextSizeLimitExceededException(Exception):
+    pass
+
+class LocalComprehendMedical:
+    """Stands in for the comprehendmedical client's infer_snomedct."""
+
+    def __init__(self, latency_seconds=0.25, seconds_per_kchar=0.02):
+        self.latency_seconds = latency_seconds
+        self.seconds_per_kchar = seconds_per_kchar
+        self.calls = 0
+
+    def infer_snomedct(self, Text):
+        self.calls += 1
+        if len(Text) > MAX_TEXT_CHARACTERS:
+            raise TextSizeLimitExceededException(f"Text is {len(Text)} characters; the limit is {MAX_TEXT_CHARACTERS}")
+        time.sleep(self.latency_seconds + self.seconds_per_kchar * len(Text) / 1000)
+
+        entities = []
+        for match in CONDITION_PATTERN.finditer(Text):
+            entity_id = len(entities)
+            entities.append({
+                "Id": entity_id,
+                "BeginOffset": match.start(),
+                "EndOffset": match.end(),
+                "Text": match.group(0),
+                "Category": "MEDICAL_CONDITION",
+                "Type": "DX_NAME",
+                "Score": 0.95,
+                "Traits": [],
+                "Attributes": [],
+                "SNOMEDCTConcepts": [{"Code": CONDITIONS[match.group(0)], "Description": match.group(0), "Score": 0.9}],
+            })
+        # Link each entity to the next one, the way Comprehend reports related conditions
+        for entity, related in zip(entities, entities[1:]):
+            entity["Attributes"].append({
+                "Id": related["Id"], "BeginOffset": related["BeginOffset"], "EndOffset": related["EndOffset"],
+                "Text": related["Text"], "Type": "DX_NAME", "Score": 0.5, "RelationshipScore": 0.5,
+            })
+        return {"Entities": entities, "ModelVersion": "local", "SNOMEDCTDetails": {"Edition": "US", "Language": "en"}}
+
+def problem_list(count, seed=0):
+    rng = random.Random(seed)
+    return [f"{rng.choice(list(CONDITIONS))} (finding) noted at visit {i}" for i in range(count)]
+
+def check(lines, result):
+    text = "\n".join(lines)
+    assert result["Text"] == text
+    ids = set()
+    for entity in result["Entities"]:
+        assert text[entity["BeginOffset"]:entity["EndOffset"]] == entity["Text"], entity
+        for attribute in entity["Attributes"]:
+            assert text[attribute["BeginOffset"]:attribute["EndOffset"]] == attribute["Text"], attribute
+        assert entity["Id"] not in ids
+        ids.add(entity["Id"])
+    assert len(result["Entities"]) == len(lines), "every problem line should yield one entity"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--problems", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=250)
+    args = parser.parse_args()
+
+    print(f"{'problems':>8} {'chars':>8} {'chunks':>6} | {'single call':>14} | {'serial ms':>9} {'concurrent ms':>13} {'speedup':>7}")
+    for count in args.problems:
+        lines = problem_list(count, seed=count)
+        text = "\n".join(lines)
+
+        try:
+            LocalComprehendMedical(args.latency_ms / 1000).infer_snomedct(Text=text)
+            single = "ok"
+        except TextSizeLimitExceededException:
+            single = "too long"
+
+        timings = {}
+        results = {}
+        for label, workers in (("serial", 1), ("concurrent", args.workers)):
+            client = LocalComprehendMedical(args.latency_ms / 1000)
+            start = time.perf_counter()
+            results[label] = infer_snomedct_chunked(client, lines, max_workers=workers)
+            timings[label] = (time.perf_counter() - start) * 1000
+            check(lines, results[label])
+        assert results["serial"]["Entities"] == results["concurrent"]["Entities"]
+
+        print(f"{count:>8} {len(text):>8} {results['concurrent']['Chunks']:>6} | {single:>14} | "
+              f"{timings['serial']:>9.0f} {timings['concurrent']:>13.0f} {timings['serial'] / timings['concurrent']:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
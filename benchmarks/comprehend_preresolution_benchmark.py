@@ -0,0 +1,69 @@
+"""
+Benchmark: sending every current problem to InferSNOMEDCT vs. resolving
+SNOMED-coded problems directly and sending only free text.
+
+Synthetic CCDAs record a varying share of their problems as text only. Both
+paths run against the local Comprehend Medical stand-in from
+comprehend_chunking_benchmark.py. The benchmark reports requests, characters
+sent and wall time, and checks that every current problem reaches exactly
+one of the two paths.
+
+    python3 benchmarks/comprehend_preresolution_benchmark.py --documents 200
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "comprehend_code_inference", "src"))
+
+from comprehend_chunking_benchmark import LocalComprehendMedical  # noqa: E402
+from synthetic_ccda import make_ccda  # noqa: E402
+from ccda_parser import parse_ccda  # noqa: E402
+from comprehend_chunks import infer_snomedct_chunked  # noqa: E402
+from extract_med import current_descriptions, split_problems  # noqa: E402
+
+class MeteredComprehendMedical(LocalComprehendMedical):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.characters = 0
+
+    def infer_snomedct(self, Text):
+        self.characters += len(Text)
+        return super().infer_snomedct(Text)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--free-text-ratios", type=float, nargs="+", default=[0.0, 0.1, 0.3, 1.0])
+    parser.add_argument("--latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    print(f"{'free text':>9} | {'all to Comprehend':>28} | {'pre-resolved':>28} | {'coded':>6}")
+    print(f"{'':>9} | {'requests':>8} {'chars':>8} {'seconds':>10} | {'requests':>8} {'chars':>8} {'seconds':>10} | {'':>6}")
+    for ratio in args.free_text_ratios:
+        documents = [parse_ccda(make_ccda(40_000, seed=i, problem_count=8, free_text_ratio=ratio), ("problems",))
+                     for i in range(args.documents)]
+
+        before = MeteredComprehendMedical(args.latency_ms / 1000)
+        start = time.perf_counter()
+        for document in documents:
+            infer_snomedct_chunked(before, current_descriptions(document.problems))
+        before_seconds = time.perf_counter() - start
+
+        after = MeteredComprehendMedical(args.latency_ms / 1000)
+        coded_total = 0
+        start = time.perf_counter()
+        for document in documents:
+            coded, free_text = split_problems(document)
+            assert len(coded) + len(free_text) == len(current_descriptions(document.problems))
+            coded_total += len(coded)
+            infer_snomedct_chunked(after, free_text)
+        after_seconds = time.perf_counter() - start
+
+        print(f"{ratio:>9.0%} | {before.calls:>8} {before.characters:>8} {before_seconds:>10.2f} | "
+              f"{after.calls:>8} {after.characters:>8} {after_seconds:>10.2f} | {coded_total:>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: parsing CCDAs stored uncompressed vs. gzip vs. zstd.
+
+Each synthetic document is wrapped in a fake S3 get_object response and fed
+through `s3_streams.open_body` into `xml_to_snomed_set`, the same path the
+direct-mapping lambda takes. Reports wall time, throughput in document MB
+per second, bytes pulled from the "S3" body and peak Python heap. The parser
+stops after the last section it needs, so every encoding reads only part of
+the document. zstd is skipped when the zstandard package is missing.
+
+    python3 benchmarks/compressed_documents_benchmark.py --sizes-mb 1 10 50
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "SNOMED_to_CDSi", "src"))
+
+from synthetic_ccda import make_ccda  # noqa: E402
+from hl7_lambda_function import extract_snomed_codes  # noqa: E402
+from s3_streams import zstandard  # noqa: E402
+
+class CountingStream(io.BytesIO):
+    """Stands in for a StreamingBody and tracks how many bytes were downloaded."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+def encodings():
+    yield "none", ".xml", lambda data: data
+    yield "gzip", ".xml.gz", lambda data: gzip.compress(data, compresslevel=6)
+    if zstandard is not None:
+        yield "zstd", ".xml.zst", lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+
+def measure(payload, key, repeats):
+    best_ms, peak_mb, read_mb, codes = None, 0.0, 0.0, None
+    for _ in range(repeats):
+        body = CountingStream(payload)
+        response = {"Body": body, "ContentType": "application/xml" if key.endswith(".xml") else "binary/octet-stream"}
+        tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # the lambda logs the content type
+            codes = extract_snomed_codes(response, key)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        best_ms = elapsed_ms if best_ms is None else min(best_ms, elapsed_ms)
+        peak_mb = max(peak_mb, peak / 2**20)
+        read_mb = body.bytes_read / 2**20
+    return codes, best_ms, peak_mb, read_mb
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'doc MB':>7} {'encoding':>8} | {'stored MB':>9} {'fetched MB':>10} | {'ms':>8} {'doc MB/s':>8} {'peak MB':>8}")
+    for size_mb in args.sizes_mb:
+        document = make_ccda(int(size_mb * 2**20), seed=int(size_mb))
+        expected = None
+        for name, suffix, compress in encodings():
+            payload = compress(document)
+            codes, ms, peak_mb, read_mb = measure(payload, "patient" + suffix, args.repeats)
+            if expected is None:
+                expected = codes
+            assert codes == expected, f"{name} result differs from the uncompressed document"
+            print(f"{len(document) / 2**20:>7.1f} {name:>8} | {len(payload) / 2**20:>9.2f} {read_mb:>10.2f} | "
+                  f"{ms:>8.1f} {len(document) / 2**20 / (ms / 1000):>8.1f} {peak_mb:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark: finding a text EHR's active conditions by downloading the whole
+file vs. streaming it section by section.
+
+Builds Synthea-style text EHRs from the example in
+Experiments/Medical_BERT_Comparisons, padded with long MEDICATIONS and a
+trailing ENCOUNTERS/OBSERVATIONS history, and serves them from an in-memory
+S3 body that counts the bytes read. Compares:
+  - full read:  read().decode(), then extract_conditions_section and
+                filter_disorder_conditions on the string
+  - two passes: extract_conditions_section over the line stream, then
+                filter_disorder_conditions on the section text
+  - scanner:    scan_active_conditions over the line stream
+and checks that all three give the same conditions.
+
+    python3 benchmarks/ehr_section_scan_benchmark.py --history-mb 1 10 50
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from cdsi_retrieval_evaluation import EXPERIMENTS  # noqa: E402  (also sets up the lambda's import path)
+from lambda_function import extract_conditions_section, filter_disorder_conditions, scan_active_conditions  # noqa: E402
+from s3_streams import open_text  # noqa: E402
+
+RULE = "-" * 80
+
+class CountingBody(io.RawIOBase):
+    """An S3 StreamingBody stand-in that counts the bytes handed out."""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self._data.read(size)
+        self.bytes_read += len(data)
+        return data
+
+def synthetic_ehr(history_bytes, seed):
+    with open(os.path.join(EXPERIMENTS, "example_ehr.txt"), encoding="utf-8") as f:
+        example = f.read()
+    head, conditions = example.split("CONDITIONS:\n", 1)
+    rng = random.Random(seed)
+    parts = [head, "CONDITIONS:\n", conditions.rstrip("\n") + "\n", RULE + "\n"]
+    size = sum(len(part) for part in parts)
+    section = 0
+    while size < history_bytes:
+        name = ("ENCOUNTERS", "OBSERVATIONS", "PROCEDURES", "IMMUNIZATIONS")[section % 4]
+        lines = [f"{name}:\n"] + [
+            f"  {rng.randint(1950, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} : "
+            f"{name.title()} entry {i} with a finding (finding) and value {rng.random():.4f}\n"
+            for i in range(2000)
+        ] + [RULE + "\n"]
+        parts.extend(lines)
+        size += sum(len(line) for line in lines)
+        section += 1
+    return "".join(parts).encode("utf-8")
+
+def full_read(data):
+    body = CountingBody(data)
+    text = body.read().decode("utf-8")
+    return filter_disorder_conditions(extract_conditions_section(text)), body.bytes_read
+
+def two_passes(data):
+    body = CountingBody(data)
+    with open_text({"Body": body}, "patient.txt") as lines:
+        section = extract_conditions_section(lines)
+    return filter_disorder_conditions(section), body.bytes_read
+
+def scanner(data):
+    body = CountingBody(data)
+    with open_text({"Body": body}, "patient.txt") as lines:
+        conditions = scan_active_conditions(lines)
+    return conditions, body.bytes_read
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history-mb", type=float, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'file MB':>8} | {'method':<10} {'MB read':>8} {'ms':>8}")
+    for history_mb in args.history_mb:
+        data = synthetic_ehr(int(history_mb * 1024 * 1024), seed=int(history_mb))
+        expected = None
+        for name, method in (("full read", full_read), ("two passes", two_passes), ("scanner", scanner)):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                conditions, bytes_read = method(data)
+            milliseconds = (time.perf_counter() - start) / args.repeat * 1000
+            expected = expected if expected is not None else conditions
+            assert conditions == expected, name
+            print(f"{len(data) / 1e6:>8.1f} | {name:<10} {bytes_read / 1e6:>8.2f} {milliseconds:>8.2f}")
+
+if __name__ == "__main__":
+    main()
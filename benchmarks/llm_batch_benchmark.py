@@ -0,0 +1,135 @@
+"""
+Benchmark: classifying a patient panel with one synchronous Bedrock request
+per patient vs. one Bedrock batch inference job.
+
+Builds a synthetic panel from the condition lines of the example EHRs in
+Experiments/Medical_BERT_Comparisons, runs it through the Level-1 lambda's
+request building, and runs both paths against a local model stand-in: the
+synchronous path through `call_bedrock`, the batch path through
+`LocalBatchJobClient`. Checks that both give every patient the same CDSi
+codes, then estimates cost from the token counts (batch inference is billed
+at half the on-demand price) and throughput under the account's on-demand
+request quota. A real batch job queues before it runs; its turnaround is
+bounded by Bedrock's job timeout, not by the quota.
+
+    python3 benchmarks/llm_batch_benchmark.py --patients 1000 --cdsi-csv CDSi.csv
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+EXPERIMENTS = os.path.join(os.path.dirname(__file__), "..", "Experiments", "Medical_BERT_Comparisons")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "llm_l1_classification", "src"))
+
+# Configuration the lambda looks up on first use; nothing here touches AWS
+for name in ("BUCKET_NAME", "MODEL_ID", "STATIC_CDSi_KEY"):
+    os.environ.setdefault("SSM_" + name, "/config/" + name)
+    os.environ.setdefault("CONFIG_" + name, "offline")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+import aws_clients  # noqa: E402
+import lambda_function  # noqa: E402
+from lambda_function import CdsiReference, build_request, parse_cdsi_codes, select_cdsi_reference  # noqa: E402
+from llm_batch import LocalBatchJobClient, run_job  # noqa: E402
+
+def condition_lines():
+    lines = []
+    for name in ("example_ehr.txt", "conditions.txt"):
+        with open(os.path.join(EXPERIMENTS, name), encoding="utf-8") as f:
+            lines.extend(line.rstrip("\n") for line in f if "(disorder)" in line or "(finding)" in line)
+    return sorted(set(line for line in lines if ":" in line and line.lstrip()[:4].isdigit()))
+
+def synthetic_reference(lines):
+    """A CDSi-shaped table with one row per distinct condition, for runs without the real CSV."""
+    names = sorted({line.split(":", 1)[1].strip() for line in lines})
+    rows = [[f"{900 + i:03d}", name.rsplit(" (", 1)[0], f"{name} ({100000 + i})"] for i, name in enumerate(names)]
+    return ["Observation Code", "Observation Title", "SNOMED (Code)"], rows
+
+class LocalBedrock:
+    """Answers like the model would, naming the CDSi rows whose title appears in the conditions."""
+
+    def __init__(self, reference, latency_seconds):
+        self.reference = reference
+        self.latency_seconds = latency_seconds
+
+    def answer(self, request):
+        time.sleep(self.latency_seconds)
+        conditions = request["messages"][0]["content"][0]["text"].lower()
+        matches = [f"1. CDSi Code: {row[0]}\n2. Observation Title: {row[1]}\n" for row in self.reference.data
+                   if row[1].lower() in conditions]
+        text = "\n".join(matches) or "No confirmed matches."
+        prompt_chars = len(json.dumps(request["system"])) + len(conditions)
+        return {"content": [{"type": "text", "text": text}],
+                "usage": {"input_tokens": prompt_chars // 4, "output_tokens": len(text) // 4}}
+
+    def invoke_model(self, modelId, body, **kwargs):
+        return {"body": io.BytesIO(json.dumps(self.answer(json.loads(body))).encode("utf-8"))}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--cdsi-csv", help="The CDSi.csv uploaded to STATIC_CDSi_KEY (a synthetic table otherwise)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Local model latency per request")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent synchronous requests")
+    parser.add_argument("--requests-per-minute", type=float, default=50, help="On-demand InvokeModel quota")
+    parser.add_argument("--input-price", type=float, default=0.003, help="On-demand USD per 1k input tokens")
+    parser.add_argument("--output-price", type=float, default=0.015, help="On-demand USD per 1k output tokens")
+    args = parser.parse_args()
+
+    lines = condition_lines()
+    if args.cdsi_csv:
+        with open(args.cdsi_csv, encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            headers, rows = next(reader), list(reader)
+    else:
+        headers, rows = synthetic_reference(lines)
+    reference = CdsiReference(headers, rows, etag="", version_id="offline")
+
+    rng = random.Random(0)
+    panel = {}
+    for i in range(args.patients):
+        filtered_conditions = "\n".join(rng.sample(lines, rng.randint(1, min(12, len(lines)))))
+        panel[f"patient-{i}.txt"] = (filtered_conditions, select_cdsi_reference(reference, filtered_conditions)[0])
+
+    model = LocalBedrock(reference, args.latency_ms / 1000)
+    aws_clients.set_client("bedrock-runtime", model, region_name=lambda_function.BEDROCK_REGION)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(args.concurrency) as pool:
+        sync_outputs = dict(zip(panel, pool.map(lambda item: lambda_function.call_bedrock(*item), panel.values())))
+    sync_seconds = time.perf_counter() - start
+
+    batch_model = LocalBedrock(reference, 0)  # the job itself is not what is timed here
+    with tempfile.TemporaryDirectory() as directory:
+        job_client = LocalBatchJobClient(directory, batch_model.answer, polls_until_complete=2)
+        requests = {key: build_request(conditions, reference_text, cache=False) for key, (conditions, reference_text) in panel.items()}
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            batch_results = run_job(job_client, requests, poll_seconds=0, parse=lambda _, output: {
+                "cdsi_results": parse_cdsi_codes(output["content"][0]["text"], reference), "usage": output["usage"]})
+        batch_seconds = time.perf_counter() - start
+
+    for key, output in sync_outputs.items():
+        assert batch_results[key]["cdsi_results"] == parse_cdsi_codes(output["content"][0]["text"], reference), key
+
+    input_tokens = sum(result["usage"]["input_tokens"] for result in batch_results.values())
+    output_tokens = sum(result["usage"]["output_tokens"] for result in batch_results.values())
+    on_demand = input_tokens / 1000 * args.input_price + output_tokens / 1000 * args.output_price
+    quota_minutes = args.patients / args.requests_per_minute
+
+    print(f"{args.patients} patients, {len(rows)} CDSi rows, {input_tokens} input / {output_tokens} output tokens")
+    print(f"synchronous: ${on_demand:.2f} on demand; {sync_seconds:.1f}s locally at {args.latency_ms:.0f} ms x {args.concurrency} "
+          f"concurrent, but at least {quota_minutes:.0f} min under a {args.requests_per_minute:.0f} requests/min quota")
+    print(f"batch job:   ${on_demand / 2:.2f} (50% of on demand); 1 job, {batch_seconds:.1f}s to stage and join locally, "
+          f"no request quota")
+    print("CDSi codes identical for every patient")
+
+if __name__ == "__main__":
+    main()
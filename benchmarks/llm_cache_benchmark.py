@@ -0,0 +1,104 @@
+"""
+Benchmark: Level-1 classifications with and without the result cache.
+
+Simulates a stream of patients whose active conditions draw from a skewed
+vocabulary (many patients have the same one or two findings, with different
+onset dates), built from the example EHRs in Experiments/Medical_BERT_Comparisons.
+Runs them through the lambda's `classify` against the local model stand-in
+from llm_batch_benchmark.py and reports Bedrock requests, input tokens
+billed, the hit rate, and the latency of hits and misses. Checks that every
+hit returns the answer a fresh request would give.
+
+Structured answers are shared by patients with the same conditions; text
+answers quote the dated lines, so they are only reused for identical ones.
+
+    python3 benchmarks/llm_cache_benchmark.py --patients 500 --latency-ms 2000 --output structured
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from llm_batch_benchmark import LocalBedrock, condition_lines, synthetic_reference  # noqa: E402
+import aws_clients  # noqa: E402
+import lambda_function  # noqa: E402
+import llm_cache  # noqa: E402
+from lambda_function import CdsiReference, classify, select_cdsi_reference  # noqa: E402
+
+class MeteredBedrock(LocalBedrock):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+        self.input_tokens = 0
+
+    def answer(self, request):
+        self.calls += 1
+        response = super().answer(request)
+        if "tools" in request:
+            # Cite the numbered lines that name each matched row, as a structured answer would
+            prompt = request["messages"][0]["content"][0]["text"].lower()
+            lines = {int(index): text for index, text in re.findall(r"^\[(\d+)\] (.*)$", prompt, re.M)}
+            matches = [{"cdsi_code": row[0], "lines": [i for i, text in lines.items() if row[1].lower() in text]}
+                       for row in self.reference.data if row[1].lower() in prompt]
+            response["content"] = [{"type": "tool_use", "name": lambda_function.TOOL_NAME, "input": {"matches": matches}}]
+        self.input_tokens += response["usage"]["input_tokens"]
+        return response
+
+def patient_conditions(rng, vocabulary):
+    # Zipf-like: the first conditions in the vocabulary dominate; onset dates vary per patient
+    count = rng.randint(1, 3)
+    names = {vocabulary[min(int(rng.paretovariate(1.5)) - 1, len(vocabulary) - 1)] for _ in range(count)}
+    return "\n".join(f"  {rng.randint(1990, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} -            : {name}"
+                     for name in sorted(names))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=2000, help="Local model latency per request")
+    parser.add_argument("--output", choices=("text", "structured"), default="structured")
+    args = parser.parse_args()
+    structured = args.output == "structured"
+
+    lines = condition_lines()
+    reference = CdsiReference(*synthetic_reference(lines), etag="", version_id="offline")
+    vocabulary = [line.split(":", 1)[1].strip() for line in lines]
+    random.Random(1).shuffle(vocabulary)
+    rng = random.Random(0)
+    patients = [patient_conditions(rng, vocabulary) for _ in range(args.patients)]
+
+    uncached = MeteredBedrock(reference, 0)
+    expected = [uncached.answer(lambda_function.build_request(conditions, select_cdsi_reference(reference, conditions)[0],
+                                                              structured=structured))
+                for conditions in patients]
+
+    model = MeteredBedrock(reference, args.latency_ms / 1000)
+    aws_clients.set_client("bedrock-runtime", model, region_name=lambda_function.BEDROCK_REGION)
+    llm_cache._cache = llm_cache.ClassificationCache()
+    timings = {"hit": [], "miss": []}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for conditions, answer in zip(patients, expected):
+            start = time.perf_counter()
+            response, status = classify(conditions, reference, select_cdsi_reference(reference, conditions)[0],
+                                        structured=structured)
+            timings[status].append(time.perf_counter() - start)
+            assert response["content"] == answer["content"]
+
+    hits = len(timings["hit"])
+    print(f"{args.patients} patients, {args.output} output, "
+          f"{len(set(llm_cache.normalize_conditions(c, keep_dates=not structured) for c in patients))} distinct cache keys")
+    print(f"without cache: {uncached.calls} Bedrock requests, {uncached.input_tokens} input tokens")
+    print(f"with cache:    {model.calls} Bedrock requests, {model.input_tokens} input tokens, hit rate {hits / args.patients:.0%}")
+    def median_ms(seconds):
+        return f"{statistics.median(seconds) * 1000:.2f} ms" if seconds else "-"
+
+    print(f"latency:       hit median {median_ms(timings['hit'])}, miss median {median_ms(timings['miss'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark: time to first token of the Level-1 endpoint's streaming mode
+against the end-to-end time of a synchronous request.
+
+Runs against a deployed ServerlessBedrockStack, for each file key:
+  - synchronous: POST {"file_key"} and wait for the whole answer
+  - streaming:   POST {"file_key", "stream": true}, then poll {"stream_id"}
+                 the way the Streamlit page does
+
+Reports what the client sees (first partial text, complete text) and the
+server-side time to first token recorded by the Lambda.
+
+    python3 benchmarks/llm_streaming_benchmark.py --url https://.../level-1-iz-classification \
+        --file-key patient1.txt patient2.txt --runs 3
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+def run_sync(url, file_key):
+    start = time.perf_counter()
+    response = requests.post(url, json={"file_key": file_key})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+def run_stream(url, file_key, poll_seconds):
+    start = time.perf_counter()
+    response = requests.post(url, json={"file_key": file_key, "stream": True})
+    response.raise_for_status()
+    stream_id = response.json()["stream_id"]
+    first_text = None
+    while True:
+        state = requests.post(url, json={"stream_id": stream_id}).json()
+        if state["status"] == "error":
+            raise RuntimeError(state.get("error"))
+        if state["text"] and first_text is None:
+            first_text = time.perf_counter() - start
+        if state["status"] == "complete":
+            return first_text, time.perf_counter() - start, state.get("first_token_ms", 0) / 1000
+        time.sleep(poll_seconds)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="The /config/Level1IZClassificationEndpoint URL")
+    parser.add_argument("--file-key", nargs="+", required=True)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--poll-seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"{'file':<30} {'sync total':>10} {'stream first text':>17} {'stream total':>12} {'server TTFT':>11}")
+    for file_key in args.file_key:
+        sync = [run_sync(args.url, file_key) for _ in range(args.runs)]
+        streamed = [run_stream(args.url, file_key, args.poll_seconds) for _ in range(args.runs)]
+        print(f"{file_key:<30} {statistics.median(sync):>9.2f}s "
+              f"{statistics.median(s[0] for s in streamed):>16.2f}s "
+              f"{statistics.median(s[1] for s in streamed):>11.2f}s "
+              f"{statistics.median(s[2] for s in streamed):>10.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: per-code DynamoDB queries vs. the batched lookup engine.
+
+Runs against a local, in-memory DynamoDB stand-in that sleeps for a fixed
+round-trip latency on every `query`, so no AWS account is needed.
+
+    python3 benchmarks/snomed_lookup_benchmark.py --latency-ms 15
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "SNOMED_to_CDSi", "src"))
+from snomed_lookup import batch_lookup_snomed_codes  # noqa: E402
+
+class LocalDynamoDB:
+    """Minimal stand-in for the `query` call used by the mapping lambdas."""
+
+    def __init__(self, table, latency_seconds):
+        self.table = table
+        self.latency_seconds = latency_seconds
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency_seconds)
+        snomed_code = int(ExpressionAttributeValues[":snomed_code"]["N"])
+        return {"Items": self.table.get(snomed_code, [])}
+
+def build_table(num_codes):
+    """Map every other SNOMED code to a CDSi code, like a sparse real table."""
+    table = {}
+    for snomed_code in range(100000, 100000 + num_codes, 2):
+        table[snomed_code] = [{
+            "snomed_code": {"N": str(snomed_code)},
+            "cdsi_code": {"N": str(snomed_code % 97)},
+            "snomed_description": {"S": f"Condition {snomed_code}"},
+            "observation_title": {"S": f"Observation {snomed_code % 97}"},
+        }]
+    return table
+
+def sequential_lookup(client, snomed_codes):
+    """The original approach: one blocking query per code."""
+    results = {}
+    for snomed_code in snomed_codes:
+        results[snomed_code] = client.query(
+            TableName="snomed-to-cdsi",
+            KeyConditionExpression="snomed_code = :snomed_code",
+            ExpressionAttributeValues={":snomed_code": {"N": str(snomed_code)}},
+        )["Items"]
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Simulated round-trip time per query")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    args = parser.parse_args()
+
+    table = build_table(max(args.sizes))
+    print(f"{'codes':>6} {'sequential ms':>14} {'batched ms':>11} {'speedup':>8}")
+    for size in args.sizes:
+        # Duplicate a quarter of the codes, as repeated problems/surgeries do
+        codes = list(range(100000, 100000 + size)) + list(range(100000, 100000 + size // 4))
+
+        client = LocalDynamoDB(table, args.latency_ms / 1000)
+        start = time.perf_counter()
+        sequential_lookup(client, codes)
+        sequential_ms = (time.perf_counter() - start) * 1000
+
+        client = LocalDynamoDB(table, args.latency_ms / 1000)
+        start = time.perf_counter()
+        batch_lookup_snomed_codes(client, "snomed-to-cdsi", codes)
+        batched_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{size:>6} {sequential_ms:>14.1f} {batched_ms:>11.1f} {sequential_ms / batched_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
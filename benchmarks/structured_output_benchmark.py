@@ -0,0 +1,66 @@
+"""
+Benchmark: output tokens and latency of the Level-1 prompt in prose mode
+vs. structured mode (a tool call with CDSi codes and condition line indexes).
+
+Calls Bedrock directly with the lambda's own request builder, for the
+conditions of each example EHR in Experiments/Medical_BERT_Comparisons,
+and reports the median output tokens and latency of each mode with the
+CDSi codes each one found. Needs AWS credentials with Bedrock access.
+
+    python3 benchmarks/structured_output_benchmark.py --cdsi-csv CDSi.csv \
+        --model-id anthropic.claude-3-5-sonnet-20241022-v2:0 --runs 3
+"""
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from cdsi_retrieval_evaluation import load_conditions  # noqa: E402
+import boto3  # noqa: E402
+from lambda_function import CdsiReference, build_request, parse_cdsi_codes, select_cdsi_reference  # noqa: E402
+from structured_output import parse_matches  # noqa: E402
+
+def run(client, model_id, request):
+    start = time.perf_counter()
+    response = client.invoke_model(modelId=model_id, body=json.dumps(request),
+                                   contentType="application/json", accept="application/json")
+    body = json.loads(response["body"].read())
+    return body, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cdsi-csv", required=True, help="The CDSi.csv uploaded to STATIC_CDSi_KEY")
+    parser.add_argument("--model-id", required=True)
+    parser.add_argument("--region", default="us-west-2")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.cdsi_csv, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        headers, rows = next(reader), list(reader)
+    reference = CdsiReference(headers, rows, etag="", version_id="offline")
+    client = boto3.client("bedrock-runtime", region_name=args.region)
+
+    print(f"{'EHR':<16} {'mode':<10} {'output tokens':>13} {'latency':>8}  codes")
+    for ehr, lines in load_conditions().items():
+        conditions = "\n".join(lines)
+        reference_text = select_cdsi_reference(reference, conditions)[0]
+        for mode in ("text", "structured"):
+            structured = mode == "structured"
+            request = build_request(conditions, reference_text, cache=False, structured=structured)
+            results = [run(client, args.model_id, request) for _ in range(args.runs)]
+            body = results[-1][0]
+            if structured:
+                codes = [match["cdsi_code"] for match in parse_matches(body, conditions, reference.titles)[0]]
+            else:
+                codes = [match["cdsi_code"] for match in parse_cdsi_codes(body["content"][0]["text"], reference)]
+            print(f"{ehr:<16} {mode:<10} {statistics.median(r[0]['usage']['output_tokens'] for r in results):>13.0f} "
+                  f"{statistics.median(r[1] for r in results):>7.2f}s  {', '.join(sorted(codes)) or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Synthetic Synthea-style CCDA documents for the parsing benchmarks.
+
+Sections follow Synthea's order (Allergies, Medications, Problems, Results,
+Surgeries, Encounters). Each carries both the narrative <table> and the
+structured <entry> elements. Results and Encounters are padded to reach the
+requested size, as they are in long-history patients.
+"""
+import random
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<ClinicalDocument xmlns="urn:hl7-org:v3" xmlns:sdtc="urn:hl7-org:sdtc" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<realmCode code="US"/>
+<templateId root="2.16.840.1.113883.10.20.22.1.1"/>
+<title>C-CDA R2.1 Patient Record: Synthetic Patient</title>
+<recordTarget><patientRole><id root="2.16.840.1.113883.19.5" extension="{patient_id}"/></patientRole></recordTarget>
+<component><structuredBody>
+"""
+FOOTER = "</structuredBody></component></ClinicalDocument>\n"
+
+SNOMED = "2.16.840.1.113883.6.96"
+RXNORM = "2.16.840.1.113883.6.88"
+
+PROBLEMS = [
+    ("714628002", "Prediabetes (finding)"),
+    ("59621000", "Essential hypertension (disorder)"),
+    ("44054006", "Diabetes mellitus type 2 (disorder)"),
+    ("195967001", "Asthma (disorder)"),
+    ("162864005", "Body mass index 30+ - obesity (finding)"),
+    ("314529007", "Medication review due (situation)"),
+    ("66383009", "Gingivitis (disorder)"),
+    ("444814009", "Viral sinusitis (disorder)"),
+]
+SURGERIES = [
+    ("234262008", "Excision of axillary lymph node (procedure)"),
+    ("80146002", "Appendectomy (procedure)"),
+    ("234336002", "Splenectomy (procedure)"),
+]
+MEDICATIONS = [
+    ("314076", "lisinopril 10 MG Oral Tablet"),
+    ("860975", "24 HR Metformin hydrochloride 500 MG Extended Release Oral Tablet"),
+    ("895994", "120 ACTUAT Fluticasone propionate 0.044 MG/ACTUAT Metered Dose Inhaler"),
+]
+
+def _ts(rng, year_from=1990, year_to=2024):
+    return (f"{rng.randint(year_from, year_to)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+            f"{rng.randint(0, 23):02d}{rng.randint(0, 59):02d}00")
+
+def _iso(ts):
+    return f"{ts[0:4]}-{ts[4:6]}-{ts[6:8]}T{ts[8:10]}:{ts[10:12]}:{ts[12:14]}Z"
+
+def _rows(items):
+    return "".join(
+        f"<tr><td>{_iso(low)}</td><td>{_iso(high) if high else ''}</td><td>{name}</td><td>{code}</td></tr>"
+        for code, name, low, high in items
+    )
+
+# Section LOINC codes; like real documents, <code> sits between templateId and title
+SECTION_CODES = {"Problems": "11450-4", "Surgeries": "47519-4", "Medications": "10160-0",
+                 "Allergies": "48765-2", "Results": "30954-2", "Encounters": "46240-8"}
+
+def _section_header(template_id, title):
+    return (f'<templateId root="{template_id}"/>'
+            f'<code code="{SECTION_CODES[title]}" codeSystem="2.16.840.1.113883.6.1"/><title>{title}</title>')
+
+def _section(template_id, title, rows, entries):
+    return (f"<component><section>{_section_header(template_id, title)}"
+            f"<text><table><thead><tr><th>Start</th><th>Stop</th><th>Description</th><th>Code</th></tr></thead>"
+            f"<tbody>{rows}</tbody></table></text>{entries}</section></component>\n")
+
+def _effective_time(low, high):
+    high_xml = f'<high value="{high}"/>' if high else ""
+    return f'<effectiveTime><low value="{low}"/>{high_xml}</effectiveTime>'
+
+def _problem_value(code, name):
+    if code is None:  # recorded as free text only
+        return f'<value xsi:type="CD" nullFlavor="OTH"><originalText>{name}</originalText></value>'
+    return f'<value xsi:type="CD" code="{code}" codeSystem="{SNOMED}" displayName="{name}"/>'
+
+def problems_section(rng, count=6, free_text_ratio=0.0):
+    items = []
+    for code, name in rng.sample(PROBLEMS, min(count, len(PROBLEMS))):
+        low = _ts(rng)
+        high = _ts(rng, int(low[:4]), 2024) if rng.random() < 0.3 else ""
+        if free_text_ratio and rng.random() < free_text_ratio:
+            code = None
+        items.append((code, name, low, high))
+    entries = "".join(
+        f'<entry><act classCode="ACT" moodCode="EVN"><templateId root="2.16.840.1.113883.10.20.22.4.3"/>'
+        f'<code code="CONC" codeSystem="2.16.840.1.113883.5.6"/>{_effective_time(low, high)}'
+        f'<entryRelationship typeCode="SUBJ"><observation classCode="OBS" moodCode="EVN">'
+        f'<templateId root="2.16.840.1.113883.10.20.22.4.4"/><code code="55607006" codeSystem="{SNOMED}"/>'
+        f'{_effective_time(low, high)}{_problem_value(code, name)}'
+        f"</observation></entryRelationship></act></entry>"
+        for code, name, low, high in items
+    )
+    items = [(code or "", name, low, high) for code, name, low, high in items]
+    return _section("2.16.840.1.113883.10.20.22.2.5.1", "Problems", _rows(items), entries)
+
+def surgeries_section(rng, count=2):
+    items = [(code, name, _ts(rng), "") for code, name in rng.sample(SURGERIES, min(count, len(SURGERIES)))]
+    entries = "".join(
+        f'<entry><procedure classCode="PROC" moodCode="EVN"><templateId root="2.16.840.1.113883.10.20.22.4.14"/>'
+        f'<code code="{code}" codeSystem="{SNOMED}" displayName="{name}"/>{_effective_time(low, high)}</procedure></entry>'
+        for code, name, low, high in items
+    )
+    return _section("2.16.840.1.113883.10.20.22.2.7.1", "Surgeries", _rows(items), entries)
+
+def medications_section(rng, count=3):
+    items = []
+    for code, name in rng.sample(MEDICATIONS, min(count, len(MEDICATIONS))):
+        low = _ts(rng)
+        items.append((code, name, low, "" if rng.random() < 0.5 else _ts(rng, int(low[:4]), 2024)))
+    entries = "".join(
+        f'<entry><substanceAdministration classCode="SBADM" moodCode="EVN">'
+        f'<templateId root="2.16.840.1.113883.10.20.22.4.16"/>{_effective_time(low, high)}'
+        f"<consumable><manufacturedProduct><manufacturedMaterial>"
+        f'<code code="{code}" codeSystem="{RXNORM}" displayName="{name}"/>'
+        f"</manufacturedMaterial></manufacturedProduct></consumable></substanceAdministration></entry>"
+        for code, name, low, high in items
+    )
+    return _section("2.16.840.1.113883.10.20.22.2.1.1", "Medications", _rows(items), entries)
+
+def padding_section(rng, template_id, title, target_bytes):
+    """Results/Encounters-style filler made of coded observations."""
+    parts = []
+    size = 0
+    while size < target_bytes:
+        low = _ts(rng)
+        part = (f'<entry><observation classCode="OBS" moodCode="EVN"><templateId root="2.16.840.1.113883.10.20.22.4.2"/>'
+                f'<code code="8302-2" codeSystem="2.16.840.1.113883.6.1" displayName="Body Height"/>'
+                f'<effectiveTime value="{low}"/><value xsi:type="PQ" value="{rng.uniform(150, 190):.1f}" unit="cm"/>'
+                f"</observation></entry>")
+        parts.append(part)
+        size += len(part)
+    return (f"<component><section>{_section_header(template_id, title)}"
+            f'<text>{title}</text>{"".join(parts)}</section></component>\n')
+
+def make_ccda(target_bytes=1_000_000, seed=0, patient_id="synthetic-patient", problem_count=6, free_text_ratio=0.0):
+    """
+    Returns a CCDA document of roughly `target_bytes` as UTF-8 bytes.
+
+    `free_text_ratio` of the problems are recorded without a code, as text only.
+    """
+    rng = random.Random(seed)
+    head = (HEADER.format(patient_id=patient_id)
+            + _section("2.16.840.1.113883.10.20.22.2.6.1", "Allergies", "", "")
+            + medications_section(rng)
+            + problems_section(rng, problem_count, free_text_ratio))
+    surgeries = surgeries_section(rng)
+    filler = max(0, target_bytes - len(head) - len(surgeries) - len(FOOTER))
+    document = (head
+                + padding_section(rng, "2.16.840.1.113883.10.20.22.2.3.1", "Results", filler // 2)
+                + surgeries
+                + padding_section(rng, "2.16.840.1.113883.10.20.22.2.22.1", "Encounters", filler // 2)
+                + FOOTER)
+    return document.encode("utf-8")
@@ -0,0 +1,108 @@
+"""
+Benchmark: a burst of Bedrock calls against a request quota, with and
+without the shared throttling wrapper.
+
+Sends `--requests` invoke_model calls from `--workers` threads to a local
+Bedrock stand-in that admits `--quota-rps` requests per second (token
+bucket, no queueing) and answers ThrottlingException past it, like an
+on-demand quota. Compares:
+  - no retries:   the plain client; throttled calls fail
+  - SDK retries:  retries with jittered backoff but fixed concurrency and
+                  no rate limit, like botocore's default retry handler
+  - adaptive:     ThrottledClient with the AIMD concurrency limit
+  - adaptive+rate: ThrottledClient also rate limited to the quota
+and reports failed calls, throttled attempts, wall time and the wrapper's
+wait metrics.
+
+    python3 benchmarks/throttling_benchmark.py --requests 200 --quota-rps 20 --workers 16
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "cdk", "lambda", "llm_l1_classification", "src"))
+
+from aws_clients import set_client  # noqa: E402
+from throttling import AdaptiveConcurrencyLimit, ThrottledClient  # noqa: E402
+
+class QuotaBedrock:
+    """Stands in for bedrock-runtime's invoke_model under a requests-per-second quota."""
+
+    def __init__(self, quota_rps, latency_seconds):
+        self.quota_rps = quota_rps
+        self.latency_seconds = latency_seconds
+        self.tokens = quota_rps
+        self.updated = time.monotonic()
+        self.attempts = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, **kwargs):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.quota_rps, self.tokens + (now - self.updated) * self.quota_rps)
+            self.updated = now
+            admitted = self.tokens >= 1
+            self.tokens -= admitted
+            self.attempts += 1
+            self.throttled += not admitted
+        if not admitted:
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}}, "InvokeModel")
+        time.sleep(self.latency_seconds)
+        return {"body": b"{}"}
+
+def run(client, requests, workers):
+    def call(_):
+        try:
+            client.invoke_model(modelId="model", body="{}")
+            return True
+        except ClientError:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        succeeded = sum(pool.map(call, range(requests)))
+    return requests - succeeded, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--quota-rps", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--max-attempts", type=int, default=8)
+    args = parser.parse_args()
+
+    def wrapper(rate=None, adaptive=True):
+        client = ThrottledClient("bedrock-runtime", ("invoke_model",), rate=rate, max_concurrency=args.workers,
+                                 max_attempts=args.max_attempts, base_delay=0.1, max_delay=5.0)
+        if not adaptive:
+            client.concurrency = AdaptiveConcurrencyLimit(args.workers, minimum=args.workers)
+        return client
+
+    scenarios = [
+        ("no retries", None),
+        ("SDK retries", wrapper(adaptive=False)),
+        ("adaptive", wrapper()),
+        ("adaptive+rate", wrapper(rate=args.quota_rps)),
+    ]
+    print(f"{args.requests} requests from {args.workers} threads, quota {args.quota_rps:.0f}/s, "
+          f"{args.latency_ms:.0f} ms per call")
+    print(f"{'client':<14} {'failed':>6} {'attempts':>8} {'throttled':>9} {'wall s':>7} "
+          f"{'backoff s':>9} {'rate wait s':>11} {'conc wait s':>11} {'limit':>6}")
+    for name, client in scenarios:
+        model = QuotaBedrock(args.quota_rps, args.latency_ms / 1000)
+        set_client("bedrock-runtime", model)
+        failed, seconds = run(client or model, args.requests, args.workers)
+        metrics = client.snapshot() if client else {}
+        print(f"{name:<14} {failed:>6} {model.attempts:>8} {model.throttled:>9} {seconds:>7.2f} "
+              f"{metrics.get('backoff_seconds', 0):>9.1f} {metrics.get('rate_wait_seconds', 0):>11.1f} "
+              f"{metrics.get('concurrency_wait_seconds', 0):>11.1f} {metrics.get('concurrency_limit', '-'):>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+# One client per (service, region, SDK retries on/off), created on first use and reused across warm invocations.
+# Nothing is created at import, so a handler only pays for the clients its request needs.
+_clients: Dict[Tuple[str, Optional[str], bool], object] = {}
+_lock = threading.Lock()
+
+# For callers that retry themselves (throttling.ThrottledClient): the SDK's own retries would multiply
+# their attempts and hide throttles from their concurrency limit
+NO_RETRIES_CONFIG = Config(retries={"total_max_attempts": 1})
+
+def get_client(service_name: str, region_name: Optional[str] = None, sdk_retries: bool = True):
+    """
+    Returns the container-wide boto3 client for `service_name`, creating it on first use.
+
+    `sdk_retries=False` gives a separate client that makes a single attempt
+    per call; every other caller keeps the SDK's default retries.
+    """
+    key = (service_name, region_name, sdk_retries)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                config = None if sdk_retries else NO_RETRIES_CONFIG
+                client = _clients[key] = boto3.client(service_name, region_name=region_name, config=config)
+    return client
+
+def set_client(service_name: str, client, region_name: Optional[str] = None):
+    """Installs a client (a stand-in in local runs and benchmarks) in place of the boto3 ones."""
+    with _lock:
+        for sdk_retries in (True, False):
+            _clients[(service_name, region_name, sdk_retries)] = client
@@ -0,0 +1,156 @@
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from snomed_to_cdsi_logic import build_cdsi_dict, lookup_with_ancestors
+
+MAX_WORKERS = 8
+# Documents per JSON Lines part; a checkpoint is written after each part
+BATCH_SIZE = 50
+# Stop starting new batches when less than this much Lambda time is left
+SAFETY_MARGIN_MS = 8000
+DEFAULT_OUTPUT_PREFIX = "bulk_results/"
+
+def _load_checkpoint(s3, bucket: str, checkpoint_key: str) -> Optional[Dict]:
+    try:
+        response = s3.get_object(Bucket=bucket, Key=checkpoint_key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response["Body"].read())
+
+def _save_checkpoint(s3, bucket: str, checkpoint_key: str, checkpoint: Dict):
+    s3.put_object(Bucket=bucket, Key=checkpoint_key, Body=json.dumps(checkpoint).encode("utf-8"),
+                  ContentType="application/json")
+
+def _iter_prefix_keys(s3, bucket: str, prefix: str, start_after: Optional[str]) -> Iterator[str]:
+    """Lists keys under a prefix in S3's lexicographic order, resuming after `start_after`."""
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        kwargs["StartAfter"] = start_after
+    for page in s3.get_paginator("list_objects_v2").paginate(**kwargs):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith("/"):
+                yield obj["Key"]
+
+def _read_manifest(s3, bucket: str, manifest_key: str) -> List[str]:
+    """A manifest is an S3 object listing one document key per line."""
+    body = s3.get_object(Bucket=bucket, Key=manifest_key)["Body"].read().decode("utf-8")
+    return [line.strip() for line in body.splitlines() if line.strip()]
+
+def _batches(keys: Iterator[str], size: int) -> Iterator[List[str]]:
+    batch = []
+    for key in keys:
+        batch.append(key)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def run_bulk(s3, bucket: str, body: Dict, context, extract_snomed_codes: Callable[[Dict, str], Set[str]]) -> Dict:
+    """
+    Classifies every document under an S3 prefix or listed in a manifest.
+
+    Documents are downloaded and parsed on a bounded thread pool. Their codes
+    are mapped with one lookup per batch, reusing rows already fetched for
+    earlier batches. Each batch is written back to S3 as a JSON Lines part.
+    A checkpoint is saved after every part, so a run cut short by the Lambda
+    timeout resumes where it stopped when invoked again with the same `run_id`.
+
+    Args:
+        s3: A boto3 S3 client.
+        bucket (str): Bucket holding the documents and receiving the results.
+        body (dict): `s3_prefix` or `manifest_key`, plus optional `run_id`
+            and `output_prefix`.
+        context: The Lambda context, used to stop before the timeout.
+        extract_snomed_codes (Callable): Turns a `get_object` response and its key into SNOMED codes.
+
+    Returns:
+        dict: Run status, counts and where the results were written.
+    """
+    if "s3_prefix" not in body and "manifest_key" not in body:
+        raise ValueError("Bulk mode needs an 's3_prefix' or a 'manifest_key'")
+
+    run_id = body.get("run_id") or time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+    results_root = body.get("output_prefix", DEFAULT_OUTPUT_PREFIX)
+    output_prefix = f"{results_root}{run_id}/"
+    checkpoint_key = f"{output_prefix}checkpoint.json"
+
+    checkpoint = _load_checkpoint(s3, bucket, checkpoint_key) or {
+        "run_id": run_id,
+        "source": {k: body[k] for k in ("s3_prefix", "manifest_key") if k in body},
+        "last_key": None,
+        "manifest_position": 0,
+        "parts_written": 0,
+        "documents_processed": 0,
+        "documents_failed": 0,
+        "done": False,
+    }
+    if checkpoint["done"]:
+        return {"status": "complete", "output_prefix": output_prefix, **checkpoint}
+
+    source = checkpoint["source"]
+    if "manifest_key" in source:
+        keys = iter(_read_manifest(s3, bucket, source["manifest_key"])[checkpoint["manifest_position"]:])
+    else:
+        keys = _iter_prefix_keys(s3, bucket, source["s3_prefix"], checkpoint["last_key"])
+        # Never classify our own output when it lives under the listed prefix
+        keys = (key for key in keys if not key.startswith(results_root))
+
+    # Rows fetched for earlier batches are reused instead of looked up again. A code fetched only as
+    # another code's ancestor has rows but no ancestors of its own, so resolved codes are tracked apart
+    rows_cache: Dict[int, List[Dict]] = {}
+    ancestors_cache: Dict[int, List[int]] = {}
+    resolved: Set[int] = set()
+
+    def extract(key: str) -> Dict:
+        try:
+            response = s3.get_object(Bucket=bucket, Key=key)
+            try:
+                return {"s3_key": key, "snomed_codes": {int(code) for code in extract_snomed_codes(response, key)}}
+            finally:
+                response["Body"].close()
+        except Exception as e:
+            return {"s3_key": key, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for batch in _batches(keys, BATCH_SIZE):
+            if context is not None and context.get_remaining_time_in_millis() < SAFETY_MARGIN_MS:
+                _save_checkpoint(s3, bucket, checkpoint_key, checkpoint)
+                return {"status": "incomplete", "output_prefix": output_prefix, **checkpoint}
+
+            documents = list(pool.map(extract, batch))
+
+            new_codes = set()
+            for document in documents:
+                new_codes.update(document.get("snomed_codes", set()) - resolved)
+            if new_codes:
+                rows, ancestors = lookup_with_ancestors(new_codes)
+                rows_cache.update(rows)
+                ancestors_cache.update(ancestors)
+                resolved.update(new_codes)
+
+            lines = []
+            for document in documents:
+                if "error" in document:
+                    checkpoint["documents_failed"] += 1
+                    lines.append(json.dumps(document))
+                else:
+                    cdsi = build_cdsi_dict(document["snomed_codes"], rows_cache, ancestors_cache)
+                    lines.append(json.dumps({"s3_key": document["s3_key"], "cdsi_results": cdsi}))
+                checkpoint["documents_processed"] += 1
+
+            part_key = f"{output_prefix}part-{checkpoint['parts_written']:05d}.jsonl"
+            s3.put_object(Bucket=bucket, Key=part_key, Body=("\n".join(lines) + "\n").encode("utf-8"),
+                          ContentType="application/x-ndjson")
+
+            checkpoint["parts_written"] += 1
+            checkpoint["last_key"] = batch[-1]
+            checkpoint["manifest_position"] += len(batch)
+            _save_checkpoint(s3, bucket, checkpoint_key, checkpoint)
+
+    checkpoint["done"] = True
+    _save_checkpoint(s3, bucket, checkpoint_key, checkpoint)
+    return {"status": "complete", "output_prefix": output_prefix, **checkpoint}
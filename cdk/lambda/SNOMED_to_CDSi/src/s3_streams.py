@@ -0,0 +1,94 @@
+import gzip
+import io
+from typing import Dict, Optional
+
+try:
+    import zstandard
+except ImportError:  # only needed for .zst documents
+    zstandard = None
+
+# Extension -> encoding, checked when the object has no Content-Encoding
+COMPRESSED_EXTENSIONS = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+ENCODING_ALIASES = {"gzip": "gzip", "x-gzip": "gzip", "zstd": "zstd", "zstandard": "zstd"}
+READ_BUFFER_SIZE = 256 * 1024
+
+class _ClosingStream(io.RawIOBase):
+    """Reads from a (possibly decompressing) stream and closes the S3 body with it."""
+
+    def __init__(self, stream, body):
+        self._stream = stream
+        self._body = body
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            try:
+                if self._stream is not self._body:
+                    self._stream.close()
+            finally:
+                self._body.close()  # stops the download if the reader finished early
+        super().close()
+
+def strip_compression_suffix(key: str) -> str:
+    """'patient.xml.gz' -> 'patient.xml'; other keys are returned unchanged."""
+    lowered = key.lower()
+    for extension in COMPRESSED_EXTENSIONS:
+        if lowered.endswith(extension):
+            return key[:-len(extension)]
+    return key
+
+def content_encoding(response: Dict, key: str = "") -> Optional[str]:
+    """
+    The compression of an S3 object: "gzip", "zstd" or None.
+
+    Content-Encoding wins when it is set; otherwise the key's extension decides.
+    """
+    encoding = (response.get("ContentEncoding") or "").strip().lower()
+    if encoding in ENCODING_ALIASES:
+        return ENCODING_ALIASES[encoding]
+    lowered = key.lower()
+    for extension, name in COMPRESSED_EXTENSIONS.items():
+        if lowered.endswith(extension):
+            return name
+    return None
+
+def open_body(response: Dict, key: str = ""):
+    """
+    Opens an S3 get_object response as a binary stream of the document itself.
+
+    gzip and zstd objects are decompressed incrementally as the caller reads,
+    so only a read buffer is ever held in memory, never the whole document.
+    Closing the returned stream closes the S3 body.
+
+    Args:
+        response (dict): A boto3 S3 get_object response.
+        key (str): The object key, used when Content-Encoding is not set.
+
+    Returns:
+        io.BufferedReader: The (decompressed) document bytes.
+    """
+    body = response["Body"]
+    encoding = content_encoding(response, key)
+
+    if encoding == "gzip":
+        stream = gzip.GzipFile(fileobj=body, mode="rb")
+    elif encoding == "zstd":
+        if zstandard is None:
+            body.close()
+            raise ValueError(f"{key or 'Object'} is zstd-compressed but the zstandard package is not installed")
+        stream = zstandard.ZstdDecompressor().stream_reader(body, read_size=READ_BUFFER_SIZE, closefd=False)
+    else:
+        stream = body
+
+    return io.BufferedReader(_ClosingStream(stream, body), buffer_size=READ_BUFFER_SIZE)
+
+def open_text(response: Dict, key: str = "", encoding: str = "utf-8"):
+    """Like open_body, decoded as text so it can be read line by line."""
+    return io.TextIOWrapper(open_body(response, key), encoding=encoding)
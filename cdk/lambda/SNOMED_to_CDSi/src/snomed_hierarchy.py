@@ -0,0 +1,128 @@
+import mmap
+import struct
+import zlib
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Set
+
+# Binary layout (little-endian), every section 8-byte aligned:
+#   header     <4sHHIII  magic, format version, reserved, concept count, ancestor count, data crc32
+#   concepts   int64[concept count]      sorted SNOMED concepts with at least one mapped ancestor
+#   offsets    uint32[concept count + 1] ancestor range for each concept
+#   ancestors  int64[ancestor count]     CDSi-mapped ancestors, sorted per concept
+MAGIC = b"SCHX"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHIII")
+
+# RF2 "Is a (attribute)" relationship type
+IS_A = 116680003
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+class SnomedHierarchyIndex:
+    """Memory-mapped closure of each concept's CDSi-mapped is-a ancestors."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, _, concept_count, ancestor_count, crc = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a SNOMED hierarchy index")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has hierarchy format {version}, expected {FORMAT_VERSION}")
+
+        offset = _align(HEADER.size)
+        self._concepts = view[offset:offset + 8 * concept_count].cast("q")
+        offset = _align(offset + 8 * concept_count)
+        self._offsets = view[offset:offset + 4 * (concept_count + 1)].cast("I")
+        offset = _align(offset + 4 * (concept_count + 1))
+        self._ancestors = view[offset:offset + 8 * ancestor_count].cast("q")
+
+        self.version = f"{FORMAT_VERSION}-{crc:08x}"
+
+    def __len__(self) -> int:
+        return len(self._concepts)
+
+    def mapped_ancestors(self, snomed_code) -> List[int]:
+        """Returns the CDSi-mapped ancestors of a concept (empty if none)."""
+        snomed_code = int(snomed_code)
+        i = bisect_left(self._concepts, snomed_code)
+        if i == len(self._concepts) or self._concepts[i] != snomed_code:
+            return []
+        return self._ancestors[self._offsets[i]:self._offsets[i + 1]].tolist()
+
+def read_is_a_relationships(path: str) -> Dict[int, Set[int]]:
+    """
+    Reads active is-a edges from an RF2 relationship file (Snapshot or Full).
+
+    Returns:
+        dict: Child concept -> parent concepts.
+    """
+    # A Full release holds every version of a relationship; keep the latest
+    latest = {}
+    with open(path, encoding="utf-8") as f:
+        next(f)  # header
+        for line in f:
+            fields = line.rstrip("\r\n").split("\t")
+            rel_id, effective_time, active = fields[0], fields[1], fields[2]
+            source, destination, type_id = fields[4], fields[5], fields[7]
+            if int(type_id) != IS_A:
+                continue
+            if rel_id not in latest or effective_time >= latest[rel_id][0]:
+                latest[rel_id] = (effective_time, active == "1", int(source), int(destination))
+
+    parents: Dict[int, Set[int]] = {}
+    for _, is_active, source, destination in latest.values():
+        if is_active:
+            parents.setdefault(source, set()).add(destination)
+    return parents
+
+def mapped_ancestor_closure(parents: Dict[int, Set[int]], mapped: Set[int]) -> Dict[int, List[int]]:
+    """Transitive closure of is-a, restricted to ancestors that have a CDSi mapping."""
+    memo: Dict[int, frozenset] = {}
+
+    def ancestors_of(concept: int) -> frozenset:
+        if concept in memo:
+            return memo[concept]
+        memo[concept] = frozenset()  # guards against cycles in malformed input
+        found = set()
+        for parent in parents.get(concept, ()):
+            if parent in mapped:
+                found.add(parent)
+            found.update(ancestors_of(parent))
+        memo[concept] = frozenset(found)
+        return memo[concept]
+
+    closure = {}
+    for concept in parents:
+        ancestors = ancestors_of(concept)
+        if ancestors:
+            closure[concept] = sorted(ancestors)
+    return closure
+
+def write_hierarchy(path: str, closure: Dict[int, Iterable[int]]) -> int:
+    """Writes a concept -> mapped ancestors closure. Returns the concept count."""
+    concepts, offsets, ancestors = [], [0], []
+    for concept in sorted(closure):
+        concepts.append(concept)
+        ancestors.extend(sorted(closure[concept]))
+        offsets.append(len(ancestors))
+
+    sections = [
+        struct.pack(f"<{len(concepts)}q", *concepts),
+        struct.pack(f"<{len(offsets)}I", *offsets),
+        struct.pack(f"<{len(ancestors)}q", *ancestors),
+    ]
+    crc = 0
+    for section in sections:
+        crc = zlib.crc32(section, crc)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(concepts), len(ancestors), crc))
+        for section in sections:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(section)
+
+    return len(concepts)
@@ -0,0 +1,41 @@
+import struct
+import zlib
+from typing import FrozenSet, Iterable
+
+# Exact membership filter of every SNOMED code that has a CDSi mapping.
+# The mapped set is a few thousand codes, so an exact set costs a few KB and,
+# unlike a Bloom filter, never lets an unmapped code through.
+#   header  <4sHHII  magic, format version, reserved, key count, data crc32
+#   keys    int64[key count]  sorted SNOMED codes
+MAGIC = b"SCKF"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+
+def write_key_filter(path: str, snomed_codes: Iterable[int]) -> int:
+    """Writes the mapped SNOMED codes. Returns how many were written."""
+    keys = sorted({int(code) for code in snomed_codes})
+    data = struct.pack(f"<{len(keys)}q", *keys)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(keys), zlib.crc32(data)))
+        f.write(data)
+    return len(keys)
+
+def load_key_filter(path: str) -> FrozenSet[int]:
+    """Reads a key filter into a frozenset for O(1) membership checks."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is truncated ({len(data)} bytes)")
+    magic, version, _, key_count, crc = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a SNOMED key filter")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} has key filter format {version}, expected {FORMAT_VERSION}")
+
+    payload = data[HEADER.size:]
+    if len(payload) != 8 * key_count:
+        raise ValueError(f"{path} is corrupt ({len(payload)} bytes of keys, expected {8 * key_count})")
+    if zlib.crc32(payload) != crc:
+        raise ValueError(f"{path} is corrupt (checksum mismatch)")
+    return frozenset(struct.unpack(f"<{key_count}q", payload))
@@ -1,11 +1,43 @@
 import json
-from snomed_to_cdsi_logic import snomed_set_with_cdsi_codes
+import time
+from snomed_to_cdsi_logic import snomed_set_with_cdsi_codes, patients_with_cdsi_codes
+
+def handle_batch(patients):
+    """Maps a patient id -> SNOMED codes map with one deduplicated lookup pass."""
+    if not isinstance(patients, dict) or not all(isinstance(codes, list) for codes in patients.values()):
+        raise ValueError("Invalid request body.  'patients' must map patient ids to SNOMED code lists.")
+
+    start = time.perf_counter()
+    patient_codes = {patient_id: set(map(int, codes)) for patient_id, codes in patients.items()}
+    unique_codes = set().union(*patient_codes.values())
+
+    results = patients_with_cdsi_codes(patient_codes)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "results": results,
+        "timing": {
+            "patients": len(patient_codes),
+            "total_codes": sum(len(codes) for codes in patient_codes.values()),
+            "unique_codes": len(unique_codes),
+            "elapsed_ms": round(elapsed_ms, 2),
+            "ms_per_patient": round(elapsed_ms / len(patient_codes), 3) if patient_codes else 0.0
+        }
+    }
 
 def lambda_handler(event, context):
     try:
         body = json.loads(event.get("body", "{}"))
+
+        # Batch shape: {"patients": {"<patient id>": [<snomed codes>], ...}}
+        if "patients" in body:
+            return {
+                "statusCode": 200,
+                "body": json.dumps(handle_batch(body["patients"]))
+            }
+
         if "snomed_codes" not in body or not isinstance(body["snomed_codes"], list):
-            raise ValueError("Invalid request body.  Must contain a 'snomed_codes' list.")
+            raise ValueError("Invalid request body.  Must contain a 'snomed_codes' list or a 'patients' map.")
 
         snomed_codes = set(map(int, body["snomed_codes"]))  # Convert to set of integers
 
@@ -21,4 +53,4 @@ def lambda_handler(event, context):
         return {
             "statusCode": 400,
             "body": json.dumps({"error": str(e)})
-        }
\ No newline at end of file
+        }
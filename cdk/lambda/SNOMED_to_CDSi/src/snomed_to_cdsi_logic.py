@@ -1,48 +1,215 @@
-import boto3
-from typing import Set, Dict, List
+import os
+import json
+from typing import Set, Dict, Iterable, List
+from snomed_lookup import batch_lookup_snomed_codes
+from snomed_index import SnomedCdsiIndex
+from snomed_key_filter import load_key_filter
+from snomed_hierarchy import SnomedHierarchyIndex
+from ssm_config import get_parameters
+from aws_clients import get_client
 
-dynamodb = boto3.client('dynamodb')
-ssm = boto3.client('ssm')
+# Fetched together in one GetParameters call and cached across warm invocations
+BUCKET_NAME_PARAMETER = "/config/SSMSNOMEDToCDSiBucketName"
+TABLE_NAME_PARAMETER = "/config/DynamoSNOMEDToCDSiTableName"
+
+# "dynamodb" (default) queries the mapping table, "index" uses the compiled
+# in-process index built by SNOMED_to_CDSi/one_time_parser/build_index.py
+LOOKUP_BACKEND = os.environ.get("SNOMED_CDSI_BACKEND", "dynamodb")
+INDEX_PATH = os.environ.get(
+    "SNOMED_CDSI_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "snomed_cdsi.idx")
+)
+_index = None
+
+# Exact set of mapped SNOMED codes (written by build_index.py). Unmapped codes
+# are dropped before any lookup; without the file every code is looked up.
+KEY_FILTER_PATH = os.environ.get(
+    "SNOMED_KEY_FILTER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "snomed_keys.bin")
+)
+_key_filter = None
+_key_filter_loaded = False
+
+# Cumulative per container, also logged per lookup to show the filter hit rate
+LOOKUP_STATS = {"looked_up": 0, "skipped": 0}
+
+# When enabled, codes also match through their CDSi-mapped is-a ancestors,
+# using the closure built by SNOMED_to_CDSi/one_time_parser/build_hierarchy.py
+HIERARCHY_EXPANSION = os.environ.get("SNOMED_HIERARCHY_EXPANSION", "false").lower() == "true"
+HIERARCHY_PATH = os.environ.get(
+    "SNOMED_HIERARCHY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "snomed_hierarchy.idx")
+)
+_hierarchy = None
 
 def get_s3_bucket_name():
-    response = ssm.get_parameter(Name="/config/SSMSNOMEDToCDSiBucketName")
-    return response["Parameter"]["Value"]
+    return get_parameters(BUCKET_NAME_PARAMETER, TABLE_NAME_PARAMETER)[BUCKET_NAME_PARAMETER]
 
 def get_mapping_table():
-    response = ssm.get_parameter(Name="/config/DynamoSNOMEDToCDSiTableName")
-    return response["Parameter"]["Value"]
+    return get_parameters(BUCKET_NAME_PARAMETER, TABLE_NAME_PARAMETER)[TABLE_NAME_PARAMETER]
 
-def snomed_set_with_cdsi_codes(snomed_set: Set[int]) -> Dict[int, Dict[str, List[Dict[str, str]]]]:
-    table_name = get_mapping_table()
-    cdsi_dict = {}
+def get_index() -> SnomedCdsiIndex:
+    """Loads the compiled SNOMED-to-CDSi index once per container."""
+    global _index
+    if _index is None:
+        if not os.path.exists(INDEX_PATH):
+            raise FileNotFoundError(
+                f"SNOMED_CDSI_BACKEND=index but the compiled index {INDEX_PATH} is missing. Build it with "
+                f"`python3 SNOMED_to_CDSi/one_time_parser/build_index.py <Coded Observations CSV>` and redeploy, "
+                f"or set SNOMED_CDSI_BACKEND=dynamodb")
+        _index = SnomedCdsiIndex(INDEX_PATH)
+        print(f"Loaded SNOMED-to-CDSi index {INDEX_PATH} (version {_index.version}, {len(_index)} codes)")
+    return _index
+
+def get_hierarchy() -> SnomedHierarchyIndex:
+    """Loads the SNOMED ancestor closure once per container."""
+    global _hierarchy
+    if _hierarchy is None:
+        if not os.path.exists(HIERARCHY_PATH):
+            raise FileNotFoundError(
+                f"SNOMED_HIERARCHY_EXPANSION=true but the ancestor closure {HIERARCHY_PATH} is missing. Build it with "
+                f"`python3 SNOMED_to_CDSi/one_time_parser/build_hierarchy.py <sct2_Relationship_Snapshot file> "
+                f"<Coded Observations CSV>` and redeploy, or set SNOMED_HIERARCHY_EXPANSION=false")
+        _hierarchy = SnomedHierarchyIndex(HIERARCHY_PATH)
+        print(f"Loaded SNOMED hierarchy {HIERARCHY_PATH} (version {_hierarchy.version}, {len(_hierarchy)} concepts)")
+    return _hierarchy
+
+def get_key_filter():
+    """Loads the mapped-code filter once per container, or None if it isn't shipped."""
+    global _key_filter, _key_filter_loaded
+    if not _key_filter_loaded:
+        _key_filter_loaded = True
+        if os.path.exists(KEY_FILTER_PATH):
+            _key_filter = load_key_filter(KEY_FILTER_PATH)
+            print(f"Loaded SNOMED key filter {KEY_FILTER_PATH} ({len(_key_filter)} mapped codes)")
+        else:
+            print(f"No SNOMED key filter at {KEY_FILTER_PATH}, looking up every code")
+    return _key_filter
 
-    for snomed in snomed_set:
-        query = dynamodb.query(
-            TableName=table_name,
-            KeyConditionExpression='snomed_code = :snomed_code',
-            ExpressionAttributeValues={
-                ':snomed_code': {'N': str(snomed)}  # Convert number to string for DynamoDB query
-            }
-        )
+def lookup_snomed_codes(snomed_codes):
+    """Resolves SNOMED codes to CDSi rows with the configured backend."""
+    snomed_codes = {int(code) for code in snomed_codes}
+    requested = len(snomed_codes)
 
-        if query['Items']:
-            # Extract SNOMED description from first item
-            snomed_description = query["Items"][0].get('snomed_description', {}).get('S', '')
+    key_filter = get_key_filter()
+    if key_filter is not None:
+        snomed_codes &= key_filter
 
-            for item in query["Items"]:
-                cdsi_code = int(item['cdsi_code']['N'])  # Convert CDSi code to int
-                observation_title = item.get('observation_title', {}).get('S', '')  # Observation title
+    skipped = requested - len(snomed_codes)
+    LOOKUP_STATS["looked_up"] += len(snomed_codes)
+    LOOKUP_STATS["skipped"] += skipped
+    print(json.dumps({"snomed_lookup": {"looked_up": len(snomed_codes), "skipped": skipped, "totals": LOOKUP_STATS}}))
+
+    if not snomed_codes:
+        return {}
+    if LOOKUP_BACKEND == "index":
+        return get_index().lookup_many(snomed_codes)
+    return batch_lookup_snomed_codes(get_client('dynamodb'), get_mapping_table(), snomed_codes)
+
+def lookup_with_ancestors(snomed_codes: Iterable):
+    """
+    Looks up codes, plus their mapped ancestors when hierarchy expansion is on.
+
+    Returns:
+        tuple: (rows_by_code, ancestors_by_code). ancestors_by_code is empty
+        when expansion is disabled.
+    """
+    snomed_codes = {int(code) for code in snomed_codes}
+    ancestors_by_code = {}
+    if HIERARCHY_EXPANSION:
+        hierarchy = get_hierarchy()
+        for code in snomed_codes:
+            ancestors = hierarchy.mapped_ancestors(code)
+            if ancestors:
+                ancestors_by_code[code] = ancestors
+
+    lookup_codes = snomed_codes.union(*ancestors_by_code.values())
+    return lookup_snomed_codes(lookup_codes), ancestors_by_code
+
+def build_cdsi_dict(snomed_codes: Iterable, rows_by_code: Dict[int, List[Dict]],
+                    ancestors_by_code: Dict[int, List[int]] = None) -> Dict[int, Dict[str, List[Dict[str, str]]]]:
+    """
+    Groups looked-up rows by CDSi code for one patient's SNOMED codes.
+
+    A match made through an ancestor keeps the patient's own SNOMED code and
+    description (None when the code has no rows of its own) and adds
+    `matched_via`, the ancestor's SNOMED code and description.
+    """
+    ancestors_by_code = ancestors_by_code or {}
+    cdsi_dict = {}
+    seen = set()  # (cdsi_code, snomed_code) pairs already referenced
+
+    for snomed in snomed_codes:
+        snomed = int(snomed)
+        rows = rows_by_code.get(snomed, [])
+        # Extract SNOMED description from first item
+        snomed_description = rows[0]["snomed_description"] if rows else None
+
+        if rows:
+            for row in rows:
+                cdsi_code = row["cdsi_code"]
 
                 # Store in dictionary with CDSi as primary key
                 if cdsi_code not in cdsi_dict:
                     cdsi_dict[cdsi_code] = {
-                        "observation_title": observation_title,
+                        "observation_title": row["observation_title"],
                         "snomed_references": []
                     }
 
                 # Add SNOMED reference (avoiding duplicates)
-                snomed_entry = {"snomed_code": int(snomed), "snomed_description": snomed_description}
-                if snomed_entry not in cdsi_dict[cdsi_code]["snomed_references"]:
-                    cdsi_dict[cdsi_code]["snomed_references"].append(snomed_entry)
+                if (cdsi_code, snomed) not in seen:
+                    seen.add((cdsi_code, snomed))
+                    cdsi_dict[cdsi_code]["snomed_references"].append(
+                        {"snomed_code": snomed, "snomed_description": snomed_description}
+                    )
+
+        # Descendant matches: O(ancestors) lookups in the precomputed closure
+        for ancestor in ancestors_by_code.get(snomed, []):
+            for row in rows_by_code.get(ancestor, []):
+                cdsi_code = row["cdsi_code"]
+                if cdsi_code not in cdsi_dict:
+                    cdsi_dict[cdsi_code] = {
+                        "observation_title": row["observation_title"],
+                        "snomed_references": []
+                    }
+                if (cdsi_code, snomed) not in seen:
+                    seen.add((cdsi_code, snomed))
+                    cdsi_dict[cdsi_code]["snomed_references"].append({
+                        "snomed_code": snomed,
+                        "snomed_description": snomed_description,
+                        "matched_via": {"snomed_code": ancestor, "snomed_description": row["snomed_description"]}
+                    })
 
     return cdsi_dict
+
+def snomed_set_with_cdsi_codes(snomed_set: Set[int]) -> Dict[int, Dict[str, List[Dict[str, str]]]]:
+    # One batched, parallel pass over the deduplicated codes (and their mapped ancestors)
+    rows_by_code, ancestors_by_code = lookup_with_ancestors(snomed_set)
+    return build_cdsi_dict(snomed_set, rows_by_code, ancestors_by_code)
+
+def patients_with_cdsi_codes(patient_codes: Dict[str, Iterable]) -> Dict[str, Dict[int, Dict[str, List[Dict[str, str]]]]]:
+    """
+    Maps many patients' SNOMED codes to CDSi codes with a single lookup pass.
+
+    Args:
+        patient_codes (dict): Patient id -> SNOMED codes.
+
+    Returns:
+        dict: Patient id -> cdsi_dict, in the same shape as snomed_set_with_cdsi_codes.
+    """
+    union = set()
+    for codes in patient_codes.values():
+        union.update(int(code) for code in codes)
+
+    rows_by_code, ancestors_by_code = lookup_with_ancestors(union)
+    return {
+        patient_id: build_cdsi_dict(set(codes), rows_by_code, ancestors_by_code)
+        for patient_id, codes in patient_codes.items()
+    }
+
+# Map the indexes during the init phase so the first request doesn't pay for it
+if LOOKUP_BACKEND == "index":
+    get_index()
+get_key_filter()
+if HIERARCHY_EXPANSION:
+    get_hierarchy()
@@ -0,0 +1,292 @@
+import io
+import time
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+HL7_NAMESPACE = "{urn:hl7-org:v3}"
+SECTION_TAG = HL7_NAMESPACE + "section"
+TEMPLATE_ID_TAG = HL7_NAMESPACE + "templateId"
+TITLE_TAG = HL7_NAMESPACE + "title"
+# Children a <section> opens with, before its text and entries (id and code precede title)
+SECTION_HEADER_TAGS = {TEMPLATE_ID_TAG, HL7_NAMESPACE + "id", HL7_NAMESPACE + "code", TITLE_TAG}
+
+PROBLEMS_TEMPLATE_ID = "2.16.840.1.113883.10.20.22.2.5.1"
+PROCEDURES_TEMPLATE_ID = "2.16.840.1.113883.10.20.22.2.7.1"  # titled "Surgeries" in Synthea documents
+MEDICATIONS_TEMPLATE_ID = "2.16.840.1.113883.10.20.22.2.1.1"
+
+SNOMED_CODE_SYSTEM = "2.16.840.1.113883.6.96"
+
+SECTION_KINDS = ("problems", "procedures", "medications")
+
+# Verhoeff dihedral-group tables used by the SNOMED CT identifier check digit
+_VERHOEFF_D = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 2, 3, 4, 0, 6, 7, 8, 9, 5), (2, 3, 4, 0, 1, 7, 8, 9, 5, 6),
+    (3, 4, 0, 1, 2, 8, 9, 5, 6, 7), (4, 0, 1, 2, 3, 9, 5, 6, 7, 8), (5, 9, 8, 7, 6, 0, 4, 3, 2, 1),
+    (6, 5, 9, 8, 7, 1, 0, 4, 3, 2), (7, 6, 5, 9, 8, 2, 1, 0, 4, 3), (8, 7, 6, 5, 9, 3, 2, 1, 0, 4),
+    (9, 8, 7, 6, 5, 4, 3, 2, 1, 0),
+)
+_VERHOEFF_P = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 5, 7, 6, 2, 8, 3, 0, 9, 4), (5, 8, 0, 3, 7, 9, 6, 1, 4, 2),
+    (8, 9, 1, 6, 0, 4, 3, 5, 2, 7), (9, 4, 5, 3, 1, 2, 6, 8, 7, 0), (4, 2, 8, 6, 5, 7, 3, 9, 0, 1),
+    (2, 7, 9, 3, 8, 0, 6, 4, 1, 5), (7, 0, 4, 6, 9, 1, 3, 2, 5, 8),
+)
+
+# Classifiers turn a section's templateId roots and title into a section kind (or None to skip it)
+SectionClassifier = Callable[[List[str], str], Optional[str]]
+
+def strip_namespaces(element):
+    """Recursively remove namespace prefixes from tags."""
+    for elem in element.iter():
+        if '}' in elem.tag:
+            elem.tag = elem.tag.split('}', 1)[1]
+
+def classify_section(template_ids: List[str], title: str) -> Optional[str]:
+    """Problems, Procedures/Surgeries and Medications, by templateId@root with a <title> fallback."""
+    if PROBLEMS_TEMPLATE_ID in template_ids:
+        return "problems"
+    if PROCEDURES_TEMPLATE_ID in template_ids:
+        return "procedures"
+    if MEDICATIONS_TEMPLATE_ID in template_ids:
+        return "medications"
+
+    title = title.strip().lower()
+    if "medication" in title:
+        return "medications"
+    if "problem" in title:
+        return "problems"
+    if "surger" in title or "procedure" in title:
+        return "procedures"
+    return None
+
+def _as_stream(source):
+    """Accept XML text, bytes, or a binary file-like object such as an S3 body."""
+    if isinstance(source, str):
+        return io.BytesIO(source.encode("utf-8"))
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    return source
+
+def iter_sections(source, classify: SectionClassifier, wanted: Iterable[str]) -> Iterator[Tuple[str, ET.Element]]:
+    """
+    Streams a CCDA and yields only the sections of the wanted kinds.
+
+    The document is read incrementally with iterparse. Only wanted sections
+    are kept in memory; every other element is cleared as soon as it ends.
+    Reading stops as soon as one section of each wanted kind has been seen,
+    so the rest of the document is never downloaded or parsed.
+
+    Args:
+        source: XML text, bytes, or a binary file-like object.
+        classify (SectionClassifier): Maps (templateId roots, title) to a kind.
+        wanted (Iterable[str]): Section kinds to yield.
+
+    Yields:
+        tuple: (kind, section element with namespaces stripped). The element
+        is cleared once the caller moves on to the next section.
+    """
+    remaining = set(wanted)
+    stack = []
+    section = None  # outermost <section> currently open
+    template_ids: List[str] = []
+    title = ""
+    kind = None
+    decided = False
+
+    for event, elem in ET.iterparse(_as_stream(source), events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if section is None and elem.tag == SECTION_TAG:
+                section, template_ids, title, kind, decided = elem, [], "", None, False
+            elif section is not None and not decided and len(stack) >= 2 and stack[-2] is section:
+                # The header children come first; the first other child settles the kind
+                if elem.tag == TEMPLATE_ID_TAG:
+                    template_ids.append(elem.attrib.get("root", ""))
+                elif elem.tag not in SECTION_HEADER_TAGS:
+                    kind = classify(template_ids, title)
+                    decided = True
+            continue
+
+        stack.pop()
+        if elem is section:
+            if not decided:
+                kind = classify(template_ids, title)
+            if kind in remaining:
+                remaining.discard(kind)
+                strip_namespaces(elem)
+                yield kind, elem
+            elem.clear()
+            section = None
+            if not remaining:
+                return
+        elif section is not None:
+            if elem.tag == TITLE_TAG and stack and stack[-1] is section:
+                title = elem.text or ""
+                if not decided:
+                    # <title> ends the header
+                    kind = classify(template_ids, title)
+                    decided = True
+            elif decided and kind not in remaining:
+                # Not a section we want: free its subtree as we go
+                elem.clear()
+        else:
+            # Header and other content outside any section is never needed
+            elem.clear()
+
+def is_valid_snomed_concept_id(code: str) -> bool:
+    """
+    True for a well-formed SNOMED CT concept id.
+
+    6-18 digits without a leading zero, a concept partition ("00" or "10"
+    before the check digit) and a valid Verhoeff check digit.
+    """
+    if not (code.isdigit() and 6 <= len(code) <= 18 and code[0] != "0"):
+        return False
+    if code[-3:-1] not in ("00", "10"):
+        return False
+    check = 0
+    for position, digit in enumerate(reversed(code)):
+        check = _VERHOEFF_D[check][_VERHOEFF_P[position % 8][int(digit)]]
+    return check == 0
+
+def _hl7_timestamp(element) -> Optional[str]:
+    """Normalizes an HL7 TS value (e.g. 20100125031234-0500) to 14 sortable digits."""
+    if element is None:
+        return None
+    value = element.attrib.get("value")
+    if not value:
+        return None
+    digits = value[:14]
+    if not digits.isdigit():
+        digits = "".join(ch for ch in value if ch.isdigit())[:14]
+    return digits.ljust(14, "0")
+
+def _effective_times(act) -> Tuple[Optional[str], Optional[str]]:
+    """(low, high) of an act's first interval effectiveTime, or its point value as the start."""
+    for effective_time in act.findall("effectiveTime"):
+        low = effective_time.find("low")
+        if low is not None or effective_time.find("high") is not None:
+            return _hl7_timestamp(low), _hl7_timestamp(effective_time.find("high"))
+        if effective_time.attrib.get("value"):
+            return _hl7_timestamp(effective_time), None
+    return None, None
+
+class CodedEntry:
+    """One coded problem, procedure or medication from a CCDA <entry>."""
+
+    __slots__ = ("section", "code", "code_system", "display_name", "start", "stop")
+
+    def __init__(self, section: str, code: str, code_system: str, display_name: str,
+                 start: Optional[str], stop: Optional[str]):
+        self.section = section
+        self.code = code
+        self.code_system = code_system
+        self.display_name = display_name
+        self.start = start  # "YYYYMMDDHHMMSS" or None
+        self.stop = stop
+
+    @property
+    def is_snomed(self) -> bool:
+        return self.code_system == SNOMED_CODE_SYSTEM and self.code != ""
+
+    @property
+    def is_current(self) -> bool:
+        """True when no stop date is recorded at all."""
+        return self.stop is None
+
+    def is_active(self, now: Optional[str] = None) -> bool:
+        """True when there is no stop date, or it is still in the future."""
+        if self.stop is None:
+            return True
+        return self.stop > (now or current_timestamp())
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"CodedEntry({self.section}, {self.code}, {self.display_name!r}, {self.start}-{self.stop})"
+
+class CcdaDocument:
+    """Coded entries from one CCDA, parsed once and shared by every pipeline."""
+
+    __slots__ = ("problems", "procedures", "medications")
+
+    def __init__(self):
+        self.problems: List[CodedEntry] = []
+        self.procedures: List[CodedEntry] = []
+        self.medications: List[CodedEntry] = []
+
+def current_timestamp() -> str:
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime())
+
+def _coded_entry(kind: str, entry) -> Optional[CodedEntry]:
+    """Pulls the coded element and its effectiveTime out of one section <entry>."""
+    if kind == "problems":
+        # Problem Concern act -> Problem Observation; the problem is the observation's <value>.
+        # Uncoded problems keep their text (code "") so free-text pipelines still see them.
+        for observation in entry.iter("observation"):
+            value = observation.find("value")
+            if value is None:
+                continue
+            original_text = value.find("originalText")
+            display_name = value.attrib.get("displayName") or (
+                (original_text.text or "").strip() if original_text is not None else "")
+            if value.attrib.get("code") or display_name:
+                start, stop = _effective_times(observation)
+                if start is None and stop is None:
+                    start, stop = _effective_times(entry[0]) if len(entry) else (None, None)
+                return CodedEntry(kind, value.attrib.get("code", ""), value.attrib.get("codeSystem", ""),
+                                  display_name, start, stop)
+        return None
+
+    if kind == "medications":
+        for administration in entry.iter("substanceAdministration"):
+            code = administration.find("consumable/manufacturedProduct/manufacturedMaterial/code")
+            if code is not None and code.attrib.get("code"):
+                start, stop = _effective_times(administration)
+                return CodedEntry(kind, code.attrib["code"], code.attrib.get("codeSystem", ""),
+                                  code.attrib.get("displayName", ""), start, stop)
+        return None
+
+    # Procedures may be recorded as <procedure>, <act> or <observation>
+    for act in entry:
+        code = act.find("code")
+        if code is not None and code.attrib.get("code"):
+            start, stop = _effective_times(act)
+            return CodedEntry(kind, code.attrib["code"], code.attrib.get("codeSystem", ""),
+                              code.attrib.get("displayName", ""), start, stop)
+    return None
+
+def direct_mapping_entries(document: CcdaDocument, now: Optional[str] = None) -> Iterator[CodedEntry]:
+    """SNOMED entries used for direct CDSi mapping: active problems and every procedure."""
+    now = now or current_timestamp()
+    for entry in document.problems:
+        if entry.is_snomed and entry.is_active(now):
+            yield entry
+    for entry in document.procedures:
+        if entry.is_snomed:
+            yield entry
+
+def parse_ccda(source, wanted: Iterable[str] = SECTION_KINDS) -> CcdaDocument:
+    """
+    Parses the coded entries of a CCDA in a single streaming pass.
+
+    Reads the structured <entry> elements (problem observation values,
+    procedure codes, medication material codes, with effectiveTime low/high)
+    instead of the narrative table text. Only the wanted sections are
+    materialized and reading stops once they have all been seen.
+
+    Args:
+        source: XML text, bytes, or a binary file-like object such as an S3 body.
+        wanted (Iterable[str]): Any of "problems", "procedures", "medications".
+
+    Returns:
+        CcdaDocument: The coded entries, grouped by section.
+    """
+    document = CcdaDocument()
+    for kind, section in iter_sections(source, classify_section, wanted):
+        records = getattr(document, kind)
+        for entry in section.findall("entry"):
+            record = _coded_entry(kind, entry)
+            if record is not None:
+                records.append(record)
+    return document
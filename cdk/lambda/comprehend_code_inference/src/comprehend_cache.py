@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from comprehend_chunks import MAX_TEXT_CHARACTERS, MAX_WORKERS, infer_snomedct_chunked
+from throttling import backoff_delay
+
+# Bump to invalidate every cached result, e.g. after a Comprehend Medical model change
+CACHE_NAMESPACE = "infer_snomedct:v1"
+MEMORY_ENTRIES = int(os.environ.get("COMPREHEND_CACHE_MEMORY_ENTRIES", "10000"))
+TTL_SECONDS = int(os.environ.get("COMPREHEND_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# Persistent tier: "dynamodb" (the table named in SSM), "sqlite" (a local file) or "memory" (LRU only)
+CACHE_BACKEND = os.environ.get("COMPREHEND_CACHE_BACKEND", "memory")
+CACHE_TABLE_PARAMETER = "/config/DynamoComprehendCacheTableName"
+SQLITE_PATH = os.environ.get("COMPREHEND_CACHE_SQLITE_PATH", "comprehend_cache.sqlite3")
+_cache: Optional["ComprehendResultCache"] = None
+
+def normalize_line(line: str) -> str:
+    """Collapses whitespace; this is the text sent to Comprehend and the text the cache describes."""
+    return " ".join(line.split())
+
+def line_key(line: str) -> str:
+    """Content address of a problem line: case- and whitespace-insensitive."""
+    return hashlib.sha256(f"{CACHE_NAMESPACE}\n{normalize_line(line).casefold()}".encode("utf-8")).hexdigest()
+
+class DynamoDBResultStore:
+    """
+    Persistent tier in a DynamoDB table keyed by `line_hash`, expiring through `expires_at` TTL.
+
+    Unprocessed keys and items are resent with jittered exponential backoff,
+    up to `max_attempts` requests per batch. Whatever is still unprocessed
+    after that is given up on: unread keys count as misses and unwritten
+    results are only kept in memory.
+    """
+
+    def __init__(self, client, table_name: str, ttl_seconds: int = TTL_SECONDS, max_attempts: int = 5,
+                 base_delay: float = 0.05, max_delay: float = 2.0):
+        self.client = client
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _send(self, operation: str, request: Dict, unprocessed_field: str, on_response=None):
+        """Sends a batch request, resending its unprocessed part until done or out of attempts."""
+        for attempt in range(1, self.max_attempts + 1):
+            response = getattr(self.client, operation)(RequestItems=request)
+            if on_response:
+                on_response(response)
+            request = response.get(unprocessed_field)
+            if not request:
+                return
+            if attempt < self.max_attempts:
+                time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+        unprocessed = request[self.table_name]  # {"Keys": [...]} for reads, a list of requests for writes
+        count = len(unprocessed["Keys"]) if isinstance(unprocessed, dict) else len(unprocessed)
+        print(json.dumps({"comprehend_cache_unprocessed": {"operation": operation, "items": count,
+                                                           "attempts": self.max_attempts}}))
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[Dict]]:
+        found = {}
+
+        def collect(response):
+            for item in response.get("Responses", {}).get(self.table_name, []):
+                found[item["line_hash"]["S"]] = json.loads(item["entities"]["S"])
+
+        for i in range(0, len(keys), 100):  # BatchGetItem limit
+            request = {self.table_name: {"Keys": [{"line_hash": {"S": key}} for key in keys[i:i + 100]],
+                                         "ProjectionExpression": "line_hash, entities"}}
+            self._send("batch_get_item", request, "UnprocessedKeys", collect)
+        return found
+
+    def put_many(self, results: Dict[str, List[Dict]]):
+        expires_at = str(int(time.time()) + self.ttl_seconds)
+        items = [{"PutRequest": {"Item": {
+            "line_hash": {"S": key},
+            "entities": {"S": json.dumps(entities)},
+            "expires_at": {"N": expires_at},
+        }}} for key, entities in results.items()]
+        for i in range(0, len(items), 25):  # BatchWriteItem limit
+            self._send("batch_write_item", {self.table_name: items[i:i + 25]}, "UnprocessedItems")
+
+class SQLiteResultStore:
+    """Persistent tier in a local SQLite file, for development and the warm-up tool."""
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS comprehend_cache (line_hash TEXT PRIMARY KEY, entities TEXT NOT NULL)")
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[Dict]]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+                batch = keys[i:i + 500]
+                rows = self._connection.execute(
+                    f"SELECT line_hash, entities FROM comprehend_cache WHERE line_hash IN ({','.join('?' * len(batch))})", batch)
+                found.update((key, json.loads(entities)) for key, entities in rows)
+        return found
+
+    def put_many(self, results: Dict[str, List[Dict]]):
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO comprehend_cache VALUES (?, ?)",
+                                         [(key, json.dumps(entities)) for key, entities in results.items()])
+
+class ComprehendResultCache:
+    """
+    Per-line InferSNOMEDCT results: an in-memory LRU backed by an optional persistent store.
+
+    Values are the entities Comprehend found in one normalized problem line,
+    with offsets relative to the start of that line. Lines with no entities
+    are cached too, so they are not sent again.
+
+    The store is best-effort: a failed read is treated as a miss and a failed
+    write is skipped, so an unavailable store only costs InferSNOMEDCT calls.
+    """
+
+    def __init__(self, store=None, max_entries: int = MEMORY_ENTRIES):
+        self.store = store
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Cumulative per container
+        self.stats = {"memory_hits": 0, "store_hits": 0, "misses": 0, "store_errors": 0}
+
+    def _remember(self, key: str, entities: List[Dict]):
+        self._entries[key] = entities
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _store_failed(self, operation: str, count: int, error: Exception):
+        with self._lock:
+            self.stats["store_errors"] += 1
+        print(json.dumps({"comprehend_cache_error": {"operation": operation, "items": count,
+                                                     "error": f"{type(error).__name__}: {error}"}}))
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[Dict]]:
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+                else:
+                    missing.append(key)
+            self.stats["memory_hits"] += len(found)
+
+        stored = {}
+        if missing and self.store is not None:
+            try:
+                stored = self.store.get_many(missing)
+            except Exception as e:
+                self._store_failed("get_many", len(missing), e)
+        with self._lock:
+            for key, entities in stored.items():
+                self._remember(key, entities)
+            self.stats["store_hits"] += len(stored)
+            self.stats["misses"] += len(missing) - len(stored)
+        found.update(stored)
+        return found
+
+    def put_many(self, results: Dict[str, List[Dict]]):
+        if not results:
+            return
+        with self._lock:
+            for key, entities in results.items():
+                self._remember(key, entities)
+        if self.store is not None:
+            try:
+                self.store.put_many(results)
+            except Exception as e:
+                self._store_failed("put_many", len(results), e)
+
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["store_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+def get_result_cache() -> ComprehendResultCache:
+    """The container-wide cache for the configured backend, created on first use."""
+    global _cache
+    if _cache is None:
+        store = None
+        if CACHE_BACKEND == "dynamodb":
+            from aws_clients import get_client
+            from ssm_config import get_parameter
+            store = DynamoDBResultStore(get_client("dynamodb"), get_parameter(CACHE_TABLE_PARAMETER))
+        elif CACHE_BACKEND == "sqlite":
+            store = SQLiteResultStore(SQLITE_PATH)
+        _cache = ComprehendResultCache(store)
+    return _cache
+
+def _split_by_line(text: str, entities: List[Dict]) -> List[List[Dict]]:
+    """Assigns each entity to the line it starts in, with offsets made relative to that line."""
+    starts = [0]
+    for position, character in enumerate(text):
+        if character == "\n":
+            starts.append(position + 1)
+    ends = starts[1:] + [len(text) + 1]
+
+    by_line: List[List[Dict]] = [[] for _ in starts]
+    line = 0
+    for entity in sorted(entities, key=lambda e: e["BeginOffset"]):
+        while entity["BeginOffset"] >= ends[line]:
+            line += 1
+        start, end = starts[line], ends[line] - 1
+        entity = dict(entity)
+        entity["BeginOffset"] -= start
+        entity["EndOffset"] = min(entity["EndOffset"], end) - start
+        # Relationships to entities on other lines cannot be reused with this line alone
+        entity["Attributes"] = [
+            dict(attribute, BeginOffset=attribute["BeginOffset"] - start, EndOffset=attribute["EndOffset"] - start)
+            for attribute in entity.get("Attributes", [])
+            if start <= attribute["BeginOffset"] and attribute["EndOffset"] <= end
+        ]
+        by_line[line].append(entity)
+    return by_line
+
+def infer_snomedct_cached(client, lines: List[str], cache: ComprehendResultCache,
+                          max_characters: int = MAX_TEXT_CHARACTERS, max_workers: int = MAX_WORKERS) -> Dict:
+    """
+    InferSNOMEDCT over problem lines, sending only lines the cache hasn't seen.
+
+    Lines are normalized and deduplicated by content address. Cached lines
+    are served from memory or the persistent store; the rest go through
+    `infer_snomedct_chunked` once each and are written back. The result has
+    the same shape as `infer_snomedct_chunked`, with offsets on the
+    newline-joined normalized lines and a "Cache" summary for this call.
+
+    Each line is inferred on its own text, so relationships between
+    entities on different lines are not reported.
+    """
+    normalized = [normalize_line(line) for line in lines]
+    keys = [line_key(line) for line in normalized]
+
+    unique = list(dict.fromkeys(keys))
+    results = cache.get_many(unique)
+    hits = len(results)
+
+    miss_lines = {}
+    for key, line in zip(keys, normalized):
+        if key not in results and key not in miss_lines:
+            miss_lines[key] = line
+    if miss_lines:
+        inferred = infer_snomedct_chunked(client, list(miss_lines.values()), max_characters, max_workers)
+        fresh = dict(zip(miss_lines, _split_by_line(inferred["Text"], inferred["Entities"])))
+        cache.put_many(fresh)
+        results.update(fresh)
+
+    text = "\n".join(normalized)
+    entities = []
+    offset = 0
+    first_id = 0
+    for key, line in zip(keys, normalized):
+        ids: Dict[int, int] = {}
+        for cached in results[key]:
+            entity = json.loads(json.dumps(cached))  # callers may mutate the response
+            for item in [entity] + entity.get("Attributes", []):
+                item["BeginOffset"] += offset
+                item["EndOffset"] += offset
+                if "Id" in item:
+                    item["Id"] = first_id + ids.setdefault(item["Id"], len(ids))
+            entities.append(entity)
+        first_id += len(ids)
+        offset += len(line) + 1
+
+    summary = {"lines": len(lines), "unique": len(unique), "hits": hits, "misses": len(miss_lines),
+               "hit_rate": round(cache.hit_rate(), 4), "totals": cache.stats}
+    print(json.dumps({"comprehend_cache": summary}))
+    return {"Entities": entities, "Text": text, "Chunks": inferred["Chunks"] if miss_lines else 0, "Cache": summary}
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+# InferSNOMEDCT accepts at most 10,000 characters of text per request
+MAX_TEXT_CHARACTERS = 10000
+MAX_WORKERS = 4
+
+def _split_long_line(line: str, limit: int) -> List[str]:
+    """Splits a single line longer than `limit` at whitespace, or hard when there is none."""
+    pieces = []
+    while len(line) > limit:
+        cut = line.rfind(" ", 0, limit)
+        cut = limit if cut <= 0 else cut + 1  # keep the space with the left piece
+        pieces.append(line[:cut])
+        line = line[cut:]
+    pieces.append(line)
+    return pieces
+
+def chunk_lines(lines: List[str], max_characters: int = MAX_TEXT_CHARACTERS) -> Tuple[str, List[Tuple[int, str]]]:
+    """
+    Joins lines with newlines and splits the result into chunks on line boundaries.
+
+    Args:
+        lines (List[str]): Problem lines, one condition per line.
+        max_characters (int): Largest chunk to send in one request.
+
+    Returns:
+        tuple: (the joined text, [(offset of the chunk in that text, chunk text)]).
+        Every chunk is an exact slice of the joined text.
+    """
+    text = "\n".join(lines)
+    chunks = []
+    start = None  # offset of the open chunk in `text`
+    end = 0
+    position = 0
+    for line in lines:
+        for piece in _split_long_line(line, max_characters):
+            piece_end = position + len(piece)
+            if start is not None and piece_end - start > max_characters:
+                chunks.append((start, text[start:end]))
+                start = None
+            if piece:
+                if start is None:
+                    start = position
+                end = piece_end
+            position = piece_end
+        position += 1  # the "\n" after this line
+    if start is not None:
+        chunks.append((start, text[start:end]))
+    return text, chunks
+
+def _shift(item: Dict, offset: int, ids: Dict[int, int], first_id: int):
+    """Moves an entity or attribute onto the original text and renumbers its Id."""
+    for field in ("BeginOffset", "EndOffset"):
+        if field in item:
+            item[field] += offset
+    if "Id" in item:
+        item["Id"] = first_id + ids.setdefault(item["Id"], len(ids))
+
+def merge_entities(chunks: List[Tuple[int, str]], responses: List[Dict]) -> List[Dict]:
+    """Concatenates the entities of per-chunk responses, shifting offsets and renumbering Ids."""
+    entities = []
+    first_id = 0
+    for (offset, _), response in zip(chunks, responses):
+        ids: Dict[int, int] = {}  # Ids are only unique within one response
+        for entity in response.get("Entities", []):
+            _shift(entity, offset, ids, first_id)
+            for attribute in entity.get("Attributes", []):
+                _shift(attribute, offset, ids, first_id)
+        entities.extend(response.get("Entities", []))
+        first_id += len(ids)
+    return entities
+
+def infer_snomedct_chunked(client, lines: List[str], max_characters: int = MAX_TEXT_CHARACTERS,
+                           max_workers: int = MAX_WORKERS) -> Dict:
+    """
+    Runs Comprehend Medical InferSNOMEDCT over any number of problem lines.
+
+    The lines are split into chunks under the per-request character limit,
+    the chunks are inferred concurrently on a bounded pool, and the
+    entities are merged back in text order. BeginOffset/EndOffset of every
+    entity and attribute are remapped to the newline-joined text, and Ids
+    are renumbered so they stay unique across chunks.
+
+    Args:
+        client: A boto3 comprehendmedical client.
+        lines (List[str]): Problem lines, one condition per line.
+        max_characters (int): Largest chunk to send in one request.
+        max_workers (int): Concurrent InferSNOMEDCT requests.
+
+    Returns:
+        dict: {"Entities": [...], "Text": joined text, "Chunks": request count,
+        "ModelVersion" and "SNOMEDCTDetails" from the first response}.
+    """
+    text, chunks = chunk_lines(lines, max_characters)
+    merged = {"Entities": [], "Text": text, "Chunks": len(chunks)}
+    if not chunks:
+        return merged
+
+    def infer(chunk):
+        return client.infer_snomedct(Text=chunk[1])
+
+    if len(chunks) == 1:
+        responses = [infer(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            responses = list(pool.map(infer, chunks))
+
+    merged["Entities"] = merge_entities(chunks, responses)
+    for field in ("ModelVersion", "SNOMEDCTDetails"):
+        if field in responses[0]:
+            merged[field] = responses[0][field]
+    return merged
@@ -0,0 +1,214 @@
+import abc
+import json
+import os
+import re
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from comprehend_chunks import MAX_TEXT_CHARACTERS, chunk_lines, merge_entities
+
+RUNNING_STATUSES = {"SUBMITTED", "IN_PROGRESS", "STOP_REQUESTED"}
+FINISHED_STATUSES = {"COMPLETED", "PARTIAL_SUCCESS"}
+OUTPUT_SUFFIX = ".out"
+
+class SnomedctJobClient(abc.ABC):
+    """
+    What the batch mode needs from an asynchronous SNOMED CT inference service.
+
+    `input_location` and `output_location` are opaque to the callers: an S3
+    prefix for Comprehend Medical, a directory for the local stand-in.
+    """
+
+    @abc.abstractmethod
+    def stage_inputs(self, run_id: str, files: Dict[str, str]) -> Tuple[str, str]:
+        """Writes one text file per name and returns (input_location, output_location)."""
+
+    @abc.abstractmethod
+    def start(self, run_id: str, input_location: str, output_location: str) -> str:
+        """Submits the job and returns its id."""
+
+    @abc.abstractmethod
+    def describe(self, job_id: str) -> Tuple[str, str]:
+        """Returns (JobStatus, message)."""
+
+    @abc.abstractmethod
+    def read_outputs(self, output_location: str) -> Dict[str, Dict]:
+        """Returns {input file name: InferSNOMEDCT-shaped response} for every output file."""
+
+class ComprehendMedicalJobClient(SnomedctJobClient):
+    """StartSNOMEDCTInferenceJob with inputs and outputs under `s3://bucket/prefix/<run_id>/`."""
+
+    def __init__(self, comprehend, s3, bucket: str, data_access_role_arn: str, prefix: str = "comprehend_jobs/"):
+        self.comprehend = comprehend
+        self.s3 = s3
+        self.bucket = bucket
+        self.data_access_role_arn = data_access_role_arn
+        self.prefix = prefix
+
+    def stage_inputs(self, run_id, files):
+        input_prefix = f"{self.prefix}{run_id}/input/"
+        for name, text in files.items():
+            self.s3.put_object(Bucket=self.bucket, Key=input_prefix + name, Body=text.encode("utf-8"),
+                               ContentType="text/plain")
+        return input_prefix, f"{self.prefix}{run_id}/output/"
+
+    def start(self, run_id, input_location, output_location):
+        response = self.comprehend.start_snomedct_inference_job(
+            InputDataConfig={"S3Bucket": self.bucket, "S3Key": input_location},
+            OutputDataConfig={"S3Bucket": self.bucket, "S3Key": output_location},
+            DataAccessRoleArn=self.data_access_role_arn,
+            JobName=run_id,
+            ClientRequestToken=run_id,  # resubmitting the same run does not start a second job
+            LanguageCode="en",
+        )
+        return response["JobId"]
+
+    def describe(self, job_id):
+        properties = self.comprehend.describe_snomedct_inference_job(JobId=job_id)["ComprehendMedicalAsyncJobProperties"]
+        return properties["JobStatus"], properties.get("Message", "")
+
+    def read_outputs(self, output_location):
+        # Comprehend Medical writes <output>/<account>-SNOMEDCT-<job id>/<input name>.out
+        outputs = {}
+        for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=output_location):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(OUTPUT_SUFFIX):
+                    body = self.s3.get_object(Bucket=self.bucket, Key=obj["Key"])["Body"].read()
+                    outputs[obj["Key"].rsplit("/", 1)[-1][:-len(OUTPUT_SUFFIX)]] = json.loads(body)
+        return outputs
+
+class LocalSnomedctJobClient(SnomedctJobClient):
+    """
+    File-based stand-in for tests and local runs.
+
+    Inputs and outputs live under `directory/<run_id>/`. The job runs the
+    given synchronous `infer(text)` over every input file, and reports
+    IN_PROGRESS for `polls_until_complete` describe calls first.
+    """
+
+    def __init__(self, directory: str, infer: Callable[[str], Dict], polls_until_complete: int = 1):
+        self.directory = directory
+        self.infer = infer
+        self.polls_until_complete = polls_until_complete
+        self._jobs: Dict[str, Dict] = {}
+
+    def stage_inputs(self, run_id, files):
+        input_dir = os.path.join(self.directory, run_id, "input")
+        os.makedirs(input_dir, exist_ok=True)
+        for name, text in files.items():
+            with open(os.path.join(input_dir, name), "w", encoding="utf-8") as f:
+                f.write(text)
+        return input_dir, os.path.join(self.directory, run_id, "output")
+
+    def start(self, run_id, input_location, output_location):
+        job_id = uuid.uuid4().hex
+        os.makedirs(output_location, exist_ok=True)
+        for name in sorted(os.listdir(input_location)):
+            with open(os.path.join(input_location, name), encoding="utf-8") as f:
+                response = self.infer(f.read())
+            with open(os.path.join(output_location, name + OUTPUT_SUFFIX), "w", encoding="utf-8") as f:
+                json.dump(response, f)
+        self._jobs[job_id] = {"polls": 0}
+        return job_id
+
+    def describe(self, job_id):
+        job = self._jobs[job_id]
+        job["polls"] += 1
+        return ("IN_PROGRESS" if job["polls"] <= self.polls_until_complete else "COMPLETED"), ""
+
+    def read_outputs(self, output_location):
+        outputs = {}
+        for name in os.listdir(output_location):
+            if name.endswith(OUTPUT_SUFFIX):
+                with open(os.path.join(output_location, name), encoding="utf-8") as f:
+                    outputs[name[:-len(OUTPUT_SUFFIX)]] = json.load(f)
+        return outputs
+
+def _file_stem(patient_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", patient_id)[:100]
+
+def submit_job(job_client: SnomedctJobClient, patients: Dict[str, List[str]], run_id: Optional[str] = None,
+               max_characters: int = MAX_TEXT_CHARACTERS) -> Dict:
+    """
+    Stages every patient's problem lines as input files and submits one inference job.
+
+    Long problem lists are split into several files on line boundaries, the
+    same way as the synchronous path. The returned state records which file
+    holds which patient's text, and where, so it can be saved between the
+    submitting and the collecting invocation.
+
+    Args:
+        job_client (SnomedctJobClient): Comprehend Medical or the local stand-in.
+        patients (dict): {patient id: [problem lines]}.
+        run_id (str): Names the job and its staging area; generated if omitted.
+
+    Returns:
+        dict: JSON-serializable job state for `collect_job`.
+    """
+    run_id = run_id or time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+    files = {}
+    layout = {}  # patient id -> [[file name, offset of its text in the patient's problem text]]
+    for number, (patient_id, lines) in enumerate(patients.items()):
+        _, chunks = chunk_lines(lines, max_characters)
+        layout[patient_id] = []
+        for part, (offset, text) in enumerate(chunks):
+            name = f"{number:06d}-{_file_stem(patient_id)}-{part:03d}.txt"
+            files[name] = text
+            layout[patient_id].append([name, offset])
+
+    input_location, output_location = job_client.stage_inputs(run_id, files)
+    job_id = job_client.start(run_id, input_location, output_location) if files else None
+    print(json.dumps({"comprehend_job": {"run_id": run_id, "job_id": job_id, "patients": len(patients), "files": len(files)}}))
+    return {"run_id": run_id, "job_id": job_id, "output_location": output_location, "layout": layout}
+
+def collect_job(job_client: SnomedctJobClient, state: Dict,
+                map_to_cdsi: Callable[[str, List[Dict]], Dict]) -> Optional[Dict[str, Dict]]:
+    """
+    Joins a finished job's output back to patient ids.
+
+    Args:
+        job_client (SnomedctJobClient): The client that submitted the job.
+        state (dict): Returned by `submit_job`.
+        map_to_cdsi (Callable): Turns (patient id, entities) into CDSi results.
+
+    Returns:
+        dict or None: None while the job is still running, otherwise
+        {patient id: {"snomed_results": [...], "cdsi_results": {...}}}.
+        Patients whose files produced no output get an "error" instead.
+
+    Raises:
+        RuntimeError: If the job failed or was stopped.
+    """
+    outputs = {}
+    if state["job_id"] is not None:
+        status, message = job_client.describe(state["job_id"])
+        if status in RUNNING_STATUSES:
+            return None
+        if status not in FINISHED_STATUSES:
+            raise RuntimeError(f"SNOMED CT inference job {state['job_id']} ended {status}: {message}")
+        outputs = job_client.read_outputs(state["output_location"])
+
+    results = {}
+    for patient_id, files in state["layout"].items():
+        missing = [name for name, _ in files if name not in outputs]
+        if missing:
+            results[patient_id] = {"error": f"No job output for {', '.join(missing)}"}
+            continue
+        chunks = [(offset, name) for name, offset in files]
+        entities = merge_entities(chunks, [outputs[name] for name, _ in files])
+        results[patient_id] = {"snomed_results": entities, "cdsi_results": map_to_cdsi(patient_id, entities)}
+    return results
+
+def run_job(job_client: SnomedctJobClient, patients: Dict[str, List[str]], map_to_cdsi: Callable[[str, List[Dict]], Dict],
+            poll_seconds: float = 30, timeout_seconds: float = 6 * 3600) -> Dict[str, Dict]:
+    """Submits, polls and collects in one call, for scripts that can wait for the job."""
+    state = submit_job(job_client, patients)
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        results = collect_job(job_client, state, map_to_cdsi)
+        if results is not None:
+            return results
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"SNOMED CT inference job {state['job_id']} still running after {timeout_seconds}s")
+        time.sleep(poll_seconds)
@@ -1,33 +1,131 @@
-import boto3
 import json
 import urllib.parse
-from extract_med import get_patient_meds
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from botocore.exceptions import ClientError
+from extract_med import split_problems
+from comprehend_cache import get_result_cache, infer_snomedct_cached
+from comprehend_jobs import ComprehendMedicalJobClient, collect_job, submit_job
+from ssm_config import get_parameter
+from ccda_parser import parse_ccda
+from s3_streams import open_body
 from snomed_to_cdsi_logic import get_s3_bucket_name, snomed_to_cdsi_mapping_with_confidence
+from aws_clients import get_client
+from throttling import ThrottledClient, is_retryable, is_throttle
 
-client = boto3.client('comprehendmedical')
-dynamodb = boto3.client('dynamodb')
+# Role Comprehend Medical assumes to read staged inputs and write job output
+DATA_ACCESS_ROLE_PARAMETER = "/config/ComprehendMedicalDataAccessRoleArn"
 
-def get_file_from_s3(bucket_name: str, file_key: str) -> str:
+# InferSNOMEDCT calls share one rate limit, adaptive concurrency limit and retry policy per container,
+# set through COMPREHEND_RATE_PER_SECOND, COMPREHEND_BURST, COMPREHEND_MAX_CONCURRENCY and COMPREHEND_MAX_ATTEMPTS
+_comprehend = None
+# API Gateway gives up on a synchronous request after this long; InferSNOMEDCT retries stop in time to answer first
+API_GATEWAY_TIMEOUT_SECONDS = 29
+
+def get_comprehend():
+    global _comprehend
+    if _comprehend is None:
+        _comprehend = ThrottledClient.from_env("comprehendmedical", "COMPREHEND", operations=("infer_snomedct",))
+    return _comprehend
+
+def get_file_from_s3(bucket_name: str, file_key: str):
     """
-    Retrieves a file from S3 as a string.
+    Opens a file in S3 as a stream, decompressing .gz/.zst objects as it is read.
 
     Args:
         bucket_name (str): The name of the S3 bucket.
         file_key (str): The key of the file in the S3 bucket.
 
     Returns:
-        str: The file content as a string, or None if there was an error.
+        io.BufferedReader: The document stream (read lazily by the parser), or None if there was an error.
     """
-    s3 = boto3.client('s3')
+    s3 = get_client('s3')
     try:
         key = urllib.parse.unquote_plus(file_key, encoding='utf-8')
         response = s3.get_object(Bucket=bucket_name, Key=key)
-        file_content = response['Body'].read().decode('utf-8')
-        return file_content
+        return open_body(response, key)
     except Exception as e:
         print(f"Error retrieving file from S3: {e}")
         return None
 
+def read_problems(bucket_name: str, s3_key: str) -> Tuple[List[Dict], List[str]]:
+    """(SNOMED-coded problems, free-text problem lines) of one CCDA, split as the synchronous path does."""
+    xml_content = get_file_from_s3(bucket_name, s3_key)
+    if xml_content is None:
+        raise Exception(f"Could not retrieve {s3_key} from S3")
+    try:
+        return split_problems(parse_ccda(xml_content, ("problems",)))
+    finally:
+        xml_content.close()
+
+def handle_batch(body: Dict) -> Dict:
+    """
+    Submits or collects an asynchronous SNOMED CT inference job.
+
+    `{"patients": {patient id: s3 key}}` extracts every document's problems,
+    stages them and submits the job. The job state is saved next to the
+    staged inputs. `{"run_id": ...}` checks on that job and, once it has
+    finished, writes per-patient SNOMED and CDSi results to S3. Patients
+    whose document cannot be read are left out of the job and reported with
+    an "error" in the results.
+
+    Raises:
+        ValueError: If the body is neither kind of request; the handler returns a 400.
+        FileNotFoundError: If no job was submitted under `run_id`; the handler returns a 404.
+    """
+    patients = body.get("patients")
+    if "patients" in body and not (isinstance(patients, dict) and patients
+                                   and all(isinstance(key, str) for key in patients.values())):
+        raise ValueError("'patients' must map patient ids to the S3 keys of their CCDA documents.")
+    if "run_id" in body and not (isinstance(body["run_id"], str) and body["run_id"]):
+        raise ValueError("'run_id' must be the run id returned when the job was submitted.")
+
+    bucket_name = get_s3_bucket_name()
+    s3 = get_client('s3')
+    job_client = ComprehendMedicalJobClient(get_client('comprehendmedical'), s3, bucket_name, get_parameter(DATA_ACCESS_ROLE_PARAMETER))
+
+    if "patients" in body:
+        def read(s3_key):
+            try:
+                return read_problems(bucket_name, s3_key)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            outcomes = dict(zip(patients, pool.map(read, patients.values())))
+        problems = {patient_id: outcome for patient_id, outcome in outcomes.items() if not isinstance(outcome, Exception)}
+        unreadable = {patient_id: f"Could not read {patients[patient_id]}: {outcome}"
+                      for patient_id, outcome in outcomes.items() if isinstance(outcome, Exception)}
+        # Only free-text problems go into the job; coded ones are kept in its state
+        state = submit_job(job_client, {patient_id: free_text for patient_id, (_, free_text) in problems.items()},
+                           body.get("run_id"))
+        state["coded"] = {patient_id: coded for patient_id, (coded, _) in problems.items()}
+        state["unreadable"] = unreadable
+        s3.put_object(Bucket=bucket_name, Key=f"{job_client.prefix}{state['run_id']}/state.json",
+                      Body=json.dumps(state).encode("utf-8"), ContentType="application/json")
+        return {"status": "SUBMITTED", "run_id": state["run_id"], "job_id": state["job_id"], "patients": len(patients),
+                "unreadable": len(unreadable)}
+
+    run_prefix = f"{job_client.prefix}{body['run_id']}/"
+    try:
+        state = json.loads(s3.get_object(Bucket=bucket_name, Key=run_prefix + "state.json")["Body"].read())
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "NoSuchKey":
+            raise FileNotFoundError(f"Unknown run_id '{body['run_id']}'.") from e
+        raise
+    results = collect_job(job_client, state, lambda patient_id, entities: snomed_to_cdsi_mapping_with_confidence(
+        entities, threshold=0.3, medical_condition_only=True, coded_items=state["coded"][patient_id]))
+    if results is None:
+        return {"status": "IN_PROGRESS", "run_id": state["run_id"], "job_id": state["job_id"]}
+    results.update({patient_id: {"error": error} for patient_id, error in state.get("unreadable", {}).items()})
+
+    results_key = run_prefix + "results.json"
+    s3.put_object(Bucket=bucket_name, Key=results_key, Body=json.dumps(results).encode("utf-8"),
+                  ContentType="application/json")
+    failed = sum(1 for result in results.values() if "error" in result)
+    return {"status": "COMPLETED", "run_id": state["run_id"], "results_key": results_key,
+            "patients": len(results), "failed": failed}
+
 def lambda_handler(event, context):
     """
     Lambda handler function.
@@ -40,6 +138,24 @@ def lambda_handler(event, context):
         dict: A dictionary containing the SNOMED and CDSI results as strings.
     """
     body = json.loads(event.get("body", "{}"))
+    get_comprehend().set_deadline(context, API_GATEWAY_TIMEOUT_SECONDS)
+
+    # Batch mode: one asynchronous SNOMED CT inference job for many patients
+    if "patients" in body or "run_id" in body:
+        try:
+            result = handle_batch(body)
+        except ValueError as e:
+            return {'statusCode': 400, 'body': json.dumps({'error': str(e)})}
+        except FileNotFoundError as e:
+            return {'statusCode': 404, 'body': json.dumps({'error': str(e)})}
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json'
+            },
+            'body': json.dumps(result)
+        }
+
     if "s3_key" not in body:
         raise Exception("Missing 's3_key' in request body")
     
@@ -50,17 +166,40 @@ def lambda_handler(event, context):
 
     xml_content = get_file_from_s3(bucket_name, s3_key)
 
-    if not xml_content:
+    if xml_content is None:
         return {
             'statusCode': 500,
             'body': 'Error: Could not retrieve file from S3'
         }
     
-    patient_records = get_patient_meds(xml_content)  
-    patient_problems = patient_records['problems']
-    patient_problems = "\n".join(patient_problems)
-    comprehend = client.infer_snomedct(Text=patient_problems)
-    cdsi = snomed_to_cdsi_mapping_with_confidence(comprehend["Entities"], threshold=0.3, medical_condition_only=True)
+    # Parse the document once; every pipeline below works from the same coded entries
+    try:
+        document = parse_ccda(xml_content)
+    finally:
+        xml_content.close()  # Stop the download if parsing finished early
+
+    # Problems the document already codes in SNOMED are mapped directly; only free text needs Comprehend
+    coded_problems, free_text_problems = split_problems(document)
+    # Only problem lines not already in the cache are sent to InferSNOMEDCT, in
+    # chunks under its size limit and concurrently
+    try:
+        comprehend = infer_snomedct_cached(get_comprehend(), free_text_problems, get_result_cache())
+    except Exception as e:
+        if not is_retryable(e):
+            raise
+        # Still throttled or unavailable after the retries (or out of time for more): tell the caller
+        # to back off rather than failing the request
+        return {
+            'statusCode': 429 if is_throttle(e) else 503,
+            'headers': {
+                'Retry-After': '10'
+            },
+            'body': json.dumps({'error': f"Comprehend Medical is {'throttling requests' if is_throttle(e) else 'unavailable'}, retry later. {e}"})
+        }
+    finally:
+        get_comprehend().log_metrics("comprehend_throttling")
+    cdsi = snomed_to_cdsi_mapping_with_confidence(comprehend["Entities"], threshold=0.3, medical_condition_only=True,
+                                                  coded_items=coded_problems)
 
     return {
         'statusCode': 200,
@@ -1,48 +1,52 @@
 import re
-import xml.etree.ElementTree as ET
-from typing import List, Dict
-
-def strip_namespaces(element):
-    """Remove namespace prefixes from tags."""
-    for elem in element.iter():
-        if '}' in elem.tag:
-            elem.tag = elem.tag.split('}', 1)[1]
-
-def extract_table_meds_or_problems(section_element: ET.Element) -> List[str]:
-    """Extract meds or problems from a <section> element containing a <table>."""
-    items = []
-    table = section_element.find(".//table")
-
-    if table is not None:
-        for tr in table.findall(".//tr"):
-            cells = tr.findall("td")
-            if len(cells) >= 4:
-                stop_date = (cells[1].text or "").strip()
-                if not stop_date:
-                    description = (cells[2].text or "").strip()
-                    description = re.sub(r'\s*\(.*?\)', '', description)  # Strip (notes) if needed
-                    items.append(description)
-
-    return items
-
-def get_patient_meds(xml_content: str) -> Dict[str, List[str]]:
-    root = ET.fromstring(xml_content)
-    strip_namespaces(root)
-
-    med_info = {
-        "medications": [],
-        "problems": [],
+from ccda_parser import CcdaDocument, CodedEntry, is_valid_snomed_concept_id, parse_ccda
+from typing import List, Dict, Tuple
+
+def clean_description(display_name: str) -> str:
+    """Strips (notes) such as "(disorder)" from a description."""
+    return re.sub(r'\s*\(.*?\)', '', display_name.strip())
+
+def current_descriptions(entries: List[CodedEntry]) -> List[str]:
+    """Descriptions of entries without a stop date, with (notes) such as "(disorder)" stripped."""
+    return [clean_description(entry.display_name) for entry in entries if entry.is_current]
+
+def split_problems(document: CcdaDocument) -> Tuple[List[Dict], List[str]]:
+    """
+    Splits current problems into ones the document already codes and free text.
+
+    Problems carrying a valid SNOMED CT concept id need no inference; they
+    come back as items in the shape `extract_snomed_codes_with_confidence`
+    produces, with confidence 1.0. Every other current problem is returned
+    as a description line for Comprehend Medical.
+    """
+    coded = []
+    free_text = []
+    for entry in document.problems:
+        if not entry.is_current:
+            continue
+        description = clean_description(entry.display_name)
+        if entry.is_snomed and is_valid_snomed_concept_id(entry.code):
+            coded.append({
+                "code": entry.code,
+                "description": entry.display_name,
+                "confidence": 1.0,
+                "text_reference": description,
+            })
+        elif description:
+            free_text.append(description)
+    return coded, free_text
+
+def get_patient_meds(xml_content) -> Dict[str, List[str]]:
+    """
+    Extract current medications and problems from a CCDA.
+
+    `xml_content` may be XML text, a binary stream such as an S3 body, or a
+    CcdaDocument that has already been parsed, so one parse can serve every
+    pipeline in a request.
+    """
+    document = xml_content if isinstance(xml_content, CcdaDocument) else parse_ccda(xml_content)
+
+    return {
+        "medications": current_descriptions(document.medications),
+        "problems": current_descriptions(document.problems),
     }
-
-    # Walk through every section to find medications & problems
-    for section in root.iter("section"):
-        # Check if there's a <title> to identify the section
-        title_element = section.find("title")
-        title = (title_element.text or "").strip().lower() if title_element is not None else ""
-
-        if "medication" in title:
-            med_info["medications"] = extract_table_meds_or_problems(section)
-        elif "problem" in title:
-            med_info["problems"] = extract_table_meds_or_problems(section)
-
-    return med_info
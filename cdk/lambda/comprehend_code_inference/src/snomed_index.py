@@ -0,0 +1,145 @@
+import mmap
+import struct
+import zlib
+from bisect import bisect_left
+from typing import Dict, Iterable, List
+
+# Binary layout (little-endian), every section 8-byte aligned:
+#   header   <4sHHIIII  magic, format version, reserved, key count, entry count, string count, data crc32
+#   keys     int64[key count]          sorted SNOMED codes
+#   offsets  uint32[key count + 1]     entry range for each key
+#   entries  uint32[entry count * 3]   (cdsi_code, title string id, description string id)
+#   strings  uint32[string count + 1]  byte offsets into the blob, then the UTF-8 blob itself
+MAGIC = b"SCDX"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHIIII")
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+class SnomedCdsiIndex:
+    """Memory-mapped, read-only SNOMED -> CDSi index built by `write_index`."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, _, key_count, entry_count, string_count, crc = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a SNOMED-to-CDSi index")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has index format {version}, expected {FORMAT_VERSION}")
+
+        offset = _align(HEADER.size)
+        self._keys = view[offset:offset + 8 * key_count].cast("q")
+        offset = _align(offset + 8 * key_count)
+        self._offsets = view[offset:offset + 4 * (key_count + 1)].cast("I")
+        offset = _align(offset + 4 * (key_count + 1))
+        self._entries = view[offset:offset + 12 * entry_count].cast("I")
+        offset = _align(offset + 12 * entry_count)
+        self._string_offsets = view[offset:offset + 4 * (string_count + 1)].cast("I")
+        offset = _align(offset + 4 * (string_count + 1))
+        self._blob = view[offset:]
+
+        self._strings: Dict[int, str] = {}
+        self.version = f"{FORMAT_VERSION}-{crc:08x}"
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, snomed_code) -> bool:
+        return self._position(int(snomed_code)) is not None
+
+    def keys(self):
+        return self._keys
+
+    def _position(self, snomed_code: int):
+        i = bisect_left(self._keys, snomed_code)
+        if i < len(self._keys) and self._keys[i] == snomed_code:
+            return i
+        return None
+
+    def _string(self, string_id: int) -> str:
+        # Titles and descriptions are interned, so decode each one only once
+        value = self._strings.get(string_id)
+        if value is None:
+            start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+            value = self._strings[string_id] = bytes(self._blob[start:end]).decode("utf-8")
+        return value
+
+    def lookup(self, snomed_code) -> List[Dict]:
+        """Returns the CDSi rows for one SNOMED code, ordered by CDSi code."""
+        i = self._position(int(snomed_code))
+        if i is None:
+            return []
+        rows = []
+        for entry in range(self._offsets[i], self._offsets[i + 1]):
+            cdsi_code, title_id, description_id = self._entries[3 * entry:3 * entry + 3]
+            rows.append({
+                "cdsi_code": cdsi_code,
+                "observation_title": self._string(title_id),
+                "snomed_description": self._string(description_id),
+            })
+        return rows
+
+    def lookup_many(self, snomed_codes: Iterable) -> Dict[int, List[Dict]]:
+        """Same contract as `snomed_lookup.batch_lookup_snomed_codes`."""
+        return {code: self.lookup(code) for code in {int(c) for c in snomed_codes}}
+
+def write_index(path: str, mappings: Iterable[Dict]) -> int:
+    """
+    Compiles SNOMED -> CDSi mapping rows into an index file.
+
+    Args:
+        path (str): Output file.
+        mappings (Iterable[Dict]): Rows with `snomed_code`, `cdsi_code`,
+            `snomed_description` and `observation_title`.
+
+    Returns:
+        int: The number of distinct SNOMED codes written.
+    """
+    # (snomed, cdsi) is the table's primary key, so later rows win like put_item
+    rows = {}
+    for m in mappings:
+        rows[(int(m["snomed_code"]), int(m["cdsi_code"]))] = (m["observation_title"], m["snomed_description"])
+
+    strings: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    keys, offsets, entries = [], [0], []
+    for (snomed_code, cdsi_code), (title, description) in sorted(rows.items()):
+        if not keys or keys[-1] != snomed_code:
+            if keys:
+                offsets.append(len(entries) // 3)
+            keys.append(snomed_code)
+        entries.extend((cdsi_code, intern(title), intern(description)))
+    offsets.append(len(entries) // 3)
+    if not keys:
+        offsets = [0]
+
+    encoded = [s.encode("utf-8") for s in strings]
+    string_offsets = [0]
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+
+    sections = [
+        struct.pack(f"<{len(keys)}q", *keys),
+        struct.pack(f"<{len(offsets)}I", *offsets),
+        struct.pack(f"<{len(entries)}I", *entries),
+        struct.pack(f"<{len(string_offsets)}I", *string_offsets),
+        b"".join(encoded),
+    ]
+    crc = 0
+    for section in sections:
+        crc = zlib.crc32(section, crc)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(keys), len(entries) // 3, len(encoded), crc))
+        for section in sections:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(section)
+
+    return len(keys)
@@ -0,0 +1,111 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+# A CCDA usually carries 50-200 codes; 8 workers x 25 codes keeps a request
+# well inside the Lambda timeout without tripping on-demand table throttling.
+MAX_WORKERS = 8
+CHUNK_SIZE = 25
+MAX_RETRIES = 4
+BASE_BACKOFF_SECONDS = 0.05
+
+RETRYABLE_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "InternalServerError",
+    "ServiceUnavailable",
+}
+
+def _is_retryable(error: Exception) -> bool:
+    """Return True for DynamoDB errors that are worth retrying."""
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+
+def _item_to_row(item: Dict) -> Dict:
+    """Flatten a DynamoDB item into a plain mapping row."""
+    return {
+        "cdsi_code": int(item["cdsi_code"]["N"]),
+        "observation_title": item.get("observation_title", {}).get("S", ""),
+        "snomed_description": item.get("snomed_description", {}).get("S", ""),
+    }
+
+def _query_snomed_code(client, table_name: str, snomed_code: int) -> List[Dict]:
+    """Query every CDSi row for one SNOMED code, following pagination."""
+    kwargs = {
+        "TableName": table_name,
+        "KeyConditionExpression": "snomed_code = :snomed_code",
+        "ExpressionAttributeValues": {
+            ":snomed_code": {"N": str(snomed_code)}  # Convert number to string for DynamoDB query
+        },
+    }
+    rows = []
+    while True:
+        response = client.query(**kwargs)
+        rows.extend(_item_to_row(item) for item in response.get("Items", []))
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return rows
+        kwargs["ExclusiveStartKey"] = last_key
+
+def _query_chunk(client, table_name: str, chunk: List[int]) -> Tuple[Dict[int, List[Dict]], List[int]]:
+    """Look up a chunk of codes, returning (found rows, codes to retry)."""
+    found = {}
+    unprocessed = []
+    for snomed_code in chunk:
+        try:
+            found[snomed_code] = _query_snomed_code(client, table_name, snomed_code)
+        except Exception as e:
+            if not _is_retryable(e):
+                raise
+            unprocessed.append(snomed_code)
+    return found, unprocessed
+
+def batch_lookup_snomed_codes(
+    client,
+    table_name: str,
+    snomed_codes: Iterable,
+    max_workers: int = MAX_WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+    max_retries: int = MAX_RETRIES,
+) -> Dict[int, List[Dict]]:
+    """
+    Looks up many SNOMED codes in the SNOMED-to-CDSi table at once.
+
+    Codes are deduplicated, split into chunks and queried with bounded
+    parallelism. Throttled codes are collected and retried with exponential
+    backoff and jitter.
+
+    Args:
+        client: A boto3 DynamoDB client (or anything with the same `query`).
+        table_name (str): The SNOMED-to-CDSi mapping table.
+        snomed_codes (Iterable): SNOMED codes as ints or numeric strings.
+
+    Returns:
+        dict: SNOMED code -> list of rows with `cdsi_code`, `observation_title`
+        and `snomed_description`. Codes without a mapping map to an empty list.
+    """
+    pending = sorted({int(code) for code in snomed_codes})
+    results: Dict[int, List[Dict]] = {}
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        if attempt:
+            time.sleep(BASE_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+        # Spread small requests across all workers instead of one full chunk
+        size = min(chunk_size, -(-len(pending) // max_workers))
+        chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+        unprocessed = []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            for found, retry in pool.map(lambda chunk: _query_chunk(client, table_name, chunk), chunks):
+                results.update(found)
+                unprocessed.extend(retry)
+        pending = unprocessed
+
+    if pending:
+        raise RuntimeError(f"DynamoDB lookup still throttled after {max_retries} retries for {len(pending)} SNOMED codes")
+
+    return results
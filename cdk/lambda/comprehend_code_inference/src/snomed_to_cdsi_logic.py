@@ -1,15 +1,86 @@
-import boto3
-
-dynamodb = boto3.client('dynamodb')
-ssm = boto3.client('ssm')
+import os
+import json
+from snomed_lookup import batch_lookup_snomed_codes
+from snomed_index import SnomedCdsiIndex
+from snomed_key_filter import load_key_filter
+from ssm_config import get_parameters
+from aws_clients import get_client
+
+# Fetched together in one GetParameters call and cached across warm invocations
+BUCKET_NAME_PARAMETER = "/config/SSMSNOMEDToCDSiBucketName"
+TABLE_NAME_PARAMETER = "/config/DynamoSNOMEDToCDSiTableName"
+
+# "dynamodb" (default) queries the mapping table, "index" uses the compiled
+# in-process index built by SNOMED_to_CDSi/one_time_parser/build_index.py
+LOOKUP_BACKEND = os.environ.get("SNOMED_CDSI_BACKEND", "dynamodb")
+INDEX_PATH = os.environ.get(
+    "SNOMED_CDSI_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "snomed_cdsi.idx")
+)
+_index = None
+
+# Exact set of mapped SNOMED codes (written by build_index.py). Unmapped codes
+# are dropped before any lookup; without the file every code is looked up.
+KEY_FILTER_PATH = os.environ.get(
+    "SNOMED_KEY_FILTER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "snomed_keys.bin")
+)
+_key_filter = None
+_key_filter_loaded = False
+
+# Cumulative per container, also logged per lookup to show the filter hit rate
+LOOKUP_STATS = {"looked_up": 0, "skipped": 0}
 
 def get_s3_bucket_name():
-    response = ssm.get_parameter(Name="/config/SSMSNOMEDToCDSiBucketName")
-    return response["Parameter"]["Value"]
+    return get_parameters(BUCKET_NAME_PARAMETER, TABLE_NAME_PARAMETER)[BUCKET_NAME_PARAMETER]
 
 def get_mapping_table():
-    response = ssm.get_parameter(Name="/config/DynamoSNOMEDToCDSiTableName")
-    return response["Parameter"]["Value"]
+    return get_parameters(BUCKET_NAME_PARAMETER, TABLE_NAME_PARAMETER)[TABLE_NAME_PARAMETER]
+
+def get_index() -> SnomedCdsiIndex:
+    """Loads the compiled SNOMED-to-CDSi index once per container."""
+    global _index
+    if _index is None:
+        if not os.path.exists(INDEX_PATH):
+            raise FileNotFoundError(
+                f"SNOMED_CDSI_BACKEND=index but the compiled index {INDEX_PATH} is missing. Build it with "
+                f"`python3 SNOMED_to_CDSi/one_time_parser/build_index.py <Coded Observations CSV>` and redeploy, "
+                f"or set SNOMED_CDSI_BACKEND=dynamodb")
+        _index = SnomedCdsiIndex(INDEX_PATH)
+        print(f"Loaded SNOMED-to-CDSi index {INDEX_PATH} (version {_index.version}, {len(_index)} codes)")
+    return _index
+
+def get_key_filter():
+    """Loads the mapped-code filter once per container, or None if it isn't shipped."""
+    global _key_filter, _key_filter_loaded
+    if not _key_filter_loaded:
+        _key_filter_loaded = True
+        if os.path.exists(KEY_FILTER_PATH):
+            _key_filter = load_key_filter(KEY_FILTER_PATH)
+            print(f"Loaded SNOMED key filter {KEY_FILTER_PATH} ({len(_key_filter)} mapped codes)")
+        else:
+            print(f"No SNOMED key filter at {KEY_FILTER_PATH}, looking up every code")
+    return _key_filter
+
+def lookup_snomed_codes(snomed_codes):
+    """Resolves SNOMED codes to CDSi rows with the configured backend."""
+    snomed_codes = {int(code) for code in snomed_codes}
+    requested = len(snomed_codes)
+
+    key_filter = get_key_filter()
+    if key_filter is not None:
+        snomed_codes &= key_filter
+
+    skipped = requested - len(snomed_codes)
+    LOOKUP_STATS["looked_up"] += len(snomed_codes)
+    LOOKUP_STATS["skipped"] += skipped
+    print(json.dumps({"snomed_lookup": {"looked_up": len(snomed_codes), "skipped": skipped, "totals": LOOKUP_STATS}}))
+
+    if not snomed_codes:
+        return {}
+    if LOOKUP_BACKEND == "index":
+        return get_index().lookup_many(snomed_codes)
+    return batch_lookup_snomed_codes(get_client('dynamodb'), get_mapping_table(), snomed_codes)
 
 def extract_snomed_codes_with_confidence(snomed_results, threshold=0.5, medical_condition_only=True):
     """Extract SNOMED codes and retain only the highest confidence entry for each code."""
@@ -35,96 +106,62 @@ def extract_snomed_codes_with_confidence(snomed_results, threshold=0.5, medical_
                 
     return list(snomed_map.values())
 
-def snomed_to_cdsi_mapping_with_confidence(snomed_results, threshold=0.5, medical_condition_only=True):
-    """Maps SNOMED codes to CDSi codes, ensuring only the highest confidence match per SNOMED code."""
-    table_name = get_mapping_table()
-    cdsi_dict = {}
-
-    # Extracted and grouped SNOMED codes with highest confidence
-    snomed_list = extract_snomed_codes_with_confidence(snomed_results, threshold, medical_condition_only)
-
-    for snomed_item in snomed_list:
-        snomed_code = snomed_item["code"]
-        snomed_description = snomed_item["description"]
-        confidence = snomed_item["confidence"]
-        text_reference = snomed_item["text_reference"]
-
-        # Query DynamoDB for CDSi codes linked to this SNOMED code
-        query = dynamodb.query(
-            TableName=table_name,
-            KeyConditionExpression='snomed_code = :snomed_code',
-            ExpressionAttributeValues={
-                ':snomed_code': {'N': str(snomed_code)}
-            }
-        )
+def snomed_to_cdsi_mapping_with_confidence(snomed_results, threshold=0.5, medical_condition_only=True, coded_items=None):
+    """
+    Maps Comprehend SNOMED results, and optionally codes taken straight from
+    the document (`coded_items`), to CDSi codes in one lookup.
 
-        for item in query.get('Items', []):
-            cdsi_code = int(item['cdsi_code']['N'])
-            observation_title = item.get('observation_title', {}).get('S', '')
-
-            if cdsi_code not in cdsi_dict:
-                cdsi_dict[cdsi_code] = {
-                    "observation_title": observation_title,
-                    "snomed_references": {}
-                }
-
-            # Either add or replace if the new entry has higher confidence
-            if (snomed_code not in cdsi_dict[cdsi_code]["snomed_references"]) or (
-                confidence > cdsi_dict[cdsi_code]["snomed_references"][snomed_code]["confidence"]
-            ):
-                cdsi_dict[cdsi_code]["snomed_references"][snomed_code] = {
-                    "snomed_code": snomed_code,
-                    "snomed_description": snomed_description,
-                    "confidence": confidence,
-                    "text_reference": text_reference
-                }
-
-    # Convert nested dictionaries to lists for final output
-    for cdsi_code, data in cdsi_dict.items():
-        data["snomed_references"] = list(data["snomed_references"].values())
-
-    return cdsi_dict
-
-def snomed_to_cdsi_mapping_with_confidence(snomed_results, threshold=0.5, medical_condition_only=True):
-    table_name = get_mapping_table()
+    Every SNOMED reference and CDSi match records how it was resolved:
+    "ccda_code" for codes the document carried, "comprehend" for inferred ones.
+    """
     cdsi_dict = {}
 
     # Extract SNOMED codes with confidence filtering and optional category filtering
-    snomed_list = extract_snomed_codes_with_confidence(snomed_results, threshold, medical_condition_only)
+    snomed_list = [dict(item, resolved_by="ccda_code") for item in coded_items or []]
+    snomed_list += [dict(item, resolved_by="comprehend")
+                    for item in extract_snomed_codes_with_confidence(snomed_results, threshold, medical_condition_only)]
+
+    # Look up every extracted code in one batched, parallel pass
+    rows_by_code = lookup_snomed_codes([item["code"] for item in snomed_list])
+
+    seen = set()  # (cdsi_code, snomed_reference) pairs already added
 
     for snomed_item in snomed_list:
         snomed_code = snomed_item["code"]
         snomed_description = snomed_item["description"]
         confidence = snomed_item["confidence"]
         text_reference = snomed_item["text_reference"]
+        resolved_by = snomed_item["resolved_by"]
 
-        # Query DynamoDB for CDSi codes linked to this SNOMED code
-        query = dynamodb.query(
-            TableName=table_name,
-            KeyConditionExpression='snomed_code = :snomed_code',
-            ExpressionAttributeValues={
-                ':snomed_code': {'N': str(snomed_code)}
-            }
-        )
-
-        for item in query.get('Items', []):
-            cdsi_code = int(item['cdsi_code']['N'])
-            observation_title = item.get('observation_title', {}).get('S', '')
+        for row in rows_by_code.get(int(snomed_code), []):
+            cdsi_code = row["cdsi_code"]
+            observation_title = row["observation_title"]
 
             if cdsi_code not in cdsi_dict:
                 cdsi_dict[cdsi_code] = {
                     "observation_title": observation_title,
-                    "snomed_references": []
+                    "snomed_references": [],
+                    "resolved_by": []
                 }
 
             snomed_reference = {
                 "snomed_code": int(snomed_code),
                 "snomed_description": snomed_description,
                 "confidence": confidence,
-                "text_reference": text_reference
+                "text_reference": text_reference,
+                "resolved_by": resolved_by
             }
 
-            if snomed_reference not in cdsi_dict[cdsi_code]["snomed_references"]:
+            key = (cdsi_code, int(snomed_code), snomed_description, confidence, text_reference)
+            if key not in seen:
+                seen.add(key)
                 cdsi_dict[cdsi_code]["snomed_references"].append(snomed_reference)
+                if resolved_by not in cdsi_dict[cdsi_code]["resolved_by"]:
+                    cdsi_dict[cdsi_code]["resolved_by"].append(resolved_by)
 
     return cdsi_dict
+
+# Map the index during the init phase so the first request doesn't pay for it
+if LOOKUP_BACKEND == "index":
+    get_index()
+get_key_filter()
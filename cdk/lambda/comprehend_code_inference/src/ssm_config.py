@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Dict
+
+import boto3
+
+# How long a fetched value is served before it is revalidated
+TTL_SECONDS = float(os.environ.get("CONFIG_TTL_SECONDS", "300"))
+# How long a request waits on a revalidation before falling back to the stale value
+REFRESH_TIMEOUT_SECONDS = float(os.environ.get("CONFIG_REFRESH_TIMEOUT_SECONDS", "0.5"))
+# GetParameters accepts at most 10 names per call
+MAX_NAMES_PER_CALL = 10
+
+# Created on first fetch, so importing this module makes no AWS calls
+_ssm = None
+
+# Module level, so the cache survives warm invocations of the same container
+_cache: Dict[str, tuple] = {}  # name -> (value, fetched_at)
+_inflight = {}  # frozenset(names) -> Future
+_lock = threading.RLock()
+_refresher = ThreadPoolExecutor(max_workers=1)
+
+def _env_override(name: str):
+    """`/config/MODEL_ID` can be overridden with the environment variable `CONFIG_MODEL_ID`."""
+    return os.environ.get("CONFIG_" + name.rsplit("/", 1)[-1])
+
+def _ssm_client():
+    global _ssm
+    with _lock:
+        if _ssm is None:
+            _ssm = boto3.client("ssm")
+        return _ssm
+
+def _fetch(names) -> Dict[str, str]:
+    """Fetches parameters from SSM in as few GetParameters calls as possible."""
+    names = list(names)
+    values = {}
+    ssm = _ssm_client()
+    for i in range(0, len(names), MAX_NAMES_PER_CALL):
+        response = ssm.get_parameters(Names=names[i:i + MAX_NAMES_PER_CALL], WithDecryption=True)
+        if response.get("InvalidParameters"):
+            print(f"SSM parameters not found: {', '.join(response['InvalidParameters'])}")
+        for parameter in response["Parameters"]:
+            values[parameter["Name"]] = parameter["Value"]
+
+    fetched_at = time.monotonic()
+    with _lock:
+        for name, value in values.items():
+            _cache[name] = (value, fetched_at)
+    return values
+
+def _revalidate(names) -> Dict[str, str]:
+    """Refreshes stale parameters, giving up on waiting after REFRESH_TIMEOUT_SECONDS."""
+    key = frozenset(names)
+    with _lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _inflight[key] = _refresher.submit(_fetch, names)
+            future.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    try:
+        return future.result(timeout=REFRESH_TIMEOUT_SECONDS)
+    except TimeoutError:
+        print(f"SSM slow to respond, serving stale config for {sorted(names)}")
+    except Exception as e:
+        print(f"Error refreshing config from SSM, serving stale values: {e}")
+    return {}
+
+def get_parameters(*names: str) -> Dict[str, str]:
+    """
+    Returns SSM parameter values, cached in memory for TTL_SECONDS.
+
+    Values are resolved in this order: a `CONFIG_<last path segment>`
+    environment variable, the in-memory cache, then SSM. Missing names are
+    fetched together in one batch. Expired names are revalidated, but if SSM
+    is slow or failing the last known value is returned instead.
+
+    Args:
+        *names (str): Full SSM parameter names, e.g. "/config/MODEL_ID".
+
+    Returns:
+        dict: Parameter name -> value.
+    """
+    values = {}
+    missing, stale = [], []
+    now = time.monotonic()
+
+    for name in names:
+        override = _env_override(name)
+        if override is not None:
+            values[name] = override
+            continue
+
+        cached = _cache.get(name)
+        if cached is None:
+            missing.append(name)
+        else:
+            values[name] = cached[0]
+            if now - cached[1] > TTL_SECONDS:
+                stale.append(name)
+
+    if missing:
+        # Nothing to fall back on, so fetch synchronously (and refresh stale ones in the same call)
+        values.update(_fetch(missing + stale))
+    elif stale:
+        values.update(_revalidate(stale))
+
+    return values
+
+def get_parameter(name: str) -> str:
+    values = get_parameters(name)
+    if name not in values:
+        raise KeyError(f"SSM parameter {name} not found")
+    return values[name]
@@ -0,0 +1,135 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# SNOMED semantic tags and filler words that carry no matching signal
+STOPWORDS = frozenset("""
+a an and as at by for from in into of on or the to with without due
+disorder finding situation procedure observable entity regime therapy event qualifier value
+history status patient
+""".split())
+
+# Clinical synonyms and abbreviations; every term in a group expands to the others
+SYNONYM_GROUPS = [
+    ["hypertension", "hypertensive", "high blood pressure", "htn"],
+    ["diabetes", "diabetic", "dm"],
+    ["myocardial infarction", "heart attack", "mi"],
+    ["cerebrovascular accident", "stroke", "cva"],
+    ["chronic obstructive pulmonary disease", "copd", "emphysema", "chronic bronchitis"],
+    ["chronic kidney disease", "ckd", "renal disease", "kidney disease", "renal failure", "kidney failure"],
+    ["end stage renal disease", "esrd", "dialysis"],
+    ["human immunodeficiency virus", "hiv", "aids"],
+    ["immunodeficiency", "immunocompromised", "immunosuppression", "immunosuppressed"],
+    ["asplenia", "splenectomy", "absent spleen", "asplenic"],
+    ["pregnancy", "pregnant", "gestation"],
+    ["liver disease", "hepatic disease", "cirrhosis", "chronic hepatitis"],
+    ["heart disease", "cardiac disease", "heart failure", "cardiomyopathy", "coronary"],
+    ["lung disease", "pulmonary disease", "asthma"],
+    ["cancer", "malignant", "malignancy", "neoplasm", "carcinoma", "leukemia", "lymphoma"],
+    ["transplant", "transplantation", "graft"],
+    ["obesity", "obese", "body mass index"],
+    ["alcoholism", "alcohol dependence", "alcohol abuse"],
+    ["anemia", "sickle cell"],
+    ["cochlear implant", "cochlear implants"],
+    ["cerebrospinal fluid leak", "csf leak"],
+    ["hepatitis b", "hbv"],
+    ["hepatitis c", "hcv"],
+    ["allergy", "allergic", "anaphylaxis", "hypersensitivity"],
+]
+
+def _stem(token: str) -> str:
+    """A light suffix stripper, enough to join plural and adjective forms."""
+    if len(token) > 4:
+        if token.endswith("ies"):
+            return token[:-3] + "y"
+        if token.endswith("es") and not token.endswith("ses"):
+            return token[:-2]
+        if token.endswith("s") and not token.endswith("ss"):
+            return token[:-1]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    # Codes and dates are numbers; they never match condition wording
+    return [_stem(token) for token in TOKEN_PATTERN.findall(text.lower())
+            if token not in STOPWORDS and not token.isdigit()]
+
+def _synonym_table() -> Dict[Tuple[str, ...], List[List[str]]]:
+    """Tokenized phrase -> tokenized phrases of the rest of its group."""
+    table = defaultdict(list)
+    for group in SYNONYM_GROUPS:
+        phrases = [tuple(tokenize(term)) for term in group]
+        for phrase in phrases:
+            table[phrase].extend(list(other) for other in phrases if other != phrase)
+    return dict(table)
+
+SYNONYMS = _synonym_table()
+LONGEST_SYNONYM = max(len(phrase) for phrase in SYNONYMS)
+
+def expand_query(tokens: List[str]) -> List[str]:
+    """Adds the tokens of every synonym of any phrase found in `tokens`."""
+    expanded = list(tokens)
+    for start in range(len(tokens)):
+        for length in range(1, LONGEST_SYNONYM + 1):
+            phrase = tuple(tokens[start:start + length])
+            if len(phrase) == length and phrase in SYNONYMS:
+                for synonym in SYNONYMS[phrase]:
+                    expanded.extend(synonym)
+    return expanded
+
+class Bm25Index:
+    """Okapi BM25 over pre-tokenized documents, with an inverted index of term frequencies."""
+
+    def __init__(self, documents: Sequence[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lengths = [len(tokens) for tokens in documents]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, tokens in enumerate(documents):
+            for term, frequency in Counter(tokens).items():
+                self.postings[term].append((doc_id, frequency))
+        count = len(documents)
+        self.idf = {term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, docs in self.postings.items()}
+
+    def scores(self, query: Iterable[str]) -> Dict[int, float]:
+        scores: Dict[int, float] = defaultdict(float)
+        for term, query_frequency in Counter(query).items():
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, frequency in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.average_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm) * min(query_frequency, 2)
+        return scores
+
+class CdsiRetriever:
+    """
+    Picks the CDSi rows most likely to match a patient's conditions.
+
+    Each row is indexed on its Observation Title and SNOMED descriptions.
+    Every condition line is a separate query, expanded with synonyms, and
+    contributes its top `k` rows; the union keeps the CSV's row order.
+    """
+
+    def __init__(self, headers: List[str], rows: List[List[str]]):
+        self.headers = headers
+        self.rows = rows
+        code_column = headers.index("Observation Code") if "Observation Code" in headers else None
+        documents = [tokenize(" ".join(value for i, value in enumerate(row) if i != code_column)) for row in rows]
+        self.index = Bm25Index(documents)
+
+    def select(self, condition_lines: Iterable[str], k: int = 5, min_score: float = 1.0) -> List[int]:
+        """Row indexes (ascending) of the top `k` rows for each condition line."""
+        selected = set()
+        for line in condition_lines:
+            # Drop the "YYYY-MM-DD - YYYY-MM-DD :" prefix of the EHR text format
+            text = line.split(":", 1)[-1]
+            query = expand_query(tokenize(text))
+            if not query:
+                continue
+            ranked = sorted(self.index.scores(query).items(), key=lambda item: (-item[1], item[0]))
+            selected.update(doc_id for doc_id, score in ranked[:k] if score >= min_score)
+        return sorted(selected)
@@ -1,39 +1,182 @@
 import json
-import boto3
 import csv
 import io
 import os
 import re
-
-# AWS Clients
-s3_client = boto3.client("s3")
-bedrock_client = boto3.client("bedrock-runtime", region_name="us-west-2")
-ssm_client = boto3.client("ssm")
-
-# ✅ Fetch environment variables from SSM Parameter Store
-def get_ssm_parameter(name):
-    """Retrieve parameter from AWS Systems Manager (SSM)."""
-    response = ssm_client.get_parameter(Name=name, WithDecryption=True)
-    return response["Parameter"]["Value"]
-
-BUCKET_NAME = get_ssm_parameter(os.environ["SSM_BUCKET_NAME"])
-MODEL_ID = get_ssm_parameter(os.environ["SSM_MODEL_ID"])
-STATIC_CDSi_KEY = get_ssm_parameter(os.environ["SSM_STATIC_CDSi_KEY"])
-
-def load_static_cdsi():
-    """Loads the static CSV file from S3 and returns its data."""
-    cdsi_obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=STATIC_CDSi_KEY)
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from ssm_config import get_parameter, get_parameters
+from aws_clients import get_client
+from s3_streams import open_text
+from cdsi_retrieval import CdsiRetriever
+from llm_batch import BedrockBatchJobClient, collect_job, submit_job
+from llm_cache import classification_key, get_classification_cache
+from structured_output import (MATCHES_TOOL, TOOL_NAME, matches_by_condition, matches_by_line, numbered_conditions,
+                               parse_matches)
+from throttling import ThrottledClient, is_retryable, is_throttle
+
+# AWS clients come from aws_clients.get_client, created on first use; Bedrock is called in this region
+BEDROCK_REGION = "us-west-2"
+
+# Model calls share one rate limit, adaptive concurrency limit and retry policy per container,
+# set through BEDROCK_RATE_PER_SECOND, BEDROCK_BURST, BEDROCK_MAX_CONCURRENCY and BEDROCK_MAX_ATTEMPTS
+_bedrock_runtime = None
+# Seconds a caller is asked to wait (Retry-After) when Bedrock is still throttling after every retry
+THROTTLED_RETRY_AFTER_SECONDS = os.environ.get("THROTTLED_RETRY_AFTER_SECONDS", "10")
+# API Gateway gives up on a synchronous request after this long; Bedrock retries stop in time to answer first
+API_GATEWAY_TIMEOUT_SECONDS = 29
+
+def get_bedrock_runtime():
+    global _bedrock_runtime
+    if _bedrock_runtime is None:
+        _bedrock_runtime = ThrottledClient.from_env("bedrock-runtime", "BEDROCK", region_name=BEDROCK_REGION,
+                                                    operations=("invoke_model", "invoke_model_with_response_stream"))
+    return _bedrock_runtime
+
+# ✅ Configuration from SSM Parameter Store, resolved on first use (one cached GetParameters call)
+CONFIG_PARAMETERS = ("SSM_BUCKET_NAME", "SSM_MODEL_ID", "SSM_STATIC_CDSi_KEY")
+
+def _config(env_name):
+    return get_parameters(*(os.environ[name] for name in CONFIG_PARAMETERS))[os.environ[env_name]]
+
+def get_bucket_name():
+    return _config("SSM_BUCKET_NAME")
+
+def get_model_id():
+    return _config("SSM_MODEL_ID")
+
+def get_static_cdsi_key():
+    return _config("SSM_STATIC_CDSi_KEY")
+
+# Parsed CDSi reference, kept across warm invocations and revalidated by ETag
+CDSI_REVALIDATE_SECONDS = float(os.environ.get("CDSI_REVALIDATE_SECONDS", "300"))
+_cdsi_reference = None
+
+# "full" sends the whole table; "bm25" (opt-in, until its recall is measured against "full") sends only
+# the CDSi rows retrieved for the patient's conditions
+CDSI_RETRIEVAL = os.environ.get("CDSI_RETRIEVAL", "full")
+CDSI_RETRIEVAL_TOP_K = int(os.environ.get("CDSI_RETRIEVAL_TOP_K", "5"))
+
+class CdsiReference:
+    """The parsed CDSi CSV plus its reference block of the prompt, rendered once per revision."""
+
+    __slots__ = ("headers", "data", "prompt_text", "etag", "version_id", "checked_at", "_retriever", "_titles")
+
+    def __init__(self, headers, data, etag, version_id):
+        self.headers = headers
+        self.data = data
+        self.prompt_text = f"{', '.join(headers)}\n{data}"
+        self.etag = etag
+        self.version_id = version_id
+        self.checked_at = time.monotonic()
+        self._retriever = None
+        self._titles = None
+
+    @property
+    def retriever(self):
+        """BM25 index over the rows, built on first use and kept for this revision."""
+        if self._retriever is None:
+            self._retriever = CdsiRetriever(self.headers, self.data)
+        return self._retriever
+
+    @property
+    def titles(self):
+        """Observation Code -> Observation Title."""
+        if self._titles is None:
+            code_column = self.headers.index("Observation Code")
+            title_column = self.headers.index("Observation Title")
+            self._titles = {row[code_column]: row[title_column] for row in self.data}
+        return self._titles
+
+    def render(self, rows):
+        """The reference block for a subset of rows, in the same format as `prompt_text`."""
+        return f"{', '.join(self.headers)}\n{rows}"
+
+def load_static_cdsi(if_none_match=None):
+    """
+    Loads the static CSV file from S3 and returns its parsed reference.
+
+    With `if_none_match`, S3 answers 304 when the object still has that
+    ETag; None is returned then and nothing is downloaded.
+    """
+    kwargs = {"Bucket": get_bucket_name(), "Key": get_static_cdsi_key()}
+    if if_none_match:
+        kwargs["IfNoneMatch"] = if_none_match
+    try:
+        cdsi_obj = get_client("s3").get_object(**kwargs)
+    except ClientError as e:
+        if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304:
+            return None
+        raise
     cdsi_data = cdsi_obj["Body"].read().decode("utf-8")
 
     csv_reader = csv.reader(io.StringIO(cdsi_data))
     headers = next(csv_reader) 
     data = [row for row in csv_reader]  
-    
-    return headers, data
+
+    etag = cdsi_obj["ETag"]
+    # S3 version id when the bucket is versioned, otherwise the ETag identifies the revision
+    version_id = cdsi_obj.get("VersionId") or etag.strip('"')
+    return CdsiReference(headers, data, etag, version_id)
+
+def get_static_cdsi():
+    """Returns the cached CDSi reference, revalidating it with a conditional GET every CDSI_REVALIDATE_SECONDS."""
+    global _cdsi_reference
+    if _cdsi_reference is None:
+        _cdsi_reference = load_static_cdsi()
+        print(json.dumps({"cdsi_reference": "loaded", "version": _cdsi_reference.version_id, "rows": len(_cdsi_reference.data)}))
+    elif time.monotonic() - _cdsi_reference.checked_at >= CDSI_REVALIDATE_SECONDS:
+        refreshed = load_static_cdsi(if_none_match=_cdsi_reference.etag)
+        if refreshed is None:
+            _cdsi_reference.checked_at = time.monotonic()
+        else:
+            print(json.dumps({"cdsi_reference": "changed", "previous": _cdsi_reference.version_id,
+                              "version": refreshed.version_id, "rows": len(refreshed.data)}))
+            _cdsi_reference = refreshed
+            # Answers for the old revision are keyed by its version and can no longer be hit
+            cache = get_classification_cache()
+            if cache is not None:
+                cache.invalidate()
+    return _cdsi_reference
+
+CONDITIONS_HEADER = "CONDITIONS:"
+SECTION_END = re.compile(r"-{5,}")
+ACTIVE_CONDITION = re.compile(r"\s*\d{4}-\d{2}-\d{2} -\s*(\d{4}-\d{2}-\d{2})?")
+
+def scan_active_conditions(lines):
+    """
+    Single pass over a stream of lines: finds the CONDITIONS section and keeps
+    its disorder/finding lines that have no end date.
+
+    Gives the same result as `filter_disorder_conditions(extract_conditions_section(lines))`,
+    and stops reading at the section's ----- terminator, so the rest of the
+    file is never downloaded.
+    """
+    in_section = False
+    active = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if CONDITIONS_HEADER in line:
+            in_section = True
+            continue
+        if not in_section:
+            continue
+        if SECTION_END.fullmatch(line):
+            break
+        lowered = line.lower()
+        if "disorder" in lowered or "finding" in lowered:
+            match = ACTIVE_CONDITION.match(line)
+            if match and not match.group(1):
+                active.append(line)
+    return "\n".join(active)
 
 def extract_conditions_section(text_data):
-    """Extracts the CONDITIONS section from the text file."""
-    lines = text_data.split("\n")
+    """Extracts the CONDITIONS section from the text file (a string or a stream of lines)."""
+    lines = text_data.split("\n") if isinstance(text_data, str) else (line.rstrip("\r\n") for line in text_data)
     extracting = False
     conditions_section = []
 
@@ -63,67 +206,386 @@ def filter_disorder_conditions(conditions_text):
 
     return "\n".join(filtered_lines)
 
-def call_bedrock(filtered_conditions, static_csv_headers, static_csv_data):
-    """Calls AWS Bedrock `MODEL_ID` using the correct Messages API format."""
-    prompt = f"""
+def select_cdsi_reference(cdsi_reference, filtered_conditions):
+    """
+    Returns (reference text, rows sent) for the prompt.
+
+    With CDSI_RETRIEVAL=bm25 only the top CDSI_RETRIEVAL_TOP_K rows per
+    condition line are sent. The full table is sent when retrieval is off
+    or finds nothing, so a patient never gets an empty reference.
+    """
+    condition_lines = [line for line in filtered_conditions.split("\n") if line.strip()]
+    if CDSI_RETRIEVAL == "full" or not condition_lines:
+        return cdsi_reference.prompt_text, len(cdsi_reference.data)
+    selected = cdsi_reference.retriever.select(condition_lines, k=CDSI_RETRIEVAL_TOP_K)
+    if not selected:
+        return cdsi_reference.prompt_text, len(cdsi_reference.data)
+    return cdsi_reference.render([cdsi_reference.data[i] for i in selected]), len(selected)
+
+# Streaming mode: partial output is written to S3 under STREAM_PREFIX at most every STREAM_FLUSH_SECONDS
+STREAM_PREFIX = "llm_streams/"
+STREAM_FLUSH_SECONDS = float(os.environ.get("STREAM_FLUSH_SECONDS", "0.5"))
+
+# Role Bedrock assumes in batch mode to read staged records and write job output
+BATCH_ROLE_PARAMETER = "/config/BedrockBatchRoleArn"
+
+# "text" answers in prose; "structured" returns CDSi codes and condition line indexes through a tool call
+OUTPUT_MODE = os.environ.get("OUTPUT_MODE", "text")
+
+# Bedrock prompt caching of the static prefix (instructions + CDSi reference); off for models without it
+PROMPT_CACHE = os.environ.get("PROMPT_CACHE", "true").lower() == "true"
+# Shortest prefix the model will cache (1,024 tokens for Claude Sonnet/Opus, 2,048 for Haiku); shorter ones
+# are never cached, so marking them only risks paying for cache writes
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get("PROMPT_CACHE_MIN_TOKENS", "1024"))
+CHARACTERS_PER_TOKEN = 4  # rough estimate for English text
+
+PROMPT_INSTRUCTIONS = """
 Instructions:
 
 List only the confirmed CDSi codes that directly match the patient's documented conditions. When analyzing matches:
 - Check exact SNOMED clinical thresholds and criteria (e.g., severe obesity requires a specific BMI).
 - Consider common medical terminology variations/synonyms.
 - Distinguish between similarly-named conditions.
+"""
 
-**Patient Data:**
-Static Labels (Reference):
-{", ".join(static_csv_headers)}
-{static_csv_data}
-
-**Current Conditions (Filtered for Clinical Review):**
-
-{filtered_conditions}
-
+TEXT_OUTPUT_FORMAT = """
 **For each confirmed match, provide:**
 1. CDSi Code:
 2. Observation Title:
 3. Supporting Reference from Patient Record:
 
 Only include codes with explicit evidence in the patient's record. Exclude any uncertain or inferential codes. Ensure precise clinical matching while keeping the response concise and direct.
+"""
+
+STRUCTURED_OUTPUT_FORMAT = f"""
+Report the confirmed matches with the {TOOL_NAME} tool: for each, the CDSi Observation Code and the [index] of every condition line that supports it. Report each code once.
+
+Only include codes with explicit evidence in the patient's record. Exclude any uncertain or inferential codes.
+"""
+
+def build_system_prompt(reference_text, cache=PROMPT_CACHE, structured=False):
+    """
+    The static prefix of every request: instructions, then the CDSi reference.
+
+    The same reference text always gives byte-identical blocks, which is what
+    Bedrock's prompt cache matches on; the cache point goes after the reference.
+    It is only set when the whole CDSi table is sent (CDSI_RETRIEVAL=full) or
+    the prefix reaches PROMPT_CACHE_MIN_TOKENS (estimated from its length).
+    The few rows bm25 retrieves usually fall short of the model's minimum
+    and differ between patients, so that prefix is sent without a cache point.
+    """
+    reference_block = {"type": "text", "text": f"**Static Labels (Reference):**\n{reference_text}"}
+    instructions = PROMPT_INSTRUCTIONS + (STRUCTURED_OUTPUT_FORMAT if structured else TEXT_OUTPUT_FORMAT)
+    prefix_tokens = (len(instructions) + len(reference_block["text"])) // CHARACTERS_PER_TOKEN
+    if cache and (CDSI_RETRIEVAL == "full" or prefix_tokens >= PROMPT_CACHE_MIN_TOKENS):
+        reference_block["cache_control"] = {"type": "ephemeral"}
+    return [{"type": "text", "text": instructions}, reference_block]
+
+def log_usage(response_body):
+    """Logs input/output tokens, including those read from and written to the prompt cache."""
+    usage = response_body.get("usage", {})
+    print(json.dumps({"bedrock_usage": {
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cache_read_input_tokens": usage.get("cache_read_input_tokens", 0),
+        "cache_creation_input_tokens": usage.get("cache_creation_input_tokens", 0),
+    }}))
+
+def build_request(filtered_conditions, reference_text, cache=PROMPT_CACHE, structured=False):
+    """The Messages API body: the cacheable static prefix as the system prompt, the patient in the user message."""
+    patient_prompt = f"""**Patient Data:**
+
+**Current Conditions (Filtered for Clinical Review):**
+
+{numbered_conditions(filtered_conditions) if structured else filtered_conditions}
 """
 
     request_payload = {
         "anthropic_version": "bedrock-2023-05-31", 
         "max_tokens": 1024,
         "temperature": 0,  
+        "system": build_system_prompt(reference_text, cache, structured),
         "messages": [
-            {"role": "user", "content": [{"type": "text", "text": prompt}]}
+            {"role": "user", "content": [{"type": "text", "text": patient_prompt}]}
         ]
     }
+    if structured:
+        request_payload["tools"] = [MATCHES_TOOL]
+        request_payload["tool_choice"] = {"type": "tool", "name": TOOL_NAME}
 
-    request_body = json.dumps(request_payload)
+    return request_payload
+
+def call_bedrock(filtered_conditions, reference_text, structured=False):
+    """Calls AWS Bedrock `MODEL_ID` using the correct Messages API format."""
+    request_body = json.dumps(build_request(filtered_conditions, reference_text, structured=structured))
 
     try:
-        response = bedrock_client.invoke_model(
-            modelId=MODEL_ID,
+        response = get_bedrock_runtime().invoke_model(
+            modelId=get_model_id(),
             body=request_body,
             contentType="application/json",
             accept="application/json"
         )
 
         response_body = json.loads(response["body"].read())
+        log_usage(response_body)
         return response_body
 
     except Exception as e:
-        print(f"ERROR: Can't invoke '{MODEL_ID}'. Reason: {e}")
+        print(f"ERROR: Can't invoke '{get_model_id()}'. Reason: {e}")
+        if is_retryable(e):
+            # Still throttled or unavailable after the retries: raised so the caller gets a 429/503
+            # instead of an error in a 200
+            raise
         return {"error": str(e)}
+    finally:
+        get_bedrock_runtime().log_metrics("bedrock_throttling")
+
+def stream_bedrock(filtered_conditions, reference_text, on_text):
+    """
+    Calls `MODEL_ID` with invoke_model_with_response_stream.
+
+    `on_text(text so far)` is called after every text delta. Returns the
+    assembled message in the same shape as `call_bedrock`'s response.
+    """
+    response = get_bedrock_runtime().invoke_model_with_response_stream(
+        modelId=get_model_id(),
+        body=json.dumps(build_request(filtered_conditions, reference_text)),
+        contentType="application/json",
+        accept="application/json"
+    )
+
+    message = {}
+    usage = {}
+    parts = []
+    for event in response["body"]:
+        chunk = json.loads(event["chunk"]["bytes"]) if "chunk" in event else {}
+        if chunk.get("type") == "message_start":
+            message = chunk["message"]
+            usage.update(message.get("usage", {}))
+        elif chunk.get("type") == "content_block_delta" and chunk["delta"].get("type") == "text_delta":
+            parts.append(chunk["delta"]["text"])
+            on_text("".join(parts))
+        elif chunk.get("type") == "message_delta":
+            message.update(chunk.get("delta", {}))
+            usage.update(chunk.get("usage", {}))
+
+    message["content"] = [{"type": "text", "text": "".join(parts)}]
+    message["usage"] = usage
+    log_usage(message)
+    return message
+
+def cached_classification(filtered_conditions, cdsi_reference, reference_text, lookup=True, structured=False):
+    """Returns (cache key, cached Bedrock response or None); the key is None when the cache is off."""
+    cache = get_classification_cache()
+    if cache is None:
+        return None, None
+    key = classification_key(filtered_conditions, get_model_id(), cdsi_reference.version_id, reference_text,
+                             "structured" if structured else "text")
+    return key, cache.get(key) if lookup else None
+
+def remember_classification(key, bedrock_response, cdsi_reference, filtered_conditions=None, structured=False):
+    """
+    Caches a successful response; errors and truncated answers are not cached.
+
+    Structured responses are stored citing conditions by text, since the
+    entry is shared by patients whose lines are in a different order.
+    """
+    if key is None or "error" in bedrock_response or bedrock_response.get("stop_reason") == "max_tokens":
+        return
+    if structured:
+        bedrock_response = matches_by_condition(bedrock_response, filtered_conditions)
+    get_classification_cache().put(key, bedrock_response, get_model_id(), cdsi_reference.version_id)
+
+def classify(filtered_conditions, cdsi_reference, reference_text, refresh=False, structured=False):
+    """
+    Returns (Bedrock response, "hit" or "miss"), answering from the result
+    cache when it can. `refresh` skips the lookup and overwrites the entry.
+    """
+    key, cached = cached_classification(filtered_conditions, cdsi_reference, reference_text,
+                                        lookup=not refresh, structured=structured)
+    if cached is not None:
+        # Structured matches are cached by condition text; cite this patient's own lines
+        return (matches_by_line(cached, filtered_conditions) if structured else cached), "hit"
+    bedrock_response = call_bedrock(filtered_conditions, reference_text, structured)
+    remember_classification(key, bedrock_response, cdsi_reference, filtered_conditions, structured)
+    return bedrock_response, "miss"
+
+class StreamWriter:
+    """Publishes a streaming classification's progress as one S3 object that clients poll."""
+
+    def __init__(self, stream_id, file_key):
+        self.key = f"{STREAM_PREFIX}{stream_id}.json"
+        self.state = {"stream_id": stream_id, "file": file_key, "status": "queued", "text": ""}
+        self.started = time.monotonic()
+        self.flushed_at = 0.0
+
+    def _put(self):
+        self.state["elapsed_ms"] = round((time.monotonic() - self.started) * 1000)
+        get_client("s3").put_object(Bucket=get_bucket_name(), Key=self.key, Body=json.dumps(self.state).encode("utf-8"),
+                                    ContentType="application/json")
+        self.flushed_at = time.monotonic()
+
+    def queued(self):
+        self._put()
+
+    def text(self, text):
+        if "first_token_ms" not in self.state:
+            self.state["first_token_ms"] = round((time.monotonic() - self.started) * 1000)
+        self.state["status"] = "running"
+        self.state["text"] = text
+        if time.monotonic() - self.flushed_at >= STREAM_FLUSH_SECONDS:
+            self._put()
+
+    def finish(self, **fields):
+        self.state.update(fields)
+        self._put()
+
+def prepare_classification(text_file_key):
+    """Returns (filtered conditions, CDSi reference, reference text for the prompt, CDSi rows sent)."""
+    # Stream the newly uploaded text file (decompressing .gz/.zst), keeping active conditions, and stop after CONDITIONS
+    text_obj = get_client("s3").get_object(Bucket=get_bucket_name(), Key=text_file_key)
+    with open_text(text_obj, text_file_key) as text_data:
+        filtered_conditions = scan_active_conditions(text_data)
+
+    # The static CDSi file, cached across warm invocations
+    cdsi_reference = get_static_cdsi()
+
+    # Keep only the CDSi rows relevant to these conditions
+    reference_text, cdsi_rows = select_cdsi_reference(cdsi_reference, filtered_conditions)
+    return filtered_conditions, cdsi_reference, reference_text, cdsi_rows
+
+def start_stream(text_file_key, context):
+    """Queues a streaming classification on an asynchronous invocation of this function."""
+    stream_id = uuid.uuid4().hex
+    StreamWriter(stream_id, text_file_key).queued()
+    get_client("lambda").invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps({"stream_job": {"stream_id": stream_id, "file_key": text_file_key}}).encode("utf-8")
+    )
+    return {"statusCode": 202, "body": json.dumps({"message": "Streaming", "file": text_file_key, "stream_id": stream_id})}
+
+def run_stream(job):
+    """Asynchronous side of streaming mode: classifies the file, publishing partial output as it arrives."""
+    writer = StreamWriter(job["stream_id"], job["file_key"])
+    try:
+        filtered_conditions, cdsi_reference, reference_text, cdsi_rows = prepare_classification(job["file_key"])
+        key, bedrock_response = cached_classification(filtered_conditions, cdsi_reference, reference_text)
+        cache_status = "hit" if bedrock_response is not None else "miss"
+        if bedrock_response is None:
+            bedrock_response = stream_bedrock(filtered_conditions, reference_text, writer.text)
+            remember_classification(key, bedrock_response, cdsi_reference)
+    except Exception as e:
+        print(f"ERROR: Streaming classification of '{job['file_key']}' failed. Reason: {e}")
+        writer.finish(status="error", error=str(e))
+        return
+    writer.finish(status="complete", text=bedrock_response["content"][0]["text"], cache=cache_status,
+                  cdsi_version=cdsi_reference.version_id, bedrock_output=bedrock_response)
+    print(json.dumps({"classification": job["file_key"], "stream_id": job["stream_id"], "cache": cache_status,
+                      "cdsi_version": cdsi_reference.version_id,
+                      "cdsi_rows": cdsi_rows, "cdsi_rows_total": len(cdsi_reference.data),
+                      "first_token_ms": writer.state.get("first_token_ms"), "elapsed_ms": writer.state["elapsed_ms"]}))
+
+def get_stream(stream_id):
+    """Returns a streaming classification's latest published state."""
+    try:
+        stream_obj = get_client("s3").get_object(Bucket=get_bucket_name(), Key=f"{STREAM_PREFIX}{stream_id}.json")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "NoSuchKey":
+            return {"statusCode": 404, "body": json.dumps({"error": f"Unknown stream_id '{stream_id}'."})}
+        raise
+    return {"statusCode": 200, "body": stream_obj["Body"].read().decode("utf-8")}
+
+CDSI_CODE_PATTERN = re.compile(r"CDSi Code:\W*([A-Za-z0-9]+)")
+
+def parse_cdsi_codes(text, cdsi_reference):
+    """The CDSi codes named in a free-text answer, with their titles; codes not in the table are dropped."""
+    titles = cdsi_reference.titles
+    codes = dict.fromkeys(code for code in CDSI_CODE_PATTERN.findall(text) if code in titles)
+    return [{"cdsi_code": code, "observation_title": titles[code]} for code in codes]
+
+def handle_batch(batch):
+    """
+    Submits or collects a Bedrock batch inference job for a panel of text EHRs.
+
+    `{"file_keys": [...]}` extracts and filters every file's conditions,
+    stages one model-input record per file and submits the job; its state
+    is saved next to the staged records. `{"run_id": ...}` checks on that
+    job and, once it has finished, writes per-file CDSi results to S3.
+    Any other body raises ValueError, which the handler returns as a 400.
+    """
+    if not isinstance(batch, dict) or not (batch.get("file_keys") or batch.get("run_id")):
+        raise ValueError("'batch' needs 'file_keys' (text EHR keys) to submit a job, or the 'run_id' of a submitted job.")
+    if "file_keys" in batch and not (isinstance(batch["file_keys"], list)
+                                     and all(isinstance(key, str) for key in batch["file_keys"])):
+        raise ValueError("'file_keys' must be a list of S3 keys.")
+
+    s3 = get_client("s3")
+    bucket_name = get_bucket_name()
+    job_client = BedrockBatchJobClient(get_client("bedrock", BEDROCK_REGION), s3, bucket_name,
+                                       get_parameter(BATCH_ROLE_PARAMETER), get_model_id())
+
+    if "file_keys" in batch:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            prepared = dict(zip(batch["file_keys"], pool.map(prepare_classification, batch["file_keys"])))
+        cdsi_reference = get_static_cdsi()
+        # Batch jobs are not served from the prompt cache, so the cache marker is left out
+        patients = {file_key: build_request(filtered_conditions, reference_text, cache=False)
+                    for file_key, (filtered_conditions, _, reference_text, _) in prepared.items()}
+        state = submit_job(job_client, patients, batch.get("run_id"))
+        state["cdsi_version"] = cdsi_reference.version_id
+        s3.put_object(Bucket=bucket_name, Key=f"{job_client.prefix}{state['run_id']}/state.json",
+                      Body=json.dumps(state).encode("utf-8"), ContentType="application/json")
+        return {"status": "SUBMITTED", "run_id": state["run_id"], "job_id": state["job_id"], "patients": len(patients)}
+
+    run_prefix = f"{job_client.prefix}{batch['run_id']}/"
+    state = json.loads(s3.get_object(Bucket=bucket_name, Key=run_prefix + "state.json")["Body"].read())
+    cdsi_reference = get_static_cdsi()
+
+    def parse(_, model_output):
+        text = model_output["content"][0]["text"]
+        return {"cdsi_results": parse_cdsi_codes(text, cdsi_reference), "bedrock_output": model_output}
+
+    results = collect_job(job_client, state, parse)
+    if results is None:
+        return {"status": "IN_PROGRESS", "run_id": state["run_id"], "job_id": state["job_id"]}
+
+    results_key = run_prefix + "results.json"
+    s3.put_object(Bucket=bucket_name, Key=results_key, Body=json.dumps(results).encode("utf-8"),
+                  ContentType="application/json")
+    failed = sum(1 for result in results.values() if "error" in result)
+    return {"status": "COMPLETED", "run_id": state["run_id"], "results_key": results_key, "cdsi_version": state["cdsi_version"],
+            "patients": len(results), "failed": failed}
 
 def lambda_handler(event, context):
     """Lambda function that processes input from API Gateway or S3 Event."""
     try:
+        # Stop retrying Bedrock before this invocation (or API Gateway, for a synchronous request) gives up
+        get_bedrock_runtime().set_deadline(context, None if "stream_job" in event else API_GATEWAY_TIMEOUT_SECONDS)
+
+        # Asynchronous self-invocation that does the work of a streaming request
+        if "stream_job" in event:
+            run_stream(event["stream_job"])
+            return {"statusCode": 200}
+
         # Check if API Gateway triggered the Lambda
         if "httpMethod" not in event:  
             return {"statusCode": 400, "body": json.dumps({"error": "Invalid trigger source. This function must be called via API Gateway."})}
         print("Triggered via API Gateway")
         body = json.loads(event["body"])
+
+        # Batch mode: one Bedrock batch inference job for a whole panel
+        if "batch" in body:
+            try:
+                return {"statusCode": 200, "body": json.dumps(handle_batch(body["batch"]))}
+            except ValueError as e:
+                return {"statusCode": 400, "body": json.dumps({"error": str(e)})}
+
+        # Polling a streaming request
+        if body.get("stream_id"):
+            return get_stream(body["stream_id"])
+
         text_file_key = body.get("file_key")
 
         if not text_file_key:
@@ -132,28 +594,54 @@ def lambda_handler(event, context):
         # Log the file being processed
         print(f"Processing file: {text_file_key}")
 
-        # Read the newly uploaded text file
-        text_obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=text_file_key)
-        text_data = text_obj["Body"].read().decode("utf-8")
-
-        # Load the static CDSi file
-        cdsi_headers, cdsi_data = load_static_cdsi()
-
-        # Extract and filter the CONDITIONS section
-        conditions_section = extract_conditions_section(text_data)
-        filtered_conditions = filter_disorder_conditions(conditions_section)
-
-        # Call `MODEL_ID` LLM with the processed data
-        bedrock_response = call_bedrock(filtered_conditions, cdsi_headers, cdsi_data)
+        structured = body.get("output", OUTPUT_MODE) == "structured"
+        if body.get("stream"):
+            if structured:
+                return {"statusCode": 400, "body": json.dumps({"error": "Structured output is not streamed; send \"output\": \"text\"."})}
+            return start_stream(text_file_key, context)
+
+        filtered_conditions, cdsi_reference, reference_text, cdsi_rows = prepare_classification(text_file_key)
+
+        # Call `MODEL_ID` LLM with the processed data, unless the same conditions were classified before
+        bedrock_response, cache_status = classify(filtered_conditions, cdsi_reference, reference_text,
+                                                  refresh=bool(body.get("refresh")), structured=structured)
+        print(json.dumps({"classification": text_file_key, "cache": cache_status, "cdsi_version": cdsi_reference.version_id,
+                          "cdsi_rows": cdsi_rows, "cdsi_rows_total": len(cdsi_reference.data)}))
+
+        if structured and "error" not in bedrock_response:
+            # Titles and condition text come from the CDSi table and the record, not from the model
+            matches, rejected = parse_matches(bedrock_response, filtered_conditions, cdsi_reference.titles)
+            if rejected:
+                print(json.dumps({"rejected_matches": rejected, "file": text_file_key}))
+            return {
+                "statusCode": 200,
+                "body": json.dumps({
+                    "message": "Processing complete",
+                    "file": text_file_key,
+                    "cdsi_version": cdsi_reference.version_id,
+                    "cache": cache_status,
+                    "cdsi_results": matches,
+                    "rejected": rejected,
+                    "usage": bedrock_response.get("usage", {})
+                }),
+            }
 
         return {
             "statusCode": 200,
             "body": json.dumps({
                 "message": "Processing complete",
                 "file": text_file_key,
+                "cdsi_version": cdsi_reference.version_id,
+                "cache": cache_status,
                 "bedrock_output": bedrock_response
             }),
         }
 
     except Exception as e:
+        if is_throttle(e):
+            return {"statusCode": 429, "headers": {"Retry-After": THROTTLED_RETRY_AFTER_SECONDS},
+                    "body": json.dumps({"error": f"Bedrock is throttling requests, retry later. {e}"})}
+        if is_retryable(e):
+            return {"statusCode": 503, "headers": {"Retry-After": THROTTLED_RETRY_AFTER_SECONDS},
+                    "body": json.dumps({"error": f"Bedrock is unavailable, retry later. {e}"})}
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
@@ -0,0 +1,209 @@
+import abc
+import json
+import os
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+RUNNING_STATUSES = {"Submitted", "Validating", "Scheduled", "InProgress", "Stopping"}
+FINISHED_STATUSES = {"Completed", "PartiallyCompleted"}
+INPUT_FILE = "records.jsonl"
+OUTPUT_SUFFIX = ".out"
+
+class BatchInferenceJobClient(abc.ABC):
+    """
+    What the batch mode needs from a batch model-invocation service.
+
+    `input_location` and `output_location` are opaque to the callers: S3
+    keys for Bedrock, directories for the local stand-in. `min_records` is
+    the smallest job the service accepts.
+    """
+
+    min_records = 1
+
+    @abc.abstractmethod
+    def stage_records(self, run_id: str, records: list) -> Tuple[str, str]:
+        """Writes the {"recordId", "modelInput"} records as JSONL and returns (input_location, output_location)."""
+
+    @abc.abstractmethod
+    def start(self, run_id: str, input_location: str, output_location: str) -> str:
+        """Submits the job and returns its id."""
+
+    @abc.abstractmethod
+    def describe(self, job_id: str) -> Tuple[str, str]:
+        """Returns (status, message)."""
+
+    @abc.abstractmethod
+    def read_outputs(self, output_location: str) -> Dict[str, Dict]:
+        """Returns {recordId: output record} for every record the job wrote."""
+
+def _read_jsonl(lines) -> Dict[str, Dict]:
+    records = (json.loads(line) for line in lines if line.strip())
+    return {record["recordId"]: record for record in records}
+
+class BedrockBatchJobClient(BatchInferenceJobClient):
+    """CreateModelInvocationJob with inputs and outputs under `s3://bucket/prefix/<run_id>/`."""
+
+    # Bedrock rejects batch jobs with fewer records than this
+    min_records = 100
+
+    def __init__(self, bedrock, s3, bucket: str, role_arn: str, model_id: str, prefix: str = "llm_batch/"):
+        self.bedrock = bedrock
+        self.s3 = s3
+        self.bucket = bucket
+        self.role_arn = role_arn
+        self.model_id = model_id
+        self.prefix = prefix
+
+    def stage_records(self, run_id, records):
+        input_key = f"{self.prefix}{run_id}/input/{INPUT_FILE}"
+        body = "".join(json.dumps(record) + "\n" for record in records)
+        self.s3.put_object(Bucket=self.bucket, Key=input_key, Body=body.encode("utf-8"), ContentType="application/jsonl")
+        return input_key, f"{self.prefix}{run_id}/output/"
+
+    def start(self, run_id, input_location, output_location):
+        response = self.bedrock.create_model_invocation_job(
+            jobName=run_id,
+            roleArn=self.role_arn,
+            modelId=self.model_id,
+            clientRequestToken=run_id,  # resubmitting the same run does not start a second job
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{self.bucket}/{input_location}", "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{self.bucket}/{output_location}"}},
+        )
+        return response["jobArn"]
+
+    def describe(self, job_id):
+        job = self.bedrock.get_model_invocation_job(jobIdentifier=job_id)
+        return job["status"], job.get("message", "")
+
+    def read_outputs(self, output_location):
+        # Bedrock writes <output>/<job id>/<input name>.out, one JSON record per line
+        outputs = {}
+        for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=output_location):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(OUTPUT_SUFFIX):
+                    body = self.s3.get_object(Bucket=self.bucket, Key=obj["Key"])["Body"].read().decode("utf-8")
+                    outputs.update(_read_jsonl(body.splitlines()))
+        return outputs
+
+class LocalBatchJobClient(BatchInferenceJobClient):
+    """
+    File-based stand-in for tests and local runs.
+
+    Inputs and outputs live under `directory/<run_id>/`. The job runs the
+    given synchronous `invoke(model input)` over every record, and reports
+    InProgress for `polls_until_complete` describe calls first.
+    """
+
+    def __init__(self, directory: str, invoke: Callable[[Dict], Dict], polls_until_complete: int = 1):
+        self.directory = directory
+        self.invoke = invoke
+        self.polls_until_complete = polls_until_complete
+        self._jobs: Dict[str, Dict] = {}
+
+    def stage_records(self, run_id, records):
+        input_dir = os.path.join(self.directory, run_id, "input")
+        os.makedirs(input_dir, exist_ok=True)
+        with open(os.path.join(input_dir, INPUT_FILE), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        return input_dir, os.path.join(self.directory, run_id, "output")
+
+    def start(self, run_id, input_location, output_location):
+        job_id = uuid.uuid4().hex
+        os.makedirs(output_location, exist_ok=True)
+        with open(os.path.join(input_location, INPUT_FILE), encoding="utf-8") as f:
+            records = _read_jsonl(f)
+        with open(os.path.join(output_location, INPUT_FILE + OUTPUT_SUFFIX), "w", encoding="utf-8") as f:
+            for record in records.values():
+                try:
+                    record["modelOutput"] = self.invoke(record["modelInput"])
+                except Exception as e:
+                    record["error"] = {"errorCode": 400, "errorMessage": str(e)}
+                f.write(json.dumps(record) + "\n")
+        self._jobs[job_id] = {"polls": 0}
+        return job_id
+
+    def describe(self, job_id):
+        job = self._jobs[job_id]
+        job["polls"] += 1
+        return ("InProgress" if job["polls"] <= self.polls_until_complete else "Completed"), ""
+
+    def read_outputs(self, output_location):
+        with open(os.path.join(output_location, INPUT_FILE + OUTPUT_SUFFIX), encoding="utf-8") as f:
+            return _read_jsonl(f)
+
+def submit_job(job_client: BatchInferenceJobClient, patients: Dict[str, Dict], run_id: Optional[str] = None) -> Dict:
+    """
+    Stages one model-input record per patient and submits one batch job.
+
+    Args:
+        job_client (BatchInferenceJobClient): Bedrock or the local stand-in.
+        patients (dict): {patient id: Messages API request body}.
+        run_id (str): Names the job and its staging area; generated if omitted.
+
+    Returns:
+        dict: JSON-serializable job state for `collect_job`.
+
+    Raises:
+        ValueError: If there are fewer patients than the service accepts in one job.
+    """
+    if len(patients) < job_client.min_records:
+        raise ValueError(f"A batch job needs at least {job_client.min_records} patients, got {len(patients)}; "
+                         "use the synchronous endpoint for smaller panels")
+    run_id = run_id or time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+    record_ids = {f"{number:011d}": patient_id for number, patient_id in enumerate(patients)}
+    records = [{"recordId": record_id, "modelInput": patients[patient_id]} for record_id, patient_id in record_ids.items()]
+
+    input_location, output_location = job_client.stage_records(run_id, records)
+    job_id = job_client.start(run_id, input_location, output_location)
+    print(json.dumps({"llm_batch_job": {"run_id": run_id, "job_id": job_id, "patients": len(patients)}}))
+    return {"run_id": run_id, "job_id": job_id, "output_location": output_location, "records": record_ids}
+
+def collect_job(job_client: BatchInferenceJobClient, state: Dict,
+                parse: Callable[[str, Dict], Dict]) -> Optional[Dict[str, Dict]]:
+    """
+    Joins a finished job's output records back to patient ids.
+
+    Args:
+        job_client (BatchInferenceJobClient): The client that submitted the job.
+        state (dict): Returned by `submit_job`.
+        parse (Callable): Turns (patient id, model output) into that patient's result.
+
+    Returns:
+        dict or None: None while the job is still running, otherwise
+        {patient id: result}. Patients whose record failed or is missing
+        get {"error": ...} instead.
+
+    Raises:
+        RuntimeError: If the job failed, stopped or expired.
+    """
+    status, message = job_client.describe(state["job_id"])
+    if status in RUNNING_STATUSES:
+        return None
+    if status not in FINISHED_STATUSES:
+        raise RuntimeError(f"Batch inference job {state['job_id']} ended {status}: {message}")
+    outputs = job_client.read_outputs(state["output_location"])
+
+    results = {}
+    for record_id, patient_id in state["records"].items():
+        record = outputs.get(record_id)
+        if record is None:
+            results[patient_id] = {"error": f"No job output for record {record_id}"}
+        elif "modelOutput" not in record:
+            results[patient_id] = {"error": record.get("error", {}).get("errorMessage", "Record failed")}
+        else:
+            results[patient_id] = parse(patient_id, record["modelOutput"])
+    return results
+
+def run_job(job_client: BatchInferenceJobClient, patients: Dict[str, Dict], parse: Callable[[str, Dict], Dict],
+            poll_seconds: float = 60, timeout_seconds: float = 24 * 3600) -> Dict[str, Dict]:
+    """Submits, polls and collects in one call, for scripts that can wait for the job."""
+    state = submit_job(job_client, patients)
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        results = collect_job(job_client, state, parse)
+        if results is not None:
+            return results
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Batch inference job {state['job_id']} still running after {timeout_seconds}s")
+        time.sleep(poll_seconds)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Bump to invalidate every cached classification, e.g. after a prompt change
+CACHE_NAMESPACE = "classification:v4"
+MEMORY_ENTRIES = int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", "1000"))
+TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Persistent tier: "dynamodb" (the table named in SSM) or "memory" (LRU only); "off" disables the cache
+CACHE_BACKEND = os.environ.get("LLM_CACHE_BACKEND", "memory")
+CACHE_TABLE_PARAMETER = "/config/DynamoLLMCacheTableName"
+_cache: Optional["ClassificationCache"] = None
+
+DATE_PREFIX = re.compile(r"^\s*\d{4}-\d{2}-\d{2}\s*-\s*(\d{4}-\d{2}-\d{2})?\s*:")
+
+def normalize_condition(line: str) -> str:
+    """One condition line with its onset date dropped, whitespace collapsed and case folded."""
+    return " ".join(DATE_PREFIX.sub("", line).split()).casefold()
+
+def normalize_conditions(filtered_conditions: str, keep_dates: bool = False) -> str:
+    """
+    The filtered conditions as a set: each line normalized by
+    `normalize_condition`, deduplicated and sorted. Patients with the same
+    active conditions normalize to the same text.
+
+    With `keep_dates` only whitespace is collapsed, so lines with other
+    onset dates or casing stay distinct.
+    """
+    if keep_dates:
+        lines = {" ".join(line.split()) for line in filtered_conditions.split("\n")}
+    else:
+        lines = {normalize_condition(line) for line in filtered_conditions.split("\n")}
+    lines.discard("")
+    return "\n".join(sorted(lines))
+
+def classification_key(filtered_conditions: str, model_id: str, cdsi_version: str, reference_text: str,
+                       output_mode: str = "text") -> str:
+    """
+    Content address of one classification request.
+
+    The reference text is hashed in as well, so a change to CDSi retrieval
+    settings gives new keys even when the CDSi revision is the same.
+    Text answers quote the patient's lines and onset dates as supporting
+    references, so their keys keep the dates; structured answers cite
+    conditions by text (see `structured_output.matches_by_condition`) and
+    are shared by every patient with the same conditions.
+    """
+    reference_hash = hashlib.sha256(reference_text.encode("utf-8")).hexdigest()
+    material = "\n".join([CACHE_NAMESPACE, model_id, cdsi_version, reference_hash, output_mode,
+                          normalize_conditions(filtered_conditions, keep_dates=output_mode == "text")])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class DynamoDBClassificationStore:
+    """Persistent tier in a DynamoDB table keyed by `cache_key`, expiring through `expires_at` TTL."""
+
+    def __init__(self, client, table_name: str, ttl_seconds: int = TTL_SECONDS):
+        self.client = client
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict]:
+        item = self.client.get_item(TableName=self.table_name, Key={"cache_key": {"S": key}},
+                                    ProjectionExpression="bedrock_output, expires_at").get("Item")
+        # TTL deletion runs in the background, so expired items can still be read for a while
+        if item is None or int(item["expires_at"]["N"]) <= time.time():
+            return None
+        return json.loads(item["bedrock_output"]["S"])
+
+    def put(self, key: str, bedrock_output: Dict, model_id: str, cdsi_version: str):
+        self.client.put_item(TableName=self.table_name, Item={
+            "cache_key": {"S": key},
+            "bedrock_output": {"S": json.dumps(bedrock_output)},
+            # Recorded so entries for a retired model or CDSi revision can be found and deleted
+            "model_id": {"S": model_id},
+            "cdsi_version": {"S": cdsi_version},
+            "expires_at": {"N": str(int(time.time()) + self.ttl_seconds)},
+        })
+
+class ClassificationCache:
+    """
+    Bedrock classification responses: an in-memory LRU backed by an optional persistent store.
+
+    Keys come from `classification_key`, so a new model or CDSi revision
+    never reads an old answer. `invalidate()` drops the in-memory tier when
+    either changes in a warm container; stale persistent entries are never
+    read again and expire through TTL.
+    """
+
+    def __init__(self, store=None, max_entries: int = MEMORY_ENTRIES):
+        self.store = store
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Cumulative per container
+        self.stats = {"memory_hits": 0, "store_hits": 0, "misses": 0}
+
+    def _remember(self, key: str, bedrock_output: Dict):
+        self._entries[key] = bedrock_output
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._entries[key]
+
+        stored = self.store.get(key) if self.store is not None else None
+        with self._lock:
+            if stored is None:
+                self.stats["misses"] += 1
+            else:
+                self.stats["store_hits"] += 1
+                self._remember(key, stored)
+        return stored
+
+    def put(self, key: str, bedrock_output: Dict, model_id: str, cdsi_version: str):
+        with self._lock:
+            self._remember(key, bedrock_output)
+        if self.store is not None:
+            self.store.put(key, bedrock_output, model_id, cdsi_version)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+def get_classification_cache() -> Optional[ClassificationCache]:
+    """The container-wide cache for the configured backend, created on first use; None when it is off."""
+    global _cache
+    if _cache is None and CACHE_BACKEND != "off":
+        store = None
+        if CACHE_BACKEND == "dynamodb":
+            from aws_clients import get_client
+            from ssm_config import get_parameter
+            store = DynamoDBClassificationStore(get_client("dynamodb"), get_parameter(CACHE_TABLE_PARAMETER))
+        _cache = ClassificationCache(store)
+    return _cache
@@ -0,0 +1,99 @@
+import copy
+from typing import Dict, List, Tuple
+
+from llm_cache import normalize_condition
+
+TOOL_NAME = "report_cdsi_matches"
+
+# Only code ids and line indexes come back from the model; titles and condition text are filled in here
+MATCHES_TOOL = {
+    "name": TOOL_NAME,
+    "description": "Report every confirmed CDSi match for the patient.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "matches": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "cdsi_code": {"type": "string", "description": "Observation Code from the reference"},
+                        "lines": {"type": "array", "items": {"type": "integer"},
+                                  "description": "Indexes of the supporting condition lines"},
+                    },
+                    "required": ["cdsi_code", "lines"],
+                },
+            },
+        },
+        "required": ["matches"],
+    },
+}
+
+def condition_lines(filtered_conditions: str) -> List[str]:
+    return [line.strip() for line in filtered_conditions.split("\n") if line.strip()]
+
+def numbered_conditions(filtered_conditions: str) -> str:
+    """The condition lines prefixed with the indexes the model reports them by."""
+    return "\n".join(f"[{i}] {line}" for i, line in enumerate(condition_lines(filtered_conditions)))
+
+def _tool_input(bedrock_response: Dict) -> Dict:
+    return next((block["input"] for block in bedrock_response.get("content", [])
+                 if block.get("type") == "tool_use" and block.get("name") == TOOL_NAME), {})
+
+def matches_by_condition(bedrock_response: Dict, filtered_conditions: str) -> Dict:
+    """
+    A copy of a structured-mode response that cites conditions by text instead of line index.
+
+    Cached responses are shared by patients whose conditions only differ in
+    order, dates or case, so the indexes of the patient the model answered
+    for are replaced with the normalized text of those lines.
+    """
+    lines = condition_lines(filtered_conditions)
+    response = copy.deepcopy(bedrock_response)
+    for match in _tool_input(response).get("matches", []):
+        indexes = match.pop("lines", [])
+        match["conditions"] = sorted({normalize_condition(lines[i]) for i in indexes
+                                      if isinstance(i, int) and 0 <= i < len(lines)})
+    return response
+
+def matches_by_line(cached_response: Dict, filtered_conditions: str) -> Dict:
+    """The inverse of `matches_by_condition` for the current patient: cited conditions back to their line indexes."""
+    indexes_by_condition: Dict[str, List[int]] = {}
+    for i, line in enumerate(condition_lines(filtered_conditions)):
+        indexes_by_condition.setdefault(normalize_condition(line), []).append(i)
+    response = copy.deepcopy(cached_response)
+    for match in _tool_input(response).get("matches", []):
+        conditions = match.pop("conditions", [])
+        match["lines"] = sorted(i for condition in conditions for i in indexes_by_condition.get(condition, []))
+    return response
+
+def parse_matches(bedrock_response: Dict, filtered_conditions: str, titles: Dict[str, str]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Validates the tool call in a structured-mode response.
+
+    Args:
+        bedrock_response (dict): The Messages API response.
+        filtered_conditions (str): The conditions the request was built from.
+        titles (dict): CDSi Observation Code -> Observation Title.
+
+    Returns:
+        tuple: (matches, rejected). Each match has the code, its title, and
+        the supporting line indexes and text. Codes that are not in the
+        table are rejected, as are matches citing no valid line.
+    """
+    lines = condition_lines(filtered_conditions)
+    tool_input = _tool_input(bedrock_response)
+
+    matches, rejected, seen = [], [], set()
+    for match in tool_input.get("matches", []):
+        code = str(match.get("cdsi_code", "")).strip()
+        indexes = sorted({i for i in match.get("lines", []) if isinstance(i, int) and 0 <= i < len(lines)})
+        if code not in titles:
+            rejected.append({"cdsi_code": code, "reason": "not in the CDSi table"})
+        elif not indexes:
+            rejected.append({"cdsi_code": code, "reason": "no supporting condition line"})
+        elif code not in seen:
+            seen.add(code)
+            matches.append({"cdsi_code": code, "observation_title": titles[code],
+                            "lines": indexes, "conditions": [lines[i] for i in indexes]})
+    return matches, rejected
@@ -0,0 +1,274 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError
+
+from aws_clients import get_client
+
+# Retried, and the concurrency limit is cut: the service is asking callers to slow down
+THROTTLE_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "Throttling", "RequestLimitExceeded"}
+# Retried with the limit left alone: transient failures on the service side
+TRANSIENT_ERROR_CODES = {"ServiceUnavailableException", "InternalServerException", "InternalServerError",
+                         "ModelNotReadyException", "ModelTimeoutException"}
+
+def error_code(error: BaseException) -> str:
+    return error.response.get("Error", {}).get("Code", "") if isinstance(error, ClientError) else ""
+
+def is_throttle(error: BaseException) -> bool:
+    return error_code(error) in THROTTLE_ERROR_CODES
+
+def is_retryable(error: BaseException) -> bool:
+    """Throttles, transient service errors and failed connections; validation, access and quota errors are not."""
+    return (error_code(error) in THROTTLE_ERROR_CODES | TRANSIENT_ERROR_CODES
+            or isinstance(error, BotocoreConnectionError))
+
+# Operations whose response "body" is an event stream read after the call returns
+STREAMING_OPERATIONS = {"invoke_model_with_response_stream"}
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^(attempt - 1))]."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average, with bursts of up to `burst`.
+
+    A call that finds the bucket empty still takes its token (the balance
+    goes negative) and sleeps until the token would have been refilled, so
+    waiting callers are spaced out instead of waking together.
+    """
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate or 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes a token and returns the seconds slept for it; no limit when `rate` is unset."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            delay = max(0.0, -self._tokens / self.rate)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+class AdaptiveConcurrencyLimit:
+    """
+    Caps calls in flight at a limit that adapts to throttling (AIMD).
+
+    A throttled call multiplies the limit by `decrease` (not below
+    `minimum`); every success adds 1 / limit, so the limit grows by one per
+    round of successful calls, up to `maximum`. Throttles from calls that
+    started before the last decrease are not counted again, so a burst of
+    rejections from one overloaded window only halves the limit once.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, decrease: float = 0.5):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease = decrease
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._generation = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Waits for a free slot; returns (ticket for `release`, seconds waited)."""
+        start = time.monotonic()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return self._generation, time.monotonic() - start
+
+    def release(self, ticket: int, outcome: str):
+        """`outcome` is "success", "throttle" or "error"; errors other than throttles leave the limit alone."""
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == "success":
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif outcome == "throttle" and ticket == self._generation:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._generation += 1
+            self._condition.notify_all()
+
+class HeldStream:
+    """
+    A response event stream that keeps its call's concurrency slot until it
+    has been read to the end, fails, or is closed.
+
+    Errors raised mid-stream are not retried: part of the answer has
+    already been handed to the caller.
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+        self._lock = threading.Lock()
+
+    def _finish(self, outcome: str):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._release(outcome)
+
+    def __iter__(self):
+        outcome = "error"  # also when the caller stops iterating early
+        try:
+            yield from self._stream
+            outcome = "success"
+        except Exception as e:
+            outcome = "throttle" if is_throttle(e) else "error"
+            raise
+        finally:
+            self._finish(outcome)
+
+    def close(self):
+        try:
+            if hasattr(self._stream, "close"):
+                self._stream.close()
+        finally:
+            self._finish("error")
+
+    def __del__(self):
+        # A body that is dropped unread must not keep its slot
+        self._finish("error")
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+class ThrottledClient:
+    """
+    A boto3 client whose model calls go through a rate limit, an adaptive
+    concurrency limit and retries with backoff.
+
+    Calls to `operations` (e.g. "invoke_model") take a token from the
+    bucket and a slot under the concurrency limit, and retryable failures
+    are retried up to `max_attempts` in total with jittered exponential
+    backoff. The last error is raised once attempts run out, when the next
+    backoff would end past the deadline set with `set_deadline`, or at once
+    when it is not retryable. A streaming operation's slot is held until
+    its response body has been read. Every other attribute is the plain
+    client's. The client comes from `aws_clients.get_client` without SDK
+    retries, on each call, so a stand-in installed with `set_client` is
+    picked up.
+
+    One instance is meant to be shared by every caller in the process,
+    so the limits apply to their combined traffic.
+    """
+
+    def __init__(self, service_name: str, operations: Iterable[str], region_name: Optional[str] = None,
+                 rate: Optional[float] = None, burst: Optional[float] = None, max_concurrency: int = 8,
+                 max_attempts: int = 6, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.service_name = service_name
+        self.region_name = region_name
+        self.operations = frozenset(operations)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrencyLimit(max_concurrency)
+        self.deadline: Optional[float] = None  # time.monotonic() value retries must not sleep past
+        self._lock = threading.Lock()
+        # Cumulative per instance; the wait times add up across concurrent callers
+        self.metrics = {"calls": 0, "attempts": 0, "retries": 0, "throttles": 0, "failures": 0, "deadline_stops": 0,
+                        "rate_wait_seconds": 0.0, "concurrency_wait_seconds": 0.0, "backoff_seconds": 0.0}
+
+    @classmethod
+    def from_env(cls, service_name: str, prefix: str, operations: Iterable[str], region_name: Optional[str] = None,
+                 **defaults) -> "ThrottledClient":
+        """
+        Settings from `<prefix>_RATE_PER_SECOND`, `<prefix>_BURST`,
+        `<prefix>_MAX_CONCURRENCY` and `<prefix>_MAX_ATTEMPTS`, falling back
+        to `defaults` and then the constructor's defaults.
+        """
+        settings = dict(defaults)
+        for name, suffix, cast in (("rate", "RATE_PER_SECOND", float), ("burst", "BURST", float),
+                                   ("max_concurrency", "MAX_CONCURRENCY", int), ("max_attempts", "MAX_ATTEMPTS", int)):
+            value = os.environ.get(f"{prefix}_{suffix}")
+            if value:
+                settings[name] = cast(value)
+        return cls(service_name, operations, region_name=region_name, **settings)
+
+    @property
+    def client(self):
+        return get_client(self.service_name, self.region_name, sdk_retries=False)
+
+    def set_deadline(self, context=None, limit_seconds: Optional[float] = None, reserve_seconds: float = 1.0):
+        """
+        Sets the deadline for this invocation's retries.
+
+        It is the Lambda `context.get_remaining_time_in_millis()`, capped at
+        `limit_seconds` (e.g. API Gateway's timeout), less `reserve_seconds`
+        left to build the response. With neither, retries have no deadline.
+        """
+        budgets = [seconds for seconds in (context.get_remaining_time_in_millis() / 1000 if context else None,
+                                           limit_seconds) if seconds is not None]
+        self.deadline = time.monotonic() + min(budgets) - reserve_seconds if budgets else None
+
+    def __getattr__(self, name):
+        if name in self.operations:
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+        return getattr(self.client, name)
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.metrics[name] += value
+
+    def call(self, operation: str, *args, **kwargs):
+        """Calls `operation` on the client under the limits, retrying retryable failures."""
+        self._count(calls=1)
+        for attempt in range(1, self.max_attempts + 1):
+            rate_wait = self.bucket.acquire()
+            ticket, concurrency_wait = self.concurrency.acquire()
+            self._count(attempts=1, rate_wait_seconds=rate_wait, concurrency_wait_seconds=concurrency_wait)
+            outcome = "error"
+            try:
+                result = getattr(self.client, operation)(*args, **kwargs)
+                if operation in STREAMING_OPERATIONS:
+                    result["body"] = HeldStream(result["body"], lambda outcome: self.concurrency.release(ticket, outcome))
+                    outcome = None  # released by the stream
+                else:
+                    outcome = "success"
+                return result
+            except Exception as e:
+                outcome = "throttle" if is_throttle(e) else "error"
+                if outcome == "throttle":
+                    self._count(throttles=1)
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                if not is_retryable(e) or attempt == self.max_attempts:
+                    self._count(failures=1)
+                    raise
+                if self.deadline is not None and time.monotonic() + delay > self.deadline:
+                    # Answer (429/503) while the caller is still waiting instead of sleeping past it
+                    self._count(failures=1, deadline_stops=1)
+                    raise
+            finally:
+                if outcome is not None:
+                    self.concurrency.release(ticket, outcome)
+            self._count(retries=1, backoff_seconds=delay)
+            time.sleep(delay)
+
+    def snapshot(self) -> Dict:
+        """The cumulative metrics plus the current concurrency limit."""
+        with self._lock:
+            metrics = {name: round(value, 3) if isinstance(value, float) else value for name, value in self.metrics.items()}
+        metrics["concurrency_limit"] = round(self.concurrency.limit, 2)
+        return metrics
+
+    def log_metrics(self, label: str):
+        """Logs the metrics as one JSON line, like the lambdas' other per-call stats."""
+        print(json.dumps({label: self.snapshot()}))
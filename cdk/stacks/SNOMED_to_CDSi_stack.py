@@ -13,6 +13,15 @@ from constructs import Construct
 
 BUCKET_NAME = "hl7-xml-to-snomed-code"
 TABLE_NAME = "snomed-to-cdsi"
+# "dynamodb" or "index" (compiled index built by SNOMED_to_CDSi/one_time_parser/build_index.py)
+LOOKUP_BACKEND = "dynamodb"
+# Match child concepts through their CDSi-mapped is-a ancestors (needs build_hierarchy.py output)
+HIERARCHY_EXPANSION = "false"
+# Per-line Comprehend Medical results, shared by every container of the condition lambda
+COMPREHEND_CACHE_TABLE_NAME = "comprehend-snomedct-cache"
+# Client-side limits on InferSNOMEDCT calls per container: concurrent requests (halved on throttles) and retry attempts
+COMPREHEND_MAX_CONCURRENCY = "4"
+COMPREHEND_MAX_ATTEMPTS = "6"
 
 class ServerlessSNOMEDTOCDSi(Stack):
     def __init__(self, scope: Construct, id: str, **kwargs):
@@ -44,6 +53,23 @@ class ServerlessSNOMEDTOCDSi(Stack):
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
         )
 
+        ssm.StringParameter(
+            self, "DynamoComprehendCacheTableName",
+            parameter_name="/config/DynamoComprehendCacheTableName",
+            string_value=COMPREHEND_CACHE_TABLE_NAME
+        )
+
+        dynamodb.Table(
+            self, "ComprehendCacheTable",
+            table_name=COMPREHEND_CACHE_TABLE_NAME,
+            partition_key=dynamodb.Attribute(
+                name="line_hash",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expires_at",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+
         lambda_role = iam.Role(
             self, "LambdaExecutionRole",
             assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
@@ -56,6 +82,26 @@ class ServerlessSNOMEDTOCDSi(Stack):
             ]
         )
 
+        # Role Comprehend Medical assumes in batch mode to read staged inputs and write job output
+        comprehend_data_access_role = iam.Role(
+            self, "ComprehendMedicalDataAccessRole",
+            assumed_by=iam.ServicePrincipal("comprehendmedical.amazonaws.com")
+        )
+        comprehend_data_access_role.add_to_policy(iam.PolicyStatement(
+            actions=["s3:GetObject", "s3:PutObject", "s3:ListBucket"],
+            resources=[f"arn:aws:s3:::{BUCKET_NAME}", f"arn:aws:s3:::{BUCKET_NAME}/comprehend_jobs/*"]
+        ))
+        lambda_role.add_to_policy(iam.PolicyStatement(
+            actions=["iam:PassRole"],
+            resources=[comprehend_data_access_role.role_arn]
+        ))
+
+        ssm.StringParameter(
+            self, "ComprehendMedicalDataAccessRoleArn",
+            parameter_name="/config/ComprehendMedicalDataAccessRoleArn",
+            string_value=comprehend_data_access_role.role_arn
+        )
+
         #  Lambda Layer for dependencies
         dependencies_layer = _lambda.LayerVersion(
             self, "DependenciesLayerSNOMEDTOCDSi",
@@ -73,7 +119,11 @@ class ServerlessSNOMEDTOCDSi(Stack):
             role=lambda_role,
             timeout=Duration.seconds(30),
             memory_size=256,
-            layers=[dependencies_layer]
+            layers=[dependencies_layer],
+            environment={
+                "SNOMED_CDSI_BACKEND": LOOKUP_BACKEND,
+                "SNOMED_HIERARCHY_EXPANSION": HIERARCHY_EXPANSION
+            }
         )
 
         # Lambda Function: SNOMED to CDSi Direct Mapping
@@ -85,7 +135,11 @@ class ServerlessSNOMEDTOCDSi(Stack):
             role=lambda_role,
             timeout=Duration.seconds(30),
             memory_size=256,
-            layers=[dependencies_layer]
+            layers=[dependencies_layer],
+            environment={
+                "SNOMED_CDSI_BACKEND": LOOKUP_BACKEND,
+                "SNOMED_HIERARCHY_EXPANSION": HIERARCHY_EXPANSION
+            }
         )
 
         # Lambda Function: Condition to SNOMED to CDSi
@@ -97,7 +151,13 @@ class ServerlessSNOMEDTOCDSi(Stack):
             role=lambda_role,
             timeout=Duration.seconds(30),
             memory_size=256,
-            layers=[dependencies_layer]
+            layers=[dependencies_layer],
+            environment={
+                "SNOMED_CDSI_BACKEND": LOOKUP_BACKEND,
+                "COMPREHEND_CACHE_BACKEND": "dynamodb",
+                "COMPREHEND_MAX_CONCURRENCY": COMPREHEND_MAX_CONCURRENCY,
+                "COMPREHEND_MAX_ATTEMPTS": COMPREHEND_MAX_ATTEMPTS
+            }
         )
 
         # ✅ API Gateway to Trigger Lambda
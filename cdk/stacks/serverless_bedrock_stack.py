@@ -9,11 +9,35 @@ from aws_cdk import aws_s3 as s3
 from aws_cdk import aws_lambda as _lambda
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_ssm as ssm 
+from aws_cdk import aws_dynamodb as dynamodb
 from constructs import Construct
 
 BUCKET_NAME = "dxhub-immunization-classification"
 STATIC_CDSi_KEY = "static_data/CDSi.csv"
 MODEL_ID = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+# How often a warm container checks S3 (conditional GET on the ETag) for a new CDSi.csv
+CDSI_REVALIDATE_SECONDS = "300"
+# "full" sends Bedrock the whole CDSi table; "bm25" sends only the rows retrieved for the patient's conditions.
+# Rows BM25 misses are hidden from the model, so keep "full" until benchmarks/cdsi_retrieval_evaluation.py
+# shows bm25 recall on the real CDSi.csv
+CDSI_RETRIEVAL = "full"
+CDSI_RETRIEVAL_TOP_K = "5"
+# Mark the instructions + CDSi reference prefix for Bedrock prompt caching ("false" for models without it).
+# Only prefixes of at least PROMPT_CACHE_MIN_TOKENS are marked unless CDSI_RETRIEVAL is "full"; the few rows
+# bm25 retrieves are usually shorter than the model's minimum cacheable prefix
+PROMPT_CACHE = "true"
+PROMPT_CACHE_MIN_TOKENS = "1024"
+# Streaming mode: how often partial output is written to S3 for clients to poll
+STREAM_FLUSH_SECONDS = "0.5"
+# Default answer format when a request does not say: "text" (prose) or "structured" (codes + condition line indexes)
+OUTPUT_MODE = "text"
+# Classifications keyed by conditions, model and CDSi revision, shared by every container
+LLM_CACHE_TABLE_NAME = "llm-classification-cache"
+# Client-side limits on Bedrock calls per container: the on-demand quota for MODEL_ID (about 50 requests/min)
+# as a token bucket, a concurrency limit that halves on throttles, and retry attempts before answering 429
+BEDROCK_RATE_PER_SECOND = "0.8"
+BEDROCK_MAX_CONCURRENCY = "4"
+BEDROCK_MAX_ATTEMPTS = "6"
 
 class ServerlessBedrockStack(Stack):
     def __init__(self, scope: Construct, id: str, **kwargs):
@@ -38,6 +62,23 @@ class ServerlessBedrockStack(Stack):
             string_value= STATIC_CDSi_KEY
         )
 
+        ssm_llm_cache_table_param = ssm.StringParameter(
+            self, "DynamoLLMCacheTableName",
+            parameter_name="/config/DynamoLLMCacheTableName",
+            string_value=LLM_CACHE_TABLE_NAME
+        )
+
+        llm_cache_table = dynamodb.Table(
+            self, "LLMClassificationCacheTable",
+            table_name=LLM_CACHE_TABLE_NAME,
+            partition_key=dynamodb.Attribute(
+                name="cache_key",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expires_at",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+
         #  IAM Role for Lambda with necessary permissions
         lambda_role = iam.Role(
             self, "LambdaExecutionRole",
@@ -51,13 +92,39 @@ class ServerlessBedrockStack(Stack):
         )
 
         lambda_role.add_to_policy(iam.PolicyStatement(
-            actions=["ssm:GetParameter"],
+            actions=["ssm:GetParameter", "ssm:GetParameters"],
             resources=[
                 ssm_bucket_param.parameter_arn,
                 ssm_model_id_param.parameter_arn,
-                ssm_cdsi_param.parameter_arn
+                ssm_cdsi_param.parameter_arn,
+                ssm_llm_cache_table_param.parameter_arn
             ]
         ))
+        llm_cache_table.grant_read_write_data(lambda_role)
+
+        # Role Bedrock assumes in batch mode to read staged records and write job output
+        bedrock_batch_role = iam.Role(
+            self, "BedrockBatchInferenceRole",
+            assumed_by=iam.ServicePrincipal("bedrock.amazonaws.com")
+        )
+        bedrock_batch_role.add_to_policy(iam.PolicyStatement(
+            actions=["s3:GetObject", "s3:PutObject", "s3:ListBucket"],
+            resources=[f"arn:aws:s3:::{BUCKET_NAME}", f"arn:aws:s3:::{BUCKET_NAME}/llm_batch/*"]
+        ))
+        lambda_role.add_to_policy(iam.PolicyStatement(
+            actions=["iam:PassRole"],
+            resources=[bedrock_batch_role.role_arn]
+        ))
+
+        ssm_batch_role_param = ssm.StringParameter(
+            self, "SSMBedrockBatchRoleArn",
+            parameter_name="/config/BedrockBatchRoleArn",
+            string_value=bedrock_batch_role.role_arn
+        )
+        lambda_role.add_to_policy(iam.PolicyStatement(
+            actions=["ssm:GetParameter", "ssm:GetParameters"],
+            resources=[ssm_batch_role_param.parameter_arn]
+        ))
 
         #  Lambda Layer for dependencies
         dependencies_layer = _lambda.LayerVersion(
@@ -74,16 +141,39 @@ class ServerlessBedrockStack(Stack):
             handler="lambda_function.lambda_handler",
             code=_lambda.Code.from_asset("lambda/llm_l1_classification/src"),
             role=lambda_role,
-            timeout=Duration.seconds(30),
+            # API Gateway still cuts synchronous requests at 29s; streaming runs asynchronously and may take longer
+            timeout=Duration.seconds(120),
             memory_size=256,
             layers=[dependencies_layer],
             environment={
                 "SSM_BUCKET_NAME": ssm_bucket_param.parameter_name,
                 "SSM_MODEL_ID": ssm_model_id_param.parameter_name,
-                "SSM_STATIC_CDSi_KEY": ssm_cdsi_param.parameter_name
+                "SSM_STATIC_CDSi_KEY": ssm_cdsi_param.parameter_name,
+                "CDSI_REVALIDATE_SECONDS": CDSI_REVALIDATE_SECONDS,
+                "CDSI_RETRIEVAL": CDSI_RETRIEVAL,
+                "CDSI_RETRIEVAL_TOP_K": CDSI_RETRIEVAL_TOP_K,
+                "PROMPT_CACHE": PROMPT_CACHE,
+                "PROMPT_CACHE_MIN_TOKENS": PROMPT_CACHE_MIN_TOKENS,
+                "STREAM_FLUSH_SECONDS": STREAM_FLUSH_SECONDS,
+                "LLM_CACHE_BACKEND": "dynamodb",
+                "OUTPUT_MODE": OUTPUT_MODE,
+                "BEDROCK_RATE_PER_SECOND": BEDROCK_RATE_PER_SECOND,
+                "BEDROCK_MAX_CONCURRENCY": BEDROCK_MAX_CONCURRENCY,
+                "BEDROCK_MAX_ATTEMPTS": BEDROCK_MAX_ATTEMPTS
             }
         )
 
+        # Streaming requests hand the work to an asynchronous invocation of the same function.
+        # A separate policy, since the role's default policy cannot reference the function it is attached to.
+        iam.Policy(
+            self, "SelfInvokePolicy",
+            roles=[lambda_role],
+            statements=[iam.PolicyStatement(
+                actions=["lambda:InvokeFunction"],
+                resources=[lambda_function.function_arn]
+            )]
+        )
+
         # ✅ API Gateway to Trigger Lambda
         api = apigw.LambdaRestApi(
             self, "Level_1_Immunization_Classification_API",
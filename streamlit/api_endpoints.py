@@ -1,23 +1,20 @@
+import time
+
 import requests
-import boto3
+from ssm_config import get_parameters
 
-ssm = boto3.client("ssm")
 hl7_to_snomed_direct_route = "hl7-to-snomed-to-cdsi"
 comprehend_condition_route = "condition-snomed-to-cdsi"
 
+# Both endpoints are fetched in one call and cached between button clicks
+LEVEL1_ENDPOINT_PARAMETER = "/config/Level1IZClassificationEndpoint"
+SNOMED_API_URL_PARAMETER = "/config/SNOMEDToCDSiAPIURL"
+
 def get_level1_iz_classification_endpoint():
-    response = ssm.get_parameter(
-        Name="/config/Level1IZClassificationEndpoint",
-        WithDecryption=False
-    )
-    return response['Parameter']['Value']
+    return get_parameters(LEVEL1_ENDPOINT_PARAMETER, SNOMED_API_URL_PARAMETER)[LEVEL1_ENDPOINT_PARAMETER]
 
 def get_hl7_to_snomed_to_cdsi_endpoint():
-    response = ssm.get_parameter(
-        Name="/config/SNOMEDToCDSiAPIURL",
-        WithDecryption=False
-    )
-    return response['Parameter']['Value']
+    return get_parameters(LEVEL1_ENDPOINT_PARAMETER, SNOMED_API_URL_PARAMETER)[SNOMED_API_URL_PARAMETER]
 def call_condition_api(file_key):
     url = get_level1_iz_classification_endpoint()
     headers = {"Content-Type": "application/json"}
@@ -32,6 +29,54 @@ def call_condition_api(file_key):
             return "Error: Unexpected response format"
     else:
         return "Error: Failed to get response from API"
+
+def call_condition_structured_api(file_key):
+    """Structured mode of the Level-1 endpoint: matched codes with titles and supporting condition lines."""
+    url = get_level1_iz_classification_endpoint()
+    headers = {"Content-Type": "application/json"}
+    data = {"file_key": file_key, "output": "structured"}
+
+    response = requests.post(url, headers=headers, json=data)
+    if response.status_code == 200:
+        response_json = response.json()
+        if "cdsi_results" not in response_json:
+            return {"error": "Unexpected response format"}
+        return response_json
+    else:
+        return {"error": "Failed to get response from API"}
+
+def stream_condition_api(file_key, poll_seconds=0.5, timeout_seconds=300):
+    """
+    Streaming mode of the Level-1 endpoint. Yields the output text so far
+    each time it grows, and the final text last.
+    """
+    url = get_level1_iz_classification_endpoint()
+    headers = {"Content-Type": "application/json"}
+
+    response = requests.post(url, headers=headers, json={"file_key": file_key, "stream": True})
+    if response.status_code != 202:
+        yield "Error: Failed to get response from API"
+        return
+    stream_id = response.json()["stream_id"]
+
+    shown = ""
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        response = requests.post(url, headers=headers, json={"stream_id": stream_id})
+        if response.status_code != 200:
+            yield "Error: Failed to get response from API"
+            return
+        state = response.json()
+        if state["status"] == "error":
+            yield f"Error: {state.get('error', 'Classification failed')}"
+            return
+        if state["text"] != shown:
+            shown = state["text"]
+            yield shown
+        if state["status"] == "complete":
+            return
+        time.sleep(poll_seconds)
+    yield shown + "\n\nError: Timed out waiting for the rest of the response"
     
 def call_snomed_to_cdsi_api(file_key):
     url = get_hl7_to_snomed_to_cdsi_endpoint() + hl7_to_snomed_direct_route
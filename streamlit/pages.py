@@ -1,5 +1,5 @@
 import streamlit as st
-from api_endpoints import call_condition_api, call_snomed_to_cdsi_api, call_condition_snomed_to_cdsi_api
+from api_endpoints import call_condition_api, call_condition_structured_api, stream_condition_api, call_snomed_to_cdsi_api, call_condition_snomed_to_cdsi_api
 
 def condition_identifier_page():
     st.title("LLM-Based Classification")
@@ -12,16 +12,41 @@ def condition_identifier_page():
         st.session_state.submitted = False
     
     file_key = st.text_input("Enter the S3 file key:", value=st.session_state.file_key, key="file_key_input")
+    output = st.radio("Output", ["Matched codes", "Full explanation"], horizontal=True)
+    stream = output == "Full explanation" and st.checkbox("Show output as it is generated", value=True)
     
     if st.button("Submit"):
         st.session_state.file_key = file_key
         st.session_state.submitted = True
         st.write(f"Processing file: {file_key}")
-        with st.spinner("Analyzing conditions, please wait..."):
-            st.session_state.result = call_condition_api(file_key)
+        if output == "Matched codes":
+            with st.spinner("Analyzing conditions, please wait..."):
+                st.session_state.result = call_condition_structured_api(file_key)
+        elif stream:
+            st.subheader("Generated Output")
+            partial = st.empty()
+            with st.spinner("Analyzing conditions, please wait..."):
+                for text in stream_condition_api(file_key):
+                    st.session_state.result = text
+                    partial.markdown(f"""<div style="word-wrap: break-word; white-space: pre-wrap;">{text}</div>""", unsafe_allow_html=True)
+        else:
+            with st.spinner("Analyzing conditions, please wait..."):
+                st.session_state.result = call_condition_api(file_key)
         st.rerun()
     
-    if st.session_state.result:
+    if isinstance(st.session_state.result, dict):
+        st.subheader("Matched CDSi Codes")
+        if "error" in st.session_state.result:
+            st.error(st.session_state.result["error"])
+        elif not st.session_state.result["cdsi_results"]:
+            st.write("No confirmed matches.")
+        for match in st.session_state.result.get("cdsi_results", []):
+            st.markdown(f"#### 🏥 CDSi Code **{match['cdsi_code']}**: {match['observation_title']}")
+            st.write("**Supporting Conditions:**")
+            for condition in match["conditions"]:
+                st.markdown(f"- {condition}")
+            st.markdown("---")
+    elif st.session_state.result:
         st.subheader("Generated Output")
         st.markdown(f"""<div style="word-wrap: break-word; white-space: pre-wrap;">{st.session_state.result}</div>""", unsafe_allow_html=True)
 
@@ -60,7 +85,12 @@ def snomed_to_cdsi_page():
             st.write("**SNOMED References:**")
             
             for ref in data["snomed_references"]:
-                st.markdown(f"- **{ref['snomed_code']}**: {ref['snomed_description']}")
+                if "matched_via" in ref:
+                    via = ref["matched_via"]
+                    st.markdown(f"- **{ref['snomed_code']}**: {ref['snomed_description'] or 'no description'} "
+                                f"(is a {via['snomed_description']}, via ancestor {via['snomed_code']})")
+                else:
+                    st.markdown(f"- **{ref['snomed_code']}**: {ref['snomed_description']}")
 
             st.markdown("---")  # Separator for clarity
 
@@ -104,5 +134,9 @@ def condition_snomed_to_cdsi_page():
                 for snomed_ref in data["snomed_references"]:
                     st.markdown(f"**SNOMED Code:** `{snomed_ref['snomed_code']}` - {snomed_ref['snomed_description']}")
                     st.markdown(f"- Confidence: `{snomed_ref['confidence']:.4f}`")
+                    if snomed_ref.get("resolved_by") == "ccda_code":
+                        st.markdown("- Resolved by: code recorded in the CCDA")
+                    elif snomed_ref.get("resolved_by") == "comprehend":
+                        st.markdown("- Resolved by: Comprehend Medical")
                     st.markdown(f"- Text Reference: `{snomed_ref['text_reference']}`")
                 st.markdown("---")
@@ -0,0 +1,28 @@
+import importlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_ROOT = os.path.join(ROOT, "cdk", "lambda")
+
+# Nothing under test talks to AWS; clients only need a region to be created
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+def load_lambda_modules(lambda_name, *module_names, extra_paths=()):
+    """
+    Imports `module_names` from cdk/lambda/<lambda_name>/src.
+
+    The lambdas ship copies of the same shared modules (ssm_config,
+    aws_clients, snomed_to_cdsi_logic, ...), so modules another test loaded
+    from a different lambda are dropped from sys.modules first.
+    """
+    for name, module in list(sys.modules.items()):
+        if os.path.abspath(getattr(module, "__file__", None) or "").startswith(LAMBDA_ROOT):
+            del sys.modules[name]
+    paths = [os.path.join(LAMBDA_ROOT, lambda_name, "src"), *extra_paths]
+    sys.path[:0] = paths
+    try:
+        modules = [importlib.import_module(name) for name in module_names]
+    finally:
+        del sys.path[:len(paths)]
+    return modules[0] if len(modules) == 1 else modules
@@ -0,0 +1,139 @@
+import io
+import json
+
+import pytest
+
+from conftest import load_lambda_modules
+
+bulk_documents, logic = load_lambda_modules("SNOMED_to_CDSi", "bulk_documents", "snomed_to_cdsi_logic")
+
+# 111 is-a 222 is-a 333; 222 and 333 are mapped, 111 is not
+ROWS = {
+    222: [{"cdsi_code": 1, "snomed_description": "Two two two", "observation_title": "One"}],
+    333: [{"cdsi_code": 2, "snomed_description": "Three three three", "observation_title": "Two"}],
+}
+ANCESTORS = {111: [222, 333], 222: [333]}
+
+class NoSuchKey(Exception):
+    pass
+
+class LocalS3:
+    """get_object, put_object and list_objects_v2 pagination over a dict of keys."""
+
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self, objects):
+        self.objects = dict(objects)
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def get_paginator(self, operation):
+        s3 = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix, StartAfter=""):
+                keys = sorted(key for key in s3.objects if key.startswith(Prefix) and key > StartAfter)
+                for i in range(0, len(keys), 2):
+                    yield {"Contents": [{"Key": key} for key in keys[i:i + 2]]}
+
+        return Paginator()
+
+class Hierarchy:
+    def mapped_ancestors(self, code):
+        return ANCESTORS.get(code, [])
+
+class Context:
+    """Runs out of time after `batches` checks."""
+
+    def __init__(self, batches):
+        self.batches = batches
+
+    def get_remaining_time_in_millis(self):
+        self.batches -= 1
+        return 60000 if self.batches >= 0 else 0
+
+def extract_snomed_codes(response, key):
+    return set(json.loads(response["Body"].read()))
+
+@pytest.fixture
+def lookups(monkeypatch):
+    requested = []
+
+    def lookup_snomed_codes(codes):
+        requested.append(set(codes))
+        return {code: ROWS[code] for code in codes if code in ROWS}
+
+    monkeypatch.setattr(logic, "HIERARCHY_EXPANSION", True)
+    monkeypatch.setattr(logic, "get_hierarchy", Hierarchy)
+    monkeypatch.setattr(logic, "lookup_snomed_codes", lookup_snomed_codes)
+    monkeypatch.setattr(bulk_documents, "BATCH_SIZE", 1)
+    return requested
+
+def documents(*code_sets):
+    return {f"docs/d{i}.json": json.dumps(sorted(codes)).encode("utf-8") for i, codes in enumerate(code_sets, 1)}
+
+def results(s3, output_prefix):
+    lines = []
+    for key in sorted(key for key in s3.objects if key.startswith(output_prefix) and key.endswith(".jsonl")):
+        lines += [json.loads(line) for line in s3.objects[key].decode("utf-8").splitlines()]
+    return {line["s3_key"]: line.get("cdsi_results", line.get("error")) for line in lines}
+
+def expected(*code_sets):
+    """What the single-document path returns for each document, through a JSON round trip like the parts."""
+    return {f"docs/d{i}.json": json.loads(json.dumps(logic.snomed_set_with_cdsi_codes(codes)))
+            for i, codes in enumerate(code_sets, 1)}
+
+def test_code_first_seen_as_an_ancestor_keeps_its_own_ancestor_matches(lookups):
+    code_sets = [{111}, {222}]
+    s3 = LocalS3(documents(*code_sets))
+    status = bulk_documents.run_bulk(s3, "bucket", {"s3_prefix": "docs/", "run_id": "r"}, None, extract_snomed_codes)
+
+    assert status["status"] == "complete"
+    found = results(s3, status["output_prefix"])
+    assert found == expected(*code_sets)
+    assert "2" in found["docs/d2.json"]  # CDSi 2 through ancestor 333
+    assert lookups[1] == {222, 333}  # 222 was resolved again for its own ancestors
+
+def test_resumes_from_the_checkpoint_without_repeating_documents(lookups):
+    code_sets = [{111}, {222}, {333}, {444}, {222, 333}]
+    s3 = LocalS3(documents(*code_sets))
+    body = {"s3_prefix": "docs/", "run_id": "resumed"}
+
+    first = bulk_documents.run_bulk(s3, "bucket", body, Context(batches=2), extract_snomed_codes)
+    assert first["status"] == "incomplete"
+    assert first["documents_processed"] == 2
+    assert first["last_key"] == "docs/d2.json"
+
+    second = bulk_documents.run_bulk(s3, "bucket", body, Context(batches=10), extract_snomed_codes)
+    assert second["status"] == "complete"
+    assert second["parts_written"] == second["documents_processed"] == 5
+    assert results(s3, second["output_prefix"]) == expected(*code_sets)
+
+    # A finished run is not redone
+    assert bulk_documents.run_bulk(s3, "bucket", body, None, extract_snomed_codes)["parts_written"] == 5
+
+def test_manifest_runs_resume_by_position_and_record_unreadable_documents(lookups):
+    code_sets = [{111}, {222}, {333}]
+    objects = documents(*code_sets)
+    objects["manifest.txt"] = "docs/d1.json\ndocs/missing.json\ndocs/d2.json\ndocs/d3.json\n".encode("utf-8")
+    s3 = LocalS3(objects)
+    body = {"manifest_key": "manifest.txt", "run_id": "manifest"}
+
+    assert bulk_documents.run_bulk(s3, "bucket", body, Context(batches=1), extract_snomed_codes)["manifest_position"] == 1
+    status = bulk_documents.run_bulk(s3, "bucket", body, None, extract_snomed_codes)
+    assert status["documents_processed"] == 4
+    assert status["documents_failed"] == 1
+    found = results(s3, status["output_prefix"])
+    assert found.pop("docs/missing.json") == "docs/missing.json"
+    assert found == expected(*code_sets)
+
+def test_needs_a_prefix_or_a_manifest():
+    with pytest.raises(ValueError):
+        bulk_documents.run_bulk(LocalS3({}), "bucket", {}, None, extract_snomed_codes)
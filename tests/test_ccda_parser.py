@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT, load_lambda_modules
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+from synthetic_ccda import make_ccda  # noqa: E402
+
+PROBLEM = ('<entry><act classCode="ACT" moodCode="EVN"><entryRelationship typeCode="SUBJ">'
+           '<observation classCode="OBS" moodCode="EVN"><effectiveTime><low value="20200101"/></effectiveTime>'
+           '<value code="44054006" codeSystem="2.16.840.1.113883.6.96" displayName="Diabetes"/>'
+           '</observation></entryRelationship></act></entry>')
+
+def document(*sections):
+    return ('<ClinicalDocument xmlns="urn:hl7-org:v3"><component><structuredBody>'
+            + "".join(f"<component><section>{section}</section></component>" for section in sections)
+            + "</structuredBody></component></ClinicalDocument>")
+
+@pytest.fixture(params=["SNOMED_to_CDSi", "comprehend_code_inference"])
+def ccda_parser(request):
+    return load_lambda_modules(request.param, "ccda_parser")
+
+def test_code_before_title_still_falls_back_to_the_title(ccda_parser):
+    # The Problems templateId without its ".1" entries-required suffix, with <code> before <title>
+    xml = document('<templateId root="2.16.840.1.113883.10.20.22.2.5"/>'
+                   '<code code="11450-4" codeSystem="2.16.840.1.113883.6.1"/><title>Problems</title>'
+                   f"<text>Diabetes</text>{PROBLEM}")
+    assert [entry.code for entry in ccda_parser.parse_ccda(xml).problems] == ["44054006"]
+
+def test_id_and_code_between_template_ids_are_part_of_the_header(ccda_parser):
+    xml = document('<templateId root="2.16.840.1.113883.10.20.22.2.1"/><id root="1.2.3"/>'
+                   '<code code="11450-4" codeSystem="2.16.840.1.113883.6.1"/>'
+                   '<templateId root="2.16.840.1.113883.10.20.22.2.5.1"/><title>Conditions</title>'
+                   f"{PROBLEM}")
+    assert [entry.code for entry in ccda_parser.parse_ccda(xml).problems] == ["44054006"]
+
+def test_section_without_a_title_is_classified_by_its_first_content(ccda_parser):
+    xml = document(f'<templateId root="2.16.840.1.113883.10.20.22.2.5.1"/>{PROBLEM}')
+    assert len(ccda_parser.parse_ccda(xml).problems) == 1
+
+def test_synthetic_document_sections_are_all_found(ccda_parser):
+    parsed = ccda_parser.parse_ccda(make_ccda(50_000, seed=3, problem_count=5))
+    assert len(parsed.problems) == 5
+    assert len(parsed.procedures) == 2
+    assert len(parsed.medications) == 3
@@ -0,0 +1,100 @@
+import io
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from conftest import load_lambda_modules
+
+condition_comprehend_lambda, comprehend_jobs = load_lambda_modules(
+    "comprehend_code_inference", "condition_comprehend_lambda", "comprehend_jobs")
+
+DOCUMENTS = {
+    "ccda/1.xml": (["195967001"], ["Asthma"]),
+    "ccda/2.xml": ([], ["Anemia"]),
+}
+
+class LocalS3:
+    """get_object and put_object over a dict of keys; missing keys raise NoSuchKey like S3."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": Key}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+def read_problems(bucket_name, s3_key):
+    if s3_key not in DOCUMENTS:
+        raise Exception(f"Could not retrieve {s3_key} from S3")
+    return DOCUMENTS[s3_key]
+
+def infer(text):
+    return {"Entities": [{"Id": 0, "BeginOffset": 0, "EndOffset": len(text), "Text": text, "SNOMEDCTConcepts": []}]}
+
+def map_to_cdsi(entities, threshold, medical_condition_only, coded_items):
+    return {"texts": [entity["Text"] for entity in entities], "coded": coded_items}
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    s3 = LocalS3()
+    job_client = comprehend_jobs.LocalSnomedctJobClient(str(tmp_path), infer, polls_until_complete=0)
+    job_client.prefix = "comprehend_jobs/"
+
+    def get_client(service, region=None):
+        return s3 if service == "s3" else None
+
+    monkeypatch.setattr(condition_comprehend_lambda, "get_client", get_client)
+    monkeypatch.setattr(condition_comprehend_lambda, "get_s3_bucket_name", lambda: "bucket")
+    monkeypatch.setattr(condition_comprehend_lambda, "get_parameter", lambda name: "role")
+    monkeypatch.setattr(condition_comprehend_lambda, "ComprehendMedicalJobClient", lambda *args: job_client)
+    monkeypatch.setattr(condition_comprehend_lambda, "read_problems", read_problems)
+    monkeypatch.setattr(condition_comprehend_lambda, "snomed_to_cdsi_mapping_with_confidence", map_to_cdsi)
+    return s3
+
+def call(body):
+    response = condition_comprehend_lambda.lambda_handler({"body": json.dumps(body)}, None)
+    return response["statusCode"], json.loads(response["body"])
+
+def test_unreadable_documents_are_reported_per_patient(s3):
+    status, submitted = call({"patients": {"p1": "ccda/1.xml", "p2": "ccda/2.xml", "p3": "ccda/missing.xml"},
+                              "run_id": "run-1"})
+    assert status == 200
+    assert submitted["patients"] == 3
+    assert submitted["unreadable"] == 1
+
+    status, collected = call({"run_id": "run-1"})
+    assert status == 200
+    assert collected["status"] == "COMPLETED"
+    assert collected["failed"] == 1
+    results = json.loads(s3.objects[collected["results_key"]])
+    assert results["p1"]["cdsi_results"] == {"texts": ["Asthma"], "coded": ["195967001"]}
+    assert results["p2"]["cdsi_results"] == {"texts": ["Anemia"], "coded": []}
+    assert "ccda/missing.xml" in results["p3"]["error"]
+
+def test_every_document_unreadable_still_completes(s3):
+    assert call({"patients": {"p1": "ccda/missing.xml"}, "run_id": "run-2"})[1]["job_id"] is None
+    status, collected = call({"run_id": "run-2"})
+    assert status == 200
+    assert (collected["patients"], collected["failed"]) == (1, 1)
+
+def test_unknown_run_id_is_a_404(s3):
+    status, body = call({"run_id": "no-such-run"})
+    assert status == 404
+    assert "no-such-run" in body["error"]
+
+@pytest.mark.parametrize("body", [
+    {"patients": []},
+    {"patients": {}},
+    {"patients": {"p1": 7}},
+    {"run_id": ""},
+    {"run_id": ["run-1"]},
+])
+def test_malformed_batch_requests_are_a_400(s3, body):
+    status, response = call(body)
+    assert status == 400
+    assert response["error"]
@@ -0,0 +1,130 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from conftest import load_lambda_modules
+
+comprehend_cache = load_lambda_modules("comprehend_code_inference", "comprehend_cache")
+
+class FlakyDynamoDB:
+    """batch_get_item/batch_write_item that leave all but `per_call` requests unprocessed."""
+
+    def __init__(self, per_call=None):
+        self.per_call = per_call
+        self.items = {}
+        self.requests = []
+
+    def _split(self, pending):
+        if self.per_call is None:
+            return pending, []
+        return pending[:self.per_call], pending[self.per_call:]
+
+    def batch_get_item(self, RequestItems):
+        (table, request), = RequestItems.items()
+        self.requests.append(("get", len(request["Keys"])))
+        done, rest = self._split(request["Keys"])
+        response = {"Responses": {table: [self.items[key["line_hash"]["S"]] for key in done
+                                          if key["line_hash"]["S"] in self.items]}}
+        if rest:
+            response["UnprocessedKeys"] = {table: dict(request, Keys=rest)}
+        return response
+
+    def batch_write_item(self, RequestItems):
+        (table, requests), = RequestItems.items()
+        self.requests.append(("put", len(requests)))
+        done, rest = self._split(requests)
+        for request in done:
+            item = request["PutRequest"]["Item"]
+            self.items[item["line_hash"]["S"]] = item
+        return {"UnprocessedItems": {table: rest}} if rest else {}
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(comprehend_cache.time, "sleep", slept.append)
+    return slept
+
+def results(count):
+    return {f"key-{i}": [{"Text": f"line {i}"}] for i in range(count)}
+
+def test_unprocessed_requests_are_resent_with_capped_backoff(sleeps):
+    table = FlakyDynamoDB(per_call=10)
+    store = comprehend_cache.DynamoDBResultStore(table, "cache", max_attempts=5, base_delay=0.05, max_delay=0.1)
+
+    store.put_many(results(25))
+    assert [size for _, size in table.requests] == [25, 15, 5]
+    assert len(table.items) == 25
+
+    table.requests.clear()
+    assert store.get_many([f"key-{i}" for i in range(25)]) == results(25)
+    assert [size for _, size in table.requests] == [25, 15, 5]
+
+    assert len(sleeps) == 4  # one before each resend
+    assert all(0 <= delay <= 0.1 for delay in sleeps)
+
+def test_gives_up_after_max_attempts(sleeps, capsys):
+    table = FlakyDynamoDB(per_call=1)
+    store = comprehend_cache.DynamoDBResultStore(table, "cache", max_attempts=3)
+
+    store.put_many(results(10))
+    assert len(table.requests) == 3
+    assert len(table.items) == 3
+    assert len(sleeps) == 2
+    assert '"comprehend_cache_unprocessed": {"operation": "batch_write_item", "items": 7' in capsys.readouterr().out
+
+    table.requests.clear()
+    found = store.get_many([f"key-{i}" for i in range(4)])
+    assert len(table.requests) == 3
+    assert set(found) == {"key-0", "key-1", "key-2"}  # key-3 is still unprocessed when attempts run out
+
+def test_fully_processed_batches_do_not_sleep(sleeps):
+    table = FlakyDynamoDB()
+    store = comprehend_cache.DynamoDBResultStore(table, "cache")
+    store.put_many(results(60))
+    assert store.get_many([f"key-{i}" for i in range(60)]) == results(60)
+    assert [size for _, size in table.requests] == [25, 25, 10, 60]
+    assert sleeps == []
+
+class UnavailableDynamoDB(FlakyDynamoDB):
+    def __init__(self, fail_gets=True, fail_puts=True):
+        super().__init__()
+        self.fail_gets = fail_gets
+        self.fail_puts = fail_puts
+
+    def batch_get_item(self, RequestItems):
+        if self.fail_gets:
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "BatchGetItem")
+        return super().batch_get_item(RequestItems)
+
+    def batch_write_item(self, RequestItems):
+        if self.fail_puts:
+            raise ClientError({"Error": {"Code": "ResourceNotFoundException"}}, "BatchWriteItem")
+        return super().batch_write_item(RequestItems)
+
+class InferClient:
+    def __init__(self):
+        self.texts = []
+
+    def infer_snomedct(self, Text):
+        self.texts.append(Text)
+        return {"Entities": []}
+
+@pytest.mark.parametrize("fail_gets, fail_puts", [(True, True), (True, False), (False, True)])
+def test_store_failures_fall_back_to_inference(sleeps, capsys, fail_gets, fail_puts):
+    table = UnavailableDynamoDB(fail_gets, fail_puts)
+    cache = comprehend_cache.ComprehendResultCache(comprehend_cache.DynamoDBResultStore(table, "cache"))
+    client = InferClient()
+
+    response = comprehend_cache.infer_snomedct_cached(client, ["Asthma", "Anemia"], cache)
+    assert response["Entities"] == []
+    assert client.texts == ["Asthma\nAnemia"]
+    assert cache.stats["misses"] == 2
+    assert cache.stats["store_errors"] == fail_gets + fail_puts
+    out = capsys.readouterr().out
+    assert ('"operation": "get_many", "items": 2' in out) == fail_gets
+    assert ('"operation": "put_many", "items": 2' in out) == fail_puts
+    assert len(table.items) == (0 if fail_puts else 2)
+
+    # The lines are still remembered in memory
+    comprehend_cache.infer_snomedct_cached(client, ["Asthma"], cache)
+    assert len(client.texts) == 1
+    assert cache.stats["memory_hits"] == 1
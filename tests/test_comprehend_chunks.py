@@ -0,0 +1,103 @@
+import random
+import re
+import threading
+
+import pytest
+
+from conftest import load_lambda_modules
+
+comprehend_chunks = load_lambda_modules("comprehend_code_inference", "comprehend_chunks")
+
+CONDITIONS = {
+    "Prediabetes": "714628002",
+    "Essential hypertension": "59621000",
+    "Diabetes mellitus type 2": "44054006",
+    "Asthma": "195967001",
+    "Chronic kidney disease stage 3": "433144002",
+    "Anemia": "271737000",
+}
+CONDITION_PATTERN = re.compile("|".join(re.escape(name) for name in sorted(CONDITIONS, key=len, reverse=True)))
+
+class TextSizeLimitExceededException(Exception):
+    pass
+
+class LocalComprehendMedical:
+    """infer_snomedct over known condition names, enforcing the request size limit."""
+
+    def __init__(self):
+        self.texts = []
+        self._lock = threading.Lock()
+
+    def infer_snomedct(self, Text):
+        with self._lock:
+            self.texts.append(Text)
+        if len(Text) > comprehend_chunks.MAX_TEXT_CHARACTERS:
+            raise TextSizeLimitExceededException(len(Text))
+        entities = [{
+            "Id": index,
+            "BeginOffset": match.start(),
+            "EndOffset": match.end(),
+            "Text": match.group(0),
+            "Category": "MEDICAL_CONDITION",
+            "Attributes": [],
+            "SNOMEDCTConcepts": [{"Code": CONDITIONS[match.group(0)], "Description": match.group(0)}],
+        } for index, match in enumerate(CONDITION_PATTERN.finditer(Text))]
+        # Ids repeat across responses; attributes point at other entities of the same response
+        for entity, related in zip(entities, entities[1:]):
+            entity["Attributes"].append({key: related[key] for key in ("Id", "BeginOffset", "EndOffset", "Text")})
+        return {"Entities": entities, "ModelVersion": "local"}
+
+def problem_list(count, seed=0):
+    rng = random.Random(seed)
+    return [f"{rng.choice(list(CONDITIONS))} (finding) noted at visit {i}" for i in range(count)]
+
+def assert_offsets_slice_the_text(result):
+    for entity in result["Entities"]:
+        for item in [entity, *entity["Attributes"]]:
+            assert result["Text"][item["BeginOffset"]:item["EndOffset"]] == item["Text"]
+
+@pytest.mark.parametrize("count", [1, 50, 3000])
+def test_every_chunk_fits_and_offsets_map_back_to_the_joined_text(count):
+    client = LocalComprehendMedical()
+    lines = problem_list(count)
+    result = comprehend_chunks.infer_snomedct_chunked(client, lines)
+
+    assert result["Text"] == "\n".join(lines)
+    assert result["Chunks"] == len(client.texts)
+    assert all(len(text) <= comprehend_chunks.MAX_TEXT_CHARACTERS for text in client.texts)
+    assert len(result["Entities"]) == count
+    assert_offsets_slice_the_text(result)
+
+def test_thousands_of_problems_need_several_requests():
+    lines = problem_list(3000)
+    assert len("\n".join(lines)) > comprehend_chunks.MAX_TEXT_CHARACTERS
+    with pytest.raises(TextSizeLimitExceededException):
+        LocalComprehendMedical().infer_snomedct(Text="\n".join(lines))
+    assert comprehend_chunks.infer_snomedct_chunked(LocalComprehendMedical(), lines)["Chunks"] > 1
+
+def test_ids_are_unique_across_chunks_and_attributes_follow_their_entity():
+    result = comprehend_chunks.infer_snomedct_chunked(LocalComprehendMedical(), problem_list(3000))
+    ids = [entity["Id"] for entity in result["Entities"]]
+    assert len(set(ids)) == len(ids)
+    by_id = {entity["Id"]: entity for entity in result["Entities"]}
+    for entity in result["Entities"]:
+        for attribute in entity["Attributes"]:
+            assert by_id[attribute["Id"]]["BeginOffset"] == attribute["BeginOffset"]
+
+def test_concurrent_run_matches_a_serial_one():
+    lines = problem_list(3000, seed=7)
+    concurrent = comprehend_chunks.infer_snomedct_chunked(LocalComprehendMedical(), lines, max_workers=8)
+    serial = comprehend_chunks.infer_snomedct_chunked(LocalComprehendMedical(), lines, max_workers=1)
+    assert concurrent == serial
+
+def test_a_line_longer_than_the_limit_is_split_at_whitespace():
+    lines = ["Asthma " + "word " * 30, "Anemia"]
+    text, chunks = comprehend_chunks.chunk_lines(lines, max_characters=40)
+    assert all(len(chunk) <= 40 for _, chunk in chunks)
+    assert all(text[offset:offset + len(chunk)] == chunk for offset, chunk in chunks)
+    assert "".join(chunk for _, chunk in chunks).replace("\n", "") == text.replace("\n", "")
+
+def test_no_lines_make_no_requests():
+    client = LocalComprehendMedical()
+    assert comprehend_chunks.infer_snomedct_chunked(client, []) == {"Entities": [], "Text": "", "Chunks": 0}
+    assert client.texts == []
@@ -0,0 +1,83 @@
+import json
+import re
+
+import pytest
+
+from conftest import load_lambda_modules
+
+comprehend_jobs, comprehend_chunks = load_lambda_modules(
+    "comprehend_code_inference", "comprehend_jobs", "comprehend_chunks")
+
+CONDITIONS = {"Asthma": "195967001", "Anemia": "271737000", "Essential hypertension": "59621000"}
+CONDITION_PATTERN = re.compile("|".join(re.escape(name) for name in CONDITIONS))
+
+def infer(text):
+    """A synchronous InferSNOMEDCT stand-in; Ids restart at 0 in every response."""
+    assert len(text) <= comprehend_chunks.MAX_TEXT_CHARACTERS
+    return {"Entities": [{
+        "Id": index, "BeginOffset": match.start(), "EndOffset": match.end(), "Text": match.group(0),
+        "SNOMEDCTConcepts": [{"Code": CONDITIONS[match.group(0)]}],
+    } for index, match in enumerate(CONDITION_PATTERN.finditer(text))]}
+
+class InferClient:
+    def infer_snomedct(self, Text):
+        return infer(Text)
+
+def map_to_cdsi(patient_id, entities):
+    return sorted({entity["SNOMEDCTConcepts"][0]["Code"] for entity in entities})
+
+PATIENTS = {
+    "patient/1": ["Asthma since childhood", "Anemia"],
+    "patient-2": [f"Essential hypertension, visit {i}" for i in range(600)],  # several input files
+    "patient-3": ["Sprained ankle"],
+}
+
+@pytest.fixture
+def job_client(tmp_path):
+    return comprehend_jobs.LocalSnomedctJobClient(str(tmp_path), infer, polls_until_complete=2)
+
+def test_submit_then_collect_maps_every_patient(job_client):
+    state = comprehend_jobs.submit_job(job_client, PATIENTS, run_id="run-1")
+    state = json.loads(json.dumps(state))  # saved between the two invocations
+    assert len(state["layout"]["patient-2"]) > 1
+
+    assert comprehend_jobs.collect_job(job_client, state, map_to_cdsi) is None
+    assert comprehend_jobs.collect_job(job_client, state, map_to_cdsi) is None
+    results = comprehend_jobs.collect_job(job_client, state, map_to_cdsi)
+
+    assert results["patient/1"]["cdsi_results"] == ["195967001", "271737000"]
+    assert results["patient-3"] == {"snomed_results": [], "cdsi_results": []}
+    text = "\n".join(PATIENTS["patient-2"])
+    entities = results["patient-2"]["snomed_results"]
+    assert len(entities) == 600
+    assert all(text[e["BeginOffset"]:e["EndOffset"]] == e["Text"] for e in entities)
+    assert len({e["Id"] for e in entities}) == 600
+
+def test_run_job_matches_the_synchronous_path(job_client):
+    results = comprehend_jobs.run_job(job_client, PATIENTS, map_to_cdsi, poll_seconds=0)
+    for patient_id, lines in PATIENTS.items():
+        synchronous = comprehend_chunks.infer_snomedct_chunked(InferClient(), lines)
+        assert results[patient_id]["snomed_results"] == synchronous["Entities"]
+
+def test_missing_output_is_reported_per_patient(job_client, tmp_path):
+    state = comprehend_jobs.submit_job(job_client, PATIENTS, run_id="run-2")
+    first_file = state["layout"]["patient/1"][0][0]
+    (tmp_path / "run-2" / "output" / (first_file + comprehend_jobs.OUTPUT_SUFFIX)).unlink()
+    job_client.polls_until_complete = 0
+    results = comprehend_jobs.collect_job(job_client, state, map_to_cdsi)
+    assert results["patient/1"] == {"error": f"No job output for {first_file}"}
+    assert "cdsi_results" in results["patient-3"]
+
+def test_failed_job_raises(job_client):
+    state = comprehend_jobs.submit_job(job_client, PATIENTS, run_id="run-3")
+    job_client.describe = lambda job_id: ("FAILED", "role cannot read the bucket")
+    with pytest.raises(RuntimeError, match="role cannot read the bucket"):
+        comprehend_jobs.collect_job(job_client, state, map_to_cdsi)
+
+def test_job_client_must_implement_the_whole_interface():
+    class StartOnly(comprehend_jobs.SnomedctJobClient):
+        def start(self, run_id, input_location, output_location):
+            return "job"
+
+    with pytest.raises(TypeError, match="abstract"):
+        StartOnly()
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from conftest import load_lambda_modules
+
+llm_batch, lambda_function = load_lambda_modules("llm_l1_classification", "llm_batch", "lambda_function")
+
+def invoke(model_input):
+    """Answers with the patient's first condition line, or fails for patients without one."""
+    conditions = model_input["messages"][0]["content"][0]["text"]
+    if not conditions:
+        raise ValueError("empty prompt")
+    return {"content": [{"type": "text", "text": f"CDSi Code: {conditions}"}]}
+
+def parse(patient_id, model_output):
+    return {"answer": model_output["content"][0]["text"]}
+
+def request(text):
+    return {"messages": [{"role": "user", "content": [{"type": "text", "text": text}]}]}
+
+PATIENTS = {f"ehr/patient-{i}.txt": request(f"{i:03d}") for i in range(5)}
+
+@pytest.fixture
+def job_client(tmp_path):
+    return llm_batch.LocalBatchJobClient(str(tmp_path), invoke, polls_until_complete=1)
+
+def test_submit_then_collect_maps_records_back_to_patients(job_client):
+    state = json.loads(json.dumps(llm_batch.submit_job(job_client, dict(PATIENTS, failing=request("")), "run-1")))
+    assert state["run_id"] == "run-1"
+    assert len(state["records"]) == 6
+
+    assert llm_batch.collect_job(job_client, state, parse) is None
+    results = llm_batch.collect_job(job_client, state, parse)
+    assert results["ehr/patient-3.txt"] == {"answer": "CDSi Code: 003"}
+    assert results["failing"] == {"error": "empty prompt"}
+
+def test_run_job_polls_until_complete(job_client):
+    results = llm_batch.run_job(job_client, PATIENTS, parse, poll_seconds=0)
+    assert results == {f"ehr/patient-{i}.txt": {"answer": f"CDSi Code: {i:03d}"} for i in range(5)}
+
+def test_panels_smaller_than_the_service_minimum_are_rejected(job_client):
+    job_client.min_records = 10
+    with pytest.raises(ValueError, match="at least 10 patients"):
+        llm_batch.submit_job(job_client, PATIENTS)
+
+def test_failed_job_raises(job_client):
+    state = llm_batch.submit_job(job_client, PATIENTS)
+    job_client.describe = lambda job_id: ("Failed", "model access denied")
+    with pytest.raises(RuntimeError, match="model access denied"):
+        llm_batch.collect_job(job_client, state, parse)
+
+def test_job_client_must_implement_the_whole_interface():
+    class StartOnly(llm_batch.BatchInferenceJobClient):
+        def start(self, run_id, input_location, output_location):
+            return "job"
+
+    with pytest.raises(TypeError, match="abstract"):
+        StartOnly()
+
+@pytest.mark.parametrize("batch", [{}, {"file_keys": []}, {"run_id": ""}, {"file_keys": "ehr/patient.txt"},
+                                   {"file_keys": [1, 2]}, ["ehr/patient.txt"]])
+def test_malformed_batch_request_is_a_400(batch):
+    response = lambda_function.lambda_handler({"httpMethod": "POST", "body": json.dumps({"batch": batch})}, None)
+    assert response["statusCode"] == 400
+    assert "file_keys" in json.loads(response["body"])["error"]
@@ -0,0 +1,86 @@
+import io
+import json
+import re
+
+import pytest
+
+from conftest import load_lambda_modules
+
+lambda_function, llm_cache, aws_clients = load_lambda_modules(
+    "llm_l1_classification", "lambda_function", "llm_cache", "aws_clients")
+
+CDSI = [["007", "Prediabetes"], ["059", "Hypertension"]]
+
+class LocalBedrock:
+    """Reports each CDSi row whose title appears in a numbered condition line, citing that line's index."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.calls += 1
+        request = json.loads(body)
+        prompt = request["messages"][0]["content"][0]["text"]
+        lines = dict((int(index), text.lower()) for index, text in re.findall(r"^\[(\d+)\] (.*)$", prompt, re.M))
+        if "tools" in request:
+            matches = [{"cdsi_code": code, "lines": [i for i, text in lines.items() if title.lower() in text]}
+                       for code, title in CDSI if any(title.lower() in text for text in lines.values())]
+            content = [{"type": "tool_use", "name": lambda_function.TOOL_NAME, "input": {"matches": matches}}]
+        else:
+            content = [{"type": "text", "text": f"Supporting Reference from Patient Record: {prompt.strip()}"}]
+        return {"body": io.BytesIO(json.dumps({"content": content, "usage": {}}).encode("utf-8"))}
+
+class Reference:
+    version_id = "v1"
+    titles = dict(CDSI)
+
+@pytest.fixture
+def model(monkeypatch):
+    model = LocalBedrock()
+    aws_clients.set_client("bedrock-runtime", model, region_name=lambda_function.BEDROCK_REGION)
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.ClassificationCache())
+    monkeypatch.setattr(lambda_function, "get_model_id", lambda: "model")
+    return model
+
+def structured_matches(conditions):
+    response, status = lambda_function.classify(conditions, Reference(), "reference", structured=True)
+    matches, rejected = lambda_function.parse_matches(response, conditions, Reference.titles)
+    assert rejected == []
+    return {match["cdsi_code"]: match["conditions"] for match in matches}, status
+
+def test_structured_hit_cites_the_current_patients_lines(model):
+    first = "2010-01-01 -            : Prediabetes (finding)\n2012-05-05 -            : Hypertension (disorder)"
+    second = "2019-03-03 -            : hypertension  (disorder)\n2001-07-07 -            : Prediabetes (finding)"
+
+    assert structured_matches(first) == ({
+        "007": ["2010-01-01 -            : Prediabetes (finding)"],
+        "059": ["2012-05-05 -            : Hypertension (disorder)"],
+    }, "miss")
+    assert structured_matches(second) == ({
+        "007": ["2001-07-07 -            : Prediabetes (finding)"],
+        "059": ["2019-03-03 -            : hypertension  (disorder)"],
+    }, "hit")
+    assert model.calls == 1
+
+def test_cached_structured_entry_holds_no_line_indexes(model):
+    conditions = "2010-01-01 -            : Prediabetes (finding)"
+    lambda_function.classify(conditions, Reference(), "reference", structured=True)
+    (cached,) = llm_cache._cache._entries.values()
+    (match,) = cached["content"][0]["input"]["matches"]
+    assert match == {"cdsi_code": "007", "conditions": ["prediabetes (finding)"]}
+
+def test_text_answers_are_not_shared_across_onset_dates(model):
+    first = "2010-01-01 -            : Prediabetes (finding)"
+    second = "2001-07-07 -            : Prediabetes (finding)"
+
+    response, status = lambda_function.classify(first, Reference(), "reference")
+    assert status == "miss"
+    response, status = lambda_function.classify(second, Reference(), "reference")
+    assert status == "miss"
+    assert "2001-07-07" in response["content"][0]["text"]
+    assert "2010-01-01" not in response["content"][0]["text"]
+
+    # The same dated lines in another order and spacing still hit
+    assert lambda_function.classify(f"{second}\n  {first}", Reference(), "reference")[1] == "miss"
+    assert lambda_function.classify(f"{first}\n{second}", Reference(), "reference")[1] == "hit"
+    assert model.calls == 3
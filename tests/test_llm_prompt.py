@@ -0,0 +1,29 @@
+import pytest
+
+from conftest import load_lambda_modules
+
+lambda_function = load_lambda_modules("llm_l1_classification", "lambda_function")
+
+SHORT_REFERENCE = "Code | Title\n007 | Diabetes"
+FULL_REFERENCE = "Code | Title\n" + "\n".join(f"{code:03d} | Observation title {code}" for code in range(400))
+
+def cache_points(system):
+    return [block for block in system if "cache_control" in block]
+
+@pytest.mark.parametrize("retrieval", ["bm25", "full"])
+def test_long_prefix_is_marked_for_caching(monkeypatch, retrieval):
+    monkeypatch.setattr(lambda_function, "CDSI_RETRIEVAL", retrieval)
+    system = lambda_function.build_system_prompt(FULL_REFERENCE, cache=True)
+    assert cache_points(system) == [system[-1]]
+
+def test_short_bm25_prefix_is_not_marked(monkeypatch):
+    monkeypatch.setattr(lambda_function, "CDSI_RETRIEVAL", "bm25")
+    assert cache_points(lambda_function.build_system_prompt(SHORT_REFERENCE, cache=True)) == []
+
+def test_full_retrieval_is_marked_whatever_its_length(monkeypatch):
+    monkeypatch.setattr(lambda_function, "CDSI_RETRIEVAL", "full")
+    assert len(cache_points(lambda_function.build_system_prompt(SHORT_REFERENCE, cache=True))) == 1
+
+def test_prompt_cache_off_never_marks(monkeypatch):
+    monkeypatch.setattr(lambda_function, "CDSI_RETRIEVAL", "full")
+    assert cache_points(lambda_function.build_system_prompt(FULL_REFERENCE, cache=False)) == []
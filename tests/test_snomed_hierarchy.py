@@ -0,0 +1,104 @@
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT, load_lambda_modules
+
+snomed_hierarchy, build_hierarchy = load_lambda_modules(
+    "SNOMED_to_CDSi", "snomed_hierarchy", "build_hierarchy",
+    extra_paths=[os.path.join(ROOT, "SNOMED_to_CDSi", "one_time_parser")])
+
+IS_A = snomed_hierarchy.IS_A
+FINDING_SITE = 363698007
+
+def row(rel_id, effective_time, active, source, destination, type_id=IS_A):
+    return "\t".join(map(str, [rel_id, effective_time, active, 900000000000207008, source, destination, 0, type_id,
+                               900000000000011006, 900000000000451002]))
+
+# A Full release: several rows may share a relationship id, and the latest effectiveTime wins
+RELATIONSHIPS = "\n".join([
+    "id\teffectiveTime\tactive\tmoduleId\tsourceId\tdestinationId\trelationshipGroup\ttypeId"
+    "\tcharacteristicTypeId\tmodifierId",
+    # chain 4 -> 3 -> 2 -> 1
+    row(1, 20200131, 1, 2, 1),
+    row(2, 20200131, 1, 3, 2),
+    row(3, 20200131, 1, 4, 3),
+    # inactive edge and a non-is-a attribute
+    row(4, 20200131, 0, 4, 8),
+    row(5, 20200131, 1, 4, 8, type_id=FINDING_SITE),
+    # diamond 7 -> {5, 6} -> 1
+    row(6, 20200131, 1, 5, 1),
+    row(7, 20200131, 1, 6, 1),
+    row(8, 20200131, 1, 7, 5),
+    row(9, 20200131, 1, 7, 6),
+    # 9 is-a 8 was retired and 9 is-a 5 added later; rows are not in time order
+    row(10, 20210131, 0, 9, 8),
+    row(10, 20200131, 1, 9, 8),
+    row(11, 20200131, 0, 9, 5),
+    row(11, 20210731, 1, 9, 5),
+    # cycle 11 <-> 12, with 12 -> 3
+    row(12, 20200131, 1, 11, 12),
+    row(13, 20200131, 1, 12, 11),
+    row(14, 20200131, 1, 12, 3),
+]) + "\n"
+
+MAPPED = {1, 3, 5, 8}
+
+CLOSURE = {
+    2: [1], 3: [1], 4: [1, 3], 5: [1], 6: [1], 7: [1, 5], 9: [1, 5], 11: [1, 3], 12: [1, 3],
+}
+
+@pytest.fixture
+def relationship_file(tmp_path):
+    path = tmp_path / "sct2_Relationship_Full_INT.txt"
+    path.write_text(RELATIONSHIPS)
+    return str(path)
+
+def test_read_is_a_relationships_keeps_the_latest_active_edges(relationship_file):
+    assert snomed_hierarchy.read_is_a_relationships(relationship_file) == {
+        2: {1}, 3: {2}, 4: {3}, 5: {1}, 6: {1}, 7: {5, 6}, 9: {5}, 11: {12}, 12: {11, 3},
+    }
+
+def test_mapped_ancestor_closure_follows_chains_diamonds_and_cycles(relationship_file):
+    parents = snomed_hierarchy.read_is_a_relationships(relationship_file)
+    assert snomed_hierarchy.mapped_ancestor_closure(parents, MAPPED) == CLOSURE
+
+def test_unmapped_hierarchy_has_an_empty_closure(relationship_file):
+    parents = snomed_hierarchy.read_is_a_relationships(relationship_file)
+    assert snomed_hierarchy.mapped_ancestor_closure(parents, {99}) == {}
+
+def test_written_hierarchy_reads_back(tmp_path):
+    path = str(tmp_path / "snomed_hierarchy.idx")
+    assert snomed_hierarchy.write_hierarchy(path, CLOSURE) == len(CLOSURE)
+
+    index = snomed_hierarchy.SnomedHierarchyIndex(path)
+    assert len(index) == len(CLOSURE)
+    for concept, ancestors in CLOSURE.items():
+        assert index.mapped_ancestors(concept) == ancestors
+    assert index.mapped_ancestors("7") == [1, 5]
+    assert index.mapped_ancestors(1) == []
+    assert index.mapped_ancestors(100) == []
+
+    other = str(tmp_path / "other.idx")
+    snomed_hierarchy.write_hierarchy(other, {**CLOSURE, 4: [1]})
+    assert snomed_hierarchy.SnomedHierarchyIndex(other).version != index.version
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "snomed_cdsi.idx"
+    path.write_bytes(b"SCDX" + bytes(60))
+    with pytest.raises(ValueError, match="not a SNOMED hierarchy index"):
+        snomed_hierarchy.SnomedHierarchyIndex(str(path))
+
+def test_build_hierarchy_compiles_the_mapped_closure(tmp_path, relationship_file, monkeypatch):
+    csv_path = tmp_path / "coded_observations.csv"
+    csv_path.write_text("Observation Code,Observation Title,SNOMED (Code)\n"
+                        + "".join(f"{i:03d},Title {code},Concept {code} ({code})\n" for i, code in enumerate(sorted(MAPPED)))
+                        + "099,Unmapped,\n")
+    output = str(tmp_path / "snomed_hierarchy.idx")
+    monkeypatch.setattr(sys, "argv", ["build_hierarchy.py", relationship_file, str(csv_path), "--output", output])
+
+    build_hierarchy.main()
+
+    index = snomed_hierarchy.SnomedHierarchyIndex(output)
+    assert {concept: index.mapped_ancestors(concept) for concept in range(1, 13) if index.mapped_ancestors(concept)} == CLOSURE
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+
+import pytest
+
+from conftest import ROOT, load_lambda_modules
+
+logic, aws_clients, snomed_index, coded_observations = load_lambda_modules(
+    "SNOMED_to_CDSi", "snomed_to_cdsi_logic", "aws_clients", "snomed_index", "coded_observations",
+    extra_paths=[os.path.join(ROOT, "SNOMED_to_CDSi", "one_time_parser")])
+
+CODED_OBSERVATIONS_CSV = """Observation Code,Observation Title,SNOMED (Code)
+002,Asthma,Asthma (disorder) (195967001)
+007,Diabetes,Diabetes mellitus type 2 (disorder) (44054006)
+008,Chronic kidney disease,Chronic kidney disease stage 3 (disorder) (433144002)
+045,Chronic lung disease,Asthma (disorder) (195967001)
+046,Chronic liver disease,
+059,Hypertension,Essential hypertension (disorder) (59621000)
+ABC,Not a numeric code,Anemia (disorder) (271737000)
+"""
+
+class LocalDynamoDB:
+    """The mapping table as main.py writes it, answering the lambdas' `query`."""
+
+    def __init__(self, mappings):
+        self.items = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+        for mapping in mappings:
+            self.items.setdefault(mapping["snomed_code"], []).append({
+                "snomed_code": {"N": str(mapping["snomed_code"])},
+                "cdsi_code": {"N": str(mapping["cdsi_code"])},
+                "snomed_description": {"S": mapping["snomed_description"]},
+                "observation_title": {"S": mapping["observation_title"]},
+            })
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        with self._lock:
+            self.calls += 1
+        return {"Items": self.items.get(int(ExpressionAttributeValues[":snomed_code"]["N"]), [])}
+
+@pytest.fixture
+def backends(tmp_path, monkeypatch):
+    csv_path = tmp_path / "coded_observations.csv"
+    csv_path.write_text(CODED_OBSERVATIONS_CSV)
+    mappings = list(coded_observations.iter_snomed_mappings(str(csv_path)))
+    index_path = str(tmp_path / "snomed_cdsi.idx")
+    snomed_index.write_index(index_path, mappings)
+
+    table = LocalDynamoDB(mappings)
+    aws_clients.set_client("dynamodb", table)
+    monkeypatch.setattr(logic, "INDEX_PATH", index_path)
+    monkeypatch.setattr(logic, "_index", None)
+    monkeypatch.setattr(logic, "_key_filter", None)
+    monkeypatch.setattr(logic, "_key_filter_loaded", True)
+    monkeypatch.setattr(logic, "HIERARCHY_EXPANSION", False)
+    monkeypatch.setattr(logic, "get_mapping_table", lambda: "snomed-to-cdsi")
+    return mappings, table
+
+def cdsi_dict(monkeypatch, backend, snomed_codes):
+    monkeypatch.setattr(logic, "LOOKUP_BACKEND", backend)
+    return json.dumps(logic.snomed_set_with_cdsi_codes(set(snomed_codes)), sort_keys=True)
+
+def test_index_and_dynamodb_return_identical_cdsi_dicts(backends, monkeypatch):
+    mappings, table = backends
+    # Every mapped code, plus unmapped ones that must come back empty from both
+    snomed_codes = {mapping["snomed_code"] for mapping in mappings} | {1, 2, 271737000}
+
+    from_index = cdsi_dict(monkeypatch, "index", snomed_codes)
+    assert table.calls == 0
+    from_table = cdsi_dict(monkeypatch, "dynamodb", snomed_codes)
+    assert table.calls == len(snomed_codes)
+    assert from_index == from_table
+
+def test_parity_holds_for_every_single_code(backends, monkeypatch):
+    mappings, _ = backends
+    for snomed_code in {mapping["snomed_code"] for mapping in mappings}:
+        assert cdsi_dict(monkeypatch, "index", [snomed_code]) == cdsi_dict(monkeypatch, "dynamodb", [snomed_code])
+
+def test_index_keeps_every_row_of_a_shared_snomed_code(backends):
+    mappings, _ = backends
+    index = snomed_index.SnomedCdsiIndex(logic.INDEX_PATH)
+    assert len(index) == len({mapping["snomed_code"] for mapping in mappings})
+    assert sorted(row["cdsi_code"] for row in index.lookup(195967001)) == [2, 45]
+    assert index.lookup(271737000) == []
+
+def test_missing_index_names_the_build_command(tmp_path, monkeypatch):
+    monkeypatch.setattr(logic, "INDEX_PATH", str(tmp_path / "missing.idx"))
+    monkeypatch.setattr(logic, "_index", None)
+    with pytest.raises(FileNotFoundError, match="build_index.py"):
+        logic.get_index()
+
+def test_ancestor_match_keeps_the_child_code_and_reports_the_ancestor():
+    rows_by_code = {73211009: [{"cdsi_code": 7, "snomed_description": "Diabetes mellitus (disorder)",
+                                "observation_title": "Diabetes"}]}
+    cdsi = logic.build_cdsi_dict({44054006}, rows_by_code, {44054006: [73211009]})
+    assert cdsi[7]["snomed_references"] == [{
+        "snomed_code": 44054006,
+        "snomed_description": None,
+        "matched_via": {"snomed_code": 73211009, "snomed_description": "Diabetes mellitus (disorder)"},
+    }]
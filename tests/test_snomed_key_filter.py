@@ -0,0 +1,67 @@
+import pytest
+
+from conftest import load_lambda_modules
+
+snomed_key_filter, logic = load_lambda_modules("SNOMED_to_CDSi", "snomed_key_filter", "snomed_to_cdsi_logic")
+
+MAPPED = [195967001, 44054006, 59621000, 433144002]
+
+@pytest.fixture
+def filter_path(tmp_path):
+    path = str(tmp_path / "snomed_keys.bin")
+    assert snomed_key_filter.write_key_filter(path, MAPPED + ["195967001"]) == len(MAPPED)
+    return path
+
+def test_written_filter_reads_back(filter_path):
+    assert snomed_key_filter.load_key_filter(filter_path) == frozenset(MAPPED)
+
+def test_empty_filter_reads_back(tmp_path):
+    path = str(tmp_path / "empty.bin")
+    assert snomed_key_filter.write_key_filter(path, []) == 0
+    assert snomed_key_filter.load_key_filter(path) == frozenset()
+
+@pytest.mark.parametrize("damage, message", [
+    (lambda data: data[:10], "truncated"),
+    (lambda data: data[:-8], "corrupt"),
+    (lambda data: data + bytes(8), "corrupt"),
+    (lambda data: data[:-1] + bytes([data[-1] ^ 1]), "checksum mismatch"),
+    (lambda data: b"SCHX" + data[4:], "not a SNOMED key filter"),
+], ids=["short-header", "missing-key", "extra-bytes", "flipped-bit", "other-magic"])
+def test_damaged_filters_are_rejected(filter_path, damage, message):
+    with open(filter_path, "rb") as f:
+        data = f.read()
+    with open(filter_path, "wb") as f:
+        f.write(damage(data))
+    with pytest.raises(ValueError, match=message):
+        snomed_key_filter.load_key_filter(filter_path)
+
+@pytest.fixture
+def looked_up(monkeypatch):
+    requested = []
+
+    class Index:
+        def lookup_many(self, codes):
+            requested.append(set(codes))
+            return {code: [{"cdsi_code": 2}] for code in codes}
+
+    monkeypatch.setattr(logic, "LOOKUP_BACKEND", "index")
+    monkeypatch.setattr(logic, "get_index", Index)
+    monkeypatch.setattr(logic, "LOOKUP_STATS", {"looked_up": 0, "skipped": 0})
+    monkeypatch.setattr(logic, "_key_filter", None)
+    monkeypatch.setattr(logic, "_key_filter_loaded", False)
+    return requested
+
+def test_lookup_skips_unmapped_codes(filter_path, looked_up, monkeypatch):
+    monkeypatch.setattr(logic, "KEY_FILTER_PATH", filter_path)
+
+    assert logic.lookup_snomed_codes(["195967001", 271737000, 22298006]) == {195967001: [{"cdsi_code": 2}]}
+    assert logic.lookup_snomed_codes([271737000]) == {}
+    assert looked_up == [{195967001}]
+    assert logic.LOOKUP_STATS == {"looked_up": 1, "skipped": 3}
+
+def test_lookup_without_a_filter_looks_up_every_code(tmp_path, looked_up, monkeypatch):
+    monkeypatch.setattr(logic, "KEY_FILTER_PATH", str(tmp_path / "missing.bin"))
+
+    logic.lookup_snomed_codes([195967001, 271737000])
+    assert looked_up == [{195967001, 271737000}]
+    assert logic.LOOKUP_STATS == {"looked_up": 2, "skipped": 0}
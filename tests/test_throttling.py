@@ -0,0 +1,116 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from conftest import load_lambda_modules
+
+throttling, aws_clients = load_lambda_modules("llm_l1_classification", "throttling", "aws_clients")
+
+def throttle():
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}}, "InvokeModel")
+
+class ThrottlingModel:
+    """Throttles the first `throttles` calls, then answers; the stream is a list of events."""
+
+    def __init__(self, throttles=0, events=("a", "b")):
+        self.throttles = throttles
+        self.events = list(events)
+        self.calls = 0
+
+    def invoke_model(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.throttles:
+            raise throttle()
+        return {"body": b"{}"}
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        self.invoke_model()
+        return {"body": iter(self.events)}
+
+class Context:
+    def __init__(self, remaining_seconds):
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.remaining_seconds * 1000)
+
+@pytest.fixture
+def model(request):
+    model = ThrottlingModel(**getattr(request, "param", {}))
+    aws_clients.set_client("bedrock-runtime", model)
+    return model
+
+def wrapper(**kwargs):
+    settings = dict(max_concurrency=2, max_attempts=4, base_delay=0.001, max_delay=0.001)
+    settings.update(kwargs)
+    return throttling.ThrottledClient("bedrock-runtime", ("invoke_model", "invoke_model_with_response_stream"),
+                                      **settings)
+
+def test_only_wrapped_clients_turn_off_sdk_retries(monkeypatch):
+    created = []
+    monkeypatch.setattr(aws_clients.boto3, "client", lambda service, region_name=None, config=None: created.append(config))
+    monkeypatch.setattr(aws_clients, "_clients", {})
+    aws_clients.get_client("comprehendmedical")
+    throttling.ThrottledClient("comprehendmedical", ("infer_snomedct",)).client
+    assert created == [None, aws_clients.NO_RETRIES_CONFIG]
+    assert aws_clients.NO_RETRIES_CONFIG.retries == {"total_max_attempts": 1}
+
+@pytest.mark.parametrize("model", [{"throttles": 2}], indirect=True)
+def test_throttles_are_retried(model):
+    client = wrapper()
+    assert client.invoke_model(modelId="m") == {"body": b"{}"}
+    assert model.calls == 3
+    assert client.snapshot()["retries"] == 2
+
+@pytest.mark.parametrize("model", [{"throttles": 10}], indirect=True)
+def test_retries_stop_before_the_deadline(model, monkeypatch):
+    client = wrapper(max_attempts=10, base_delay=5, max_delay=5)
+    monkeypatch.setattr(throttling, "backoff_delay", lambda attempt, base, cap: 5.0)
+    client.set_deadline(Context(remaining_seconds=60), limit_seconds=3)  # a 5 s backoff would overrun it
+
+    start = time.monotonic()
+    with pytest.raises(ClientError) as error:
+        client.invoke_model(modelId="m")
+    assert throttling.is_throttle(error.value)
+    assert time.monotonic() - start < 1
+    assert model.calls == 1
+    assert client.snapshot()["deadline_stops"] == 1
+    assert client.concurrency.in_flight == 0
+
+def test_set_deadline_uses_the_shorter_budget():
+    client = wrapper()
+    client.set_deadline(Context(remaining_seconds=10), limit_seconds=29, reserve_seconds=1)
+    assert 8.5 < client.deadline - time.monotonic() <= 9
+    client.set_deadline(Context(remaining_seconds=120), limit_seconds=29, reserve_seconds=1)
+    assert 27.5 < client.deadline - time.monotonic() <= 28
+    client.set_deadline()
+    assert client.deadline is None
+
+def test_stream_holds_its_slot_until_read(model):
+    client = wrapper(max_concurrency=1)
+    response = client.invoke_model_with_response_stream(modelId="m")
+    assert client.concurrency.in_flight == 1
+    assert list(response["body"]) == ["a", "b"]
+    assert client.concurrency.in_flight == 0
+    assert client.concurrency.limit == 1  # a success at the maximum
+
+def test_stream_failing_mid_read_releases_as_a_throttle(model):
+    def events():
+        yield "a"
+        raise throttle()
+
+    model.events = events()
+    client = wrapper(max_concurrency=4)
+    response = client.invoke_model_with_response_stream(modelId="m")
+    with pytest.raises(ClientError):
+        list(response["body"])
+    assert client.concurrency.in_flight == 0
+    assert client.concurrency.limit == 2
+
+def test_closed_or_dropped_streams_release_their_slot(model):
+    client = wrapper()
+    client.invoke_model_with_response_stream(modelId="m")["body"].close()
+    assert client.concurrency.in_flight == 0
+    client.invoke_model_with_response_stream(modelId="m")  # never read
+    assert client.concurrency.in_flight == 0